@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compare two result files of the benchmark suite
+
+Prints the change of the latency percentiles, the throughput and the error rate of every operation found in both
+files, and exits with status 1 when an operation regressed by more than the threshold: a slower p95 or p99, a
+lower throughput or a higher error rate.
+
+Usage:
+    python compare.py baseline.json current.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+
+LATENCIES = ('p50_ms', 'p95_ms', 'p99_ms')
+# Only the tail latencies are gated, the median of a short run is too noisy
+GATED_LATENCIES = ('p95_ms', 'p99_ms')
+ERROR_RATE_TOLERANCE = 0.001
+
+
+def change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(baseline, current, threshold):
+    """Return the lines of the comparison table and the regressions found."""
+    lines = [f'{"operation":<24} ' + ' '.join(f'{k:>16}' for k in (*LATENCIES, 'req/s', 'errors'))]
+    regressions = []
+    for operation, new in current['operations'].items():
+        old = baseline['operations'].get(operation)
+        if old is None:
+            continue
+        cells = []
+        for key in (*LATENCIES, 'throughput'):
+            delta = change(old[key], new[key])
+            cells.append(f'{new[key]:>8.1f} ({delta:+5.0f}%)' if delta is not None else f'{"-":>16}')
+            if delta is None:
+                continue
+            if key in GATED_LATENCIES and delta > threshold:
+                regressions.append(f'{operation}: {key} {old[key]:.1f} -> {new[key]:.1f} ({delta:+.0f}%)')
+            if key == 'throughput' and -delta > threshold:
+                regressions.append(f'{operation}: throughput {old[key]:.1f} -> {new[key]:.1f} req/s ({delta:+.0f}%)')
+        cells.append(f'{new["error_rate"] * 100:>7.2f}% ({old["error_rate"] * 100:.2f}%)')
+        if new['error_rate'] > old['error_rate'] + ERROR_RATE_TOLERANCE:
+            regressions.append(f'{operation}: error rate {old["error_rate"]:.2%} -> {new["error_rate"]:.2%}')
+        lines.append(f'{operation:<24} ' + ' '.join(cells))
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark suite results.')
+    parser.add_argument('baseline', help='results of the reference commit')
+    parser.add_argument('current', help='results of the commit under test')
+    parser.add_argument('--threshold', type=float, default=10, help='allowed regression, in percent')
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding='utf-8') as baseline, open(args.current, encoding='utf-8') as current:
+        baseline, current = json.load(baseline), json.load(current)
+    if baseline['dataset'] != current['dataset'] or baseline['concurrency'] != current['concurrency']:
+        print('WARNING: the runs used different datasets or concurrency')
+
+    print(f'baseline {baseline["commit"]} ({baseline["date"]}), current {current["commit"]} ({current["date"]})')
+    lines, regressions = compare(baseline, current, args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print(f'\nFAILED: {len(regressions)} regression(s) above {args.threshold:.0f}%')
+        print('\n'.join(regressions))
+        sys.exit(1)
+    print('\nOK: no regression above the threshold')
+
+
+if __name__ == '__main__':
+    main()
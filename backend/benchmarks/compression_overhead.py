@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Compression micro-benchmark for the Inventory Service API
+
+Measures, for the product list, the restock history and the stock trend analytics, the size saved and the CPU time
+spent by each encoder of response_compression.py at several levels, on the whole body and on the body streamed in
+chunks (each chunk is flushed, which costs some of the ratio). It imports the service code, so it needs the service
+requirements (`pip install -r ../requirements.txt`), and brotli and zstandard for those encodings, but no running
+service or database.
+
+Usage:
+    python compression_overhead.py [--products 1000] [--repeat 20]
+"""
+import argparse
+import functools
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+# pylint: disable=C0413,E0401
+import response_compression  # noqa: E402
+import serialization  # noqa: E402
+
+ENCODERS = {
+    'gzip': response_compression.GzipEncoder,
+    'br': response_compression.BrotliEncoder,
+    'zstd': response_compression.ZstdEncoder,
+}
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 11), 'zstd': (1, 3, 19)}  # Fastest, default of the service, smallest
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def make_documents(count):
+    """Bodies shaped like the responses of GET /api/products, /api/restocks and /api/products/analytics."""
+    now = datetime.utcnow()
+    rng = random.Random(0)
+    products = [
+        {
+            'id': i,
+            'uuid': f'00000000-0000-4000-8000-{i:012d}',
+            'name': f'Product {i}',
+            'sku': f'SKU-{i:06d}',
+            'description': 'A product used by the compression benchmark',
+            'quantity': rng.randint(0, 200),
+            'price': round(rng.uniform(1, 500), 2),
+            'created_at': now - timedelta(days=1, seconds=i),
+            'updated_at': now,
+        }
+        for i in range(count)
+    ]
+    restocks = [
+        {'id': i, 'product_id': i % count, 'quantity': rng.randint(1, 50), 'reason': 'Weekly delivery',
+         'restocked_at': (now - timedelta(minutes=i)).isoformat()}
+        for i in range(count * 10)
+    ]
+    trend = [
+        {'product_id': i, 'product_name': f'Product {i}',
+         'data': [{'date': (now - timedelta(days=day)).strftime('%Y-%m-%d'), 'quantity': rng.randint(0, 200)}
+                  for day in range(30)]}
+        for i in range(count)
+    ]
+    return {'products': serialization.dumps(products), 'restocks': serialization.dumps(restocks),
+            'analytics': serialization.dumps(trend)}
+
+
+def encode(encoder_class, level, body, streamed):
+    encoder = encoder_class(level)
+    if not streamed:
+        return encoder.finish(body)
+    chunks = [body[i:i + STREAM_CHUNK_BYTES] for i in range(0, len(body), STREAM_CHUNK_BYTES)]
+    return b''.join([encoder.compress(chunk) for chunk in chunks] + [encoder.finish(b'')])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compression micro-benchmark.')
+    parser.add_argument('--products', type=int, default=1000, help='number of products (10 restocks each)')
+    parser.add_argument('--repeat', type=int, default=20, help='number of timed runs of each case')
+    args = parser.parse_args()
+
+    documents = make_documents(args.products)
+    available = {'gzip': True, 'br': response_compression.brotli, 'zstd': response_compression.zstandard}
+    print(f'{"document":10} {"encoding":10} {"mode":9} {"KB":>8} {"ratio":>7} {"saved":>7} {"ms":>8} {"MB/s":>8}')
+    for document, body in documents.items():
+        print(f'{document:10} {"identity":10} {"-":9} {len(body) / 1024:>8.0f}')
+        for name, encoder_class in ENCODERS.items():
+            if not available[name]:
+                print(f'{document:10} {name:10} skipped, the package is not installed')
+                continue
+            for level in LEVELS[name]:
+                for streamed in (False, True):
+                    case = functools.partial(encode, encoder_class, level, body, streamed)
+                    size = len(case())
+                    seconds = min(timeit.repeat(case, number=1, repeat=args.repeat))
+                    mode = 'streamed' if streamed else 'whole'
+                    print(f'{document:10} {f"{name}-{level}":10} {mode:9} {size / 1024:>8.0f} '
+                          f'{len(body) / size:>7.1f} {1 - size / len(body):>7.1%} {seconds * 1000:>8.2f} '
+                          f'{len(body) / seconds / 1e6:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
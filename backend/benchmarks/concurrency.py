@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the Inventory Service API
+
+Keeps a large number of requests in flight at once (far more than a thread per request would allow) and reports
+how many completed, the request rate and the latency percentiles. Run it against APP_MODE=sync and APP_MODE=async
+to compare how many concurrent requests one process holds. It needs httpx (`pip install httpx`).
+
+Usage:
+    python concurrency.py --base-url http://localhost:8085 [--path /api/products?limit=20] [--concurrency 1000]
+                          [--duration 30]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+REQUEST_TIMEOUT = 60
+
+
+async def client(http, url, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await http.get(url)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(1)
+
+
+def percentile(values, pct):
+    return statistics.quantiles(values, n=100)[pct - 1] if len(values) > 1 else values[0]
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT) as http:
+        url = f'{args.base_url}{args.path}'
+        latencies, errors = [], []
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http, url, start + args.duration, latencies, errors)
+                               for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrency benchmark.')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='base URL of the service')
+    parser.add_argument('--path', default='/api/products?limit=20', help='endpoint to load')
+    parser.add_argument('--concurrency', type=int, default=1000, help='number of requests kept in flight')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to keep the load')
+    args = parser.parse_args()
+
+    latencies, errors, elapsed = asyncio.run(run(args))
+    print(f'endpoint:    GET {args.path} with {args.concurrency} requests in flight for {args.duration:.0f} s')
+    print(f'requests:    {len(latencies)} succeeded, {len(errors)} failed')
+    if latencies:
+        latencies.sort()
+        print(f'throughput:  {len(latencies) / elapsed:.1f} req/s')
+        print(f'latency:     p50 {percentile(latencies, 50) * 1000:.0f} ms, '
+              f'p95 {percentile(latencies, 95) * 1000:.0f} ms, p99 {percentile(latencies, 99) * 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Logging micro-benchmark for the Inventory Service API
+
+Measures what a logging call costs the thread that makes it, as a request thread of the service does, with the
+previous configuration (console and rotating file handlers called on that thread) and with the queue pipeline of
+my_config/logging_config.py, with and without its rate limit. The log file is small enough to rotate during the
+run, to show the stalls of the rotation. It imports the service code, so it needs the service requirements
+(`pip install -r ../requirements.txt`) but no running service or database.
+
+Usage:
+    python logging_overhead.py [--threads 10] [--records 10000] [--interval 0.001] [--max-bytes 1048576]
+"""
+import argparse
+import logging
+import logging.config
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+# The settings need a database configuration, which is not used here
+for variable in ('POSTGRES_HOST', 'POSTGRES_USER', 'POSTGRES_PASSWORD', 'POSTGRES_DB'):
+    os.environ.setdefault(variable, 'benchmark')
+os.environ.setdefault('POSTGRES_PORT', '5432')
+
+# pylint: disable=C0413,E0401
+from my_config import logging_config  # noqa: E402
+
+
+def previous_config(path, max_bytes):
+    """The configuration before the queue pipeline: the handlers write on the thread of the logging call."""
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {'standard': {'format': logging_config.TEXT_FORMAT}},
+        'handlers': {
+            'console': {'level': 'INFO', 'class': 'logging.StreamHandler', 'formatter': 'standard',
+                        'stream': 'ext://sys.stdout'},
+            'file': {'level': 'INFO', 'class': 'logging.handlers.RotatingFileHandler', 'formatter': 'standard',
+                     'filename': path, 'maxBytes': max_bytes, 'backupCount': 5},
+        },
+        'loggers': {'': {'handlers': ['console', 'file'], 'level': 'INFO'}},
+    }
+
+
+def log_records(count, interval):
+    """Log like the restock controller every `interval` seconds, returning the duration of every call."""
+    log = logging.getLogger('controllers.restock')
+    durations = []
+    for i in range(count):
+        start = time.perf_counter()
+        log.info('Product %s restocked by %d units. New quantity: %d', i, 5, i + 5)
+        durations.append(time.perf_counter() - start)
+        if interval:
+            time.sleep(interval)
+    return durations
+
+
+def run_case(config, threads, records, interval):
+    """Configure logging, log from `threads` threads, then shut the handlers down.
+
+    Returns the durations of the calls and the time taken to write the records still queued.
+    """
+    logging.config.dictConfig(config)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        durations = [d for result in executor.map(log_records, [records] * threads, [interval] * threads)
+                     for d in result]
+    start = time.perf_counter()
+    logging.config.dictConfig({'version': 1, 'disable_existing_loggers': False})  # Closes the handlers
+    return durations, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Logging micro-benchmark.')
+    parser.add_argument('--threads', type=int, default=10, help='number of threads logging at once')
+    parser.add_argument('--records', type=int, default=10000, help='number of records logged by each thread')
+    parser.add_argument('--interval', type=float, default=0.001,
+                        help='seconds each thread waits between two records, 0 to log in a tight loop')
+    parser.add_argument('--max-bytes', type=int, default=1048576, help='size at which the log file rotates')
+    args = parser.parse_args()
+
+    output = sys.stdout
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w', encoding='utf-8') as devnull:
+        path = os.path.join(directory, 'app.log')
+        os.environ['LOG_FILE'] = path
+        # The queue pipeline rotates at its own size, use the same one
+        logging_config.LOG_FILE_MAX_BYTES = args.max_bytes
+        cases = {
+            'previous (handlers on the thread)': (previous_config(path, args.max_bytes), {}),
+            'queue, json, no rate limit': (logging_config.LOGGING_CONFIG, {'LOG_RATE_LIMIT': '0'}),
+            'queue, json, rate limited': (logging_config.LOGGING_CONFIG, {'LOG_RATE_LIMIT': '100'}),
+            'queue, text, no rate limit': (logging_config.LOGGING_CONFIG,
+                                           {'LOG_RATE_LIMIT': '0', 'LOG_FORMAT': 'text'}),
+        }
+        print(f'{"case":36} {"mean us":>9} {"p99 us":>9} {"max ms":>9} {"flush ms":>9}', file=output)
+        for name, (config, environ) in cases.items():
+            os.environ.update(environ)
+            sys.stdout = devnull  # The console handler writes to the standard output
+            try:
+                durations, flush = run_case(config, args.threads, args.records, args.interval)
+            finally:
+                sys.stdout = output
+                for key in environ:
+                    del os.environ[key]
+            durations.sort()
+            print(f'{name:36} {statistics.mean(durations) * 1e6:>9.1f} '
+                  f'{durations[int(len(durations) * 0.99)] * 1e6:>9.1f} {durations[-1] * 1e3:>9.2f} '
+                  f'{flush * 1e3:>9.1f}', file=output)
+    print(f'{args.threads} threads x {args.records} records, {threading.active_count()} threads left', file=output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Product deletion benchmark for the Inventory Service API
+
+Creates products with a growing number of restock logs and times their deletion. With a per-row
+delete the time grows with the number of logs (one DELETE and one commit each). With a set-based
+delete it stays close to a single statement.
+
+Usage:
+    python product_delete.py --base-url http://localhost:8085 [--sizes 0 1000 10000 50000]
+"""
+import argparse
+import time
+import uuid
+
+import requests
+
+REQUEST_TIMEOUT = 600
+BATCH_SIZE = 1000
+
+
+def create_product_with_logs(base_url, logs):
+    product = {'name': 'Delete Product', 'sku': f'BENCH-{uuid.uuid4()}', 'quantity': 0, 'price': 1.0}
+    response = requests.post(f'{base_url}/api/products', json=product, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    product_id = response.json()['id']
+    for start in range(0, logs, BATCH_SIZE):
+        batch = [{'product_id': product_id, 'quantity': 1} for _ in range(min(BATCH_SIZE, logs - start))]
+        requests.post(f'{base_url}/api/restocks/batch', json=batch, timeout=REQUEST_TIMEOUT).raise_for_status()
+    return product_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Product deletion benchmark.')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='base URL of the service')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 1000, 10000, 50000],
+                        help='numbers of restock logs of the deleted products')
+    args = parser.parse_args()
+
+    print(f'{"restock logs":>12}  {"delete time":>12}')
+    for size in args.sizes:
+        product_id = create_product_with_logs(args.base_url, size)
+        start = time.perf_counter()
+        response = requests.delete(f'{args.base_url}/api/products/{product_id}', timeout=REQUEST_TIMEOUT)
+        elapsed = time.perf_counter() - start
+        response.raise_for_status()
+        print(f'{size:>12}  {elapsed * 1000:>9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Serialization micro-benchmark for the Inventory Service API
+
+Measures, per 1000 products, the cost of encoding a product list with each JSON encoder and of validating it
+against the response schema of GET /api/products. It imports the service code, so it needs the service
+requirements (`pip install -r ../requirements.txt`) but no running service or database.
+
+Usage:
+    python response_serialization.py [--products 1000] [--repeat 50]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+# pylint: disable=C0413,E0401
+import flask  # noqa: E402
+from connexion.jsonifier import Jsonifier  # noqa: E402
+from connexion.frameworks.flask import FlaskJSONProvider  # noqa: E402
+from connexion.json_schema import Draft4ResponseValidator  # noqa: E402
+from connexion.spec import Specification  # noqa: E402
+from jsonschema import Draft4Validator  # noqa: E402
+
+import serialization  # noqa: E402
+
+
+def make_products(count):
+    now = datetime.utcnow()
+    return [
+        {
+            'id': i,
+            'uuid': f'00000000-0000-4000-8000-{i:012d}',
+            'name': f'Product {i}',
+            'sku': f'SKU-{i:06d}',
+            'description': 'A product used by the serialization benchmark',
+            'quantity': i % 100,
+            'price': 9.99,
+            'created_at': now - timedelta(days=1, seconds=i),
+            'updated_at': now,
+        }
+        for i in range(count)
+    ]
+
+
+def products_schema():
+    spec = Specification.load(os.path.join(SRC_DIR, 'inventory.yaml'))
+    return spec['paths']['/api/products']['get']['responses']['200']['content']['application/json']['schema']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serialization micro-benchmark.')
+    parser.add_argument('--products', type=int, default=1000, help='number of products in the list')
+    parser.add_argument('--repeat', type=int, default=50, help='number of timed runs of each case')
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    app = flask.Flask(__name__)
+    app.json = FlaskJSONProvider(app)
+    default_jsonifier = Jsonifier(flask.json, indent=2)  # What connexion uses unless told otherwise
+    orjson_jsonifier = serialization.OrjsonJsonifier()
+    validator = Draft4ResponseValidator(products_schema(), format_checker=Draft4Validator.FORMAT_CHECKER)
+    document = serialization.dumps(products)
+
+    with app.app_context():
+        cases = {
+            'json (connexion default, indented)': lambda: default_jsonifier.dumps(products),
+            'json (compact)': lambda: default_jsonifier.dumps(products, indent=None),
+            'orjson': lambda: orjson_jsonifier.dumps(products),
+            'response validation (parse + validate)': lambda: validator.validate(json.loads(document)),
+        }
+        sizes = {
+            'json (connexion default, indented)': len(default_jsonifier.dumps(products).encode()),
+            'json (compact)': len(default_jsonifier.dumps(products, indent=None).encode()),
+            'orjson': len(orjson_jsonifier.dumps(products)),
+        }
+        print(f'{"case":42} {"ms per 1k products":>20} {"bytes per product":>18}')
+        for name, case in cases.items():
+            seconds = min(timeit.repeat(case, number=1, repeat=args.repeat))
+            per_1k = seconds * 1000 * 1000 / args.products
+            size = f'{sizes[name] / args.products:.0f}' if name in sizes else '-'
+            print(f'{name:42} {per_1k:>20.2f} {size:>18}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Restock contention benchmark for the Inventory Service API
+
+Fires many concurrent restocks of one unit at a single product and checks that no increment was lost:
+the final quantity and the number of restock logs must both match the number of requests.
+
+Usage:
+    python restock_contention.py --base-url http://localhost:8085 [--requests 1000] [--concurrency 32]
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+REQUEST_TIMEOUT = 30
+
+
+def restock(session, base_url, product_id):
+    url = f'{base_url}/api/products/{product_id}/restock'
+    return session.post(url, json={'quantity': 1, 'reason': 'contention benchmark'}, timeout=REQUEST_TIMEOUT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent restock benchmark.')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='base URL of the service')
+    parser.add_argument('--requests', type=int, default=1000, help='number of restock requests')
+    parser.add_argument('--concurrency', type=int, default=32, help='number of parallel clients')
+    args = parser.parse_args()
+
+    product = {'name': 'Contention Product', 'sku': f'BENCH-{uuid.uuid4()}', 'quantity': 0, 'price': 1.0}
+    response = requests.post(f'{args.base_url}/api/products', json=product, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    product_id = response.json()['id']
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        responses = list(executor.map(lambda _: restock(session, args.base_url, product_id), range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(1 for r in responses if r.status_code == 200)
+    quantity = requests.get(f'{args.base_url}/api/products/{product_id}', timeout=REQUEST_TIMEOUT).json()['quantity']
+    logs = requests.get(f'{args.base_url}/api/products/{product_id}/restocks',
+                        headers={'Accept': 'application/x-ndjson'}, timeout=REQUEST_TIMEOUT).text.splitlines()
+    logged = sum(1 for line in logs if json.loads(line)['product_id'] == product_id)
+    requests.delete(f'{args.base_url}/api/products/{product_id}', timeout=REQUEST_TIMEOUT)
+
+    print(f'requests:    {args.requests} ({succeeded} succeeded) with concurrency {args.concurrency}')
+    print(f'elapsed:     {elapsed:.2f} s ({args.requests / elapsed:.1f} req/s)')
+    print(f'quantity:    {quantity} (expected {succeeded})')
+    print(f'restock log: {logged} entries (expected {succeeded})')
+    if quantity != succeeded or logged != succeeded:
+        print('FAILED: increments were lost')
+        sys.exit(1)
+    print('OK: no increment was lost')
+
+
+if __name__ == '__main__':
+    main()
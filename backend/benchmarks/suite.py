@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the Inventory Service API
+
+Seeds a dataset of products, restock logs and users through the API, then loads every operation of
+inventory.yaml in turn with a fixed number of parallel clients and reports the latency percentiles, the
+throughput and the error rate of each one. The results are saved as JSON, to be compared between commits
+with compare.py.
+
+The suite only talks to the running service, so it measures the database the service is configured with, a
+PostgreSQL one: the service does not run on SQLite (partitioned tables, LISTEN/NOTIFY, PostgreSQL specific SQL).
+
+Usage:
+    python suite.py --base-url http://localhost:8085 [--products 1000] [--restocks 10000] [--users 100]
+                    [--duration 10] [--concurrency 16] [--operations product_get_all product_restock ...]
+                    [--output results.json]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+REQUEST_TIMEOUT = 30
+IMPORT_CHUNK = 10_000
+RESTOCK_CHUNK = 1000
+PAGE_LIMIT = 1000
+IMPORT_SETS = 10  # Distinct bodies of the import operation, each of 100 products
+
+
+class Service(requests.Session):
+    """HTTP session on the service, taking paths relative to its base URL."""
+
+    def __init__(self, base_url, pool_size):
+        super().__init__()
+        self.base_url = base_url
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, *args, **kwargs):  # pylint: disable=W0221
+        kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+        return super().request(method, f'{self.base_url}{url}', *args, **kwargs)
+
+
+class Dataset:
+    """Identifiers of the seeded rows, shared by the operations. The created lists feed the delete operations."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.product_ids = []
+        self.user_ids = []
+        self.created_products = []
+        self.created_users = []
+
+    def product_id(self):
+        return random.choice(self.product_ids) if self.product_ids else None
+
+    def user_id(self):
+        return random.choice(self.user_ids) if self.user_ids else None
+
+
+def seed(service, dataset, products, restocks, users):
+    """Create the products with the bulk import, the restock logs with batch restocks and the users one by one."""
+    for start in range(0, products, IMPORT_CHUNK):
+        lines = ''.join(json.dumps({'name': f'Benchmark Product {i}', 'sku': f'{dataset.prefix}-{i}',
+                                    'quantity': i % 100, 'price': 1.0 + i % 50}) + '\n'
+                        for i in range(start, min(start + IMPORT_CHUNK, products)))
+        service.post('/api/products/import', data=lines.encode(),
+                     headers={'Content-Type': 'application/x-ndjson'}).raise_for_status()
+
+    # The import does not return the ids, find them by SKU prefix
+    params = {'limit': PAGE_LIMIT, 'sku_prefix': dataset.prefix}
+    while True:
+        response = service.get('/api/products', params=params)
+        response.raise_for_status()
+        dataset.product_ids += [p['id'] for p in response.json()]
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        params['cursor'] = response.headers['X-Next-Cursor']
+
+    for start in range(0, restocks if dataset.product_ids else 0, RESTOCK_CHUNK):
+        items = [{'product_id': dataset.product_id(), 'quantity': 1, 'reason': 'benchmark'}
+                 for _ in range(min(RESTOCK_CHUNK, restocks - start))]
+        service.post('/api/restocks/batch', json=items).raise_for_status()
+
+    for i in range(users):
+        response = service.post('/api/users', json=_user(dataset.prefix, i))
+        response.raise_for_status()
+        dataset.user_ids.append(response.json()['id'])
+
+
+def _user(prefix, i):
+    return {'name': f'Benchmark User {i}', 'email': f'{prefix}-{i}@example.com'.lower()}
+
+
+def _product(prefix, i):
+    return {'name': f'Benchmark Product {i}', 'sku': f'{prefix}-{i}', 'quantity': 10, 'price': 1.0}
+
+
+def _import_body(dataset, i):
+    return ''.join(json.dumps(_product(f'{dataset.prefix}-import-{i}', j)) + '\n' for j in range(100)).encode()
+
+
+def _on(id_, method, path, **kwargs):
+    """Request on the row `id_`, or None to end the run when there is no such row."""
+    return None if id_ is None else (method, path.format(id_), kwargs)
+
+
+def _pop(created):
+    return created.pop() if created else None
+
+
+def _created(ids):
+    """Callback keeping the id of a created row, when the API returns it."""
+    return lambda d, r: ids(d).append(r.json()['id']) if 'id' in r.json() else None
+
+
+# operationId -> (request of the i-th call, callback of a successful response). A request of None ends the run.
+# The reads run first, on the seeded dataset only. Delete operations remove what the matching create operations
+# made, so they run after them, and imports update the same products over and over, to keep the dataset stable.
+OPERATIONS = {
+    'health_status': (lambda d, i: ('GET', '/health', {}), None),
+    'product_get_all': (lambda d, i: ('GET', '/api/products', {'params': {'limit': 100}}), None),
+    'product_get_by_id': (lambda d, i: _on(d.product_id(), 'GET', '/api/products/{}'), None),
+    'get_restock_history': (lambda d, i: ('GET', '/api/restocks', {'params': {'stream': 'true'}}), None),
+    'get_product_restock_history': (lambda d, i: _on(d.product_id(), 'GET', '/api/products/{}/restocks'), None),
+    'get_low_stock_products': (lambda d, i: ('GET', '/api/products/low-stock', {}), None),
+    'get_stock_trend_data': (lambda d, i: ('GET', '/api/products/analytics', {'params': {'days': 30}}), None),
+    'user_get_all': (lambda d, i: ('GET', '/api/users', {'params': {'limit': 100}}), None),
+    'user_get_by_id': (lambda d, i: _on(d.user_id(), 'GET', '/api/users/{}'), None),
+    'product_update': (lambda d, i: _on(d.product_id(), 'PUT', '/api/products/{}', json={'quantity': i % 100}),
+                       None),
+    'product_restock': (lambda d, i: _on(d.product_id(), 'POST', '/api/products/{}/restock',
+                                         json={'quantity': 1, 'reason': 'benchmark'}), None),
+    'restock_batch': (lambda d, i: ('POST', '/api/restocks/batch', {
+        'json': [{'product_id': d.product_id() or 0, 'quantity': 1} for _ in range(100)]}), None),
+    'product_import': (lambda d, i: ('POST', '/api/products/import', {
+        'data': _import_body(d, i % IMPORT_SETS), 'headers': {'Content-Type': 'application/x-ndjson'}}), None),
+    'product_create': (lambda d, i: ('POST', '/api/products', {'json': _product(f'{d.prefix}-create', i)}),
+                       _created(lambda d: d.created_products)),
+    'product_create_batch': (lambda d, i: ('POST', '/api/products/batch', {
+        'json': [_product(f'{d.prefix}-batch-{i}', j) for j in range(100)]}), None),
+    'product_delete': (lambda d, i: _on(_pop(d.created_products), 'DELETE', '/api/products/{}'), None),
+    'user_update': (lambda d, i: _on(d.user_id(), 'PUT', '/api/users/{}', json={'phone': str(i)}), None),
+    'user_create': (lambda d, i: ('POST', '/api/users', {'json': _user(f'{d.prefix}-create', i)}),
+                    _created(lambda d: d.created_users)),
+    'user_delete': (lambda d, i: _on(_pop(d.created_users), 'DELETE', '/api/users/{}'), None),
+}
+
+
+def percentile(values, pct):
+    return statistics.quantiles(values, n=100)[pct - 1] if len(values) > 1 else values[0]
+
+
+def summarize(results, elapsed):
+    """Summary of the (latencies, errors) of every client, over `elapsed` seconds."""
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    total = len(latencies) + errors
+    summary = {
+        'requests': total,
+        'errors': errors,
+        'error_rate': errors / total if total else 0,
+        'throughput': len(latencies) / elapsed,
+    }
+    for pct in (50, 95, 99):
+        summary[f'p{pct}_ms'] = percentile(latencies, pct) * 1000 if latencies else None
+    return summary
+
+
+def run_operation(service, dataset, operation, duration, concurrency):
+    """Load one operation with `concurrency` clients for `duration` seconds and summarize the calls."""
+    build, on_success = OPERATIONS[operation]
+    counter = itertools.count()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(_):
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            with lock:
+                request = build(dataset, next(counter))
+            if request is None:
+                break
+            method, path, kwargs = request
+            start = time.perf_counter()
+            try:
+                response = service.request(method, path, **kwargs)
+                ok = response.ok
+            except requests.RequestException:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+                if on_success:
+                    on_success(dataset, response)
+            else:
+                errors += 1
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client, range(concurrency)))
+    return summarize(results, time.perf_counter() - start)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every operation of the API.')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='base URL of the service')
+    parser.add_argument('--products', type=int, default=1000, help='number of products to seed')
+    parser.add_argument('--restocks', type=int, default=10000, help='number of restock logs to seed')
+    parser.add_argument('--users', type=int, default=100, help='number of users to seed')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to load each operation')
+    parser.add_argument('--concurrency', type=int, default=16, help='number of parallel clients')
+    parser.add_argument('--operations', nargs='+', choices=OPERATIONS, default=list(OPERATIONS),
+                        help='operationIds to run (default: all)')
+    parser.add_argument('--output', help='file to save the results to, as JSON')
+    args = parser.parse_args()
+
+    service = Service(args.base_url, args.concurrency)
+    dataset = Dataset(f'BENCH-{uuid.uuid4()}')
+    print(f'seeding {args.products} products, {args.restocks} restock logs and {args.users} users...')
+    seed(service, dataset, args.products, args.restocks, args.users)
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'base_url': args.base_url,
+        'dataset': {'products': args.products, 'restocks': args.restocks, 'users': args.users},
+        'duration': args.duration,
+        'concurrency': args.concurrency,
+        'operations': {},
+    }
+    print(f'{"operation":<24} {"requests":>9} {"errors":>7} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    # Keep the order of OPERATIONS, see above
+    for operation in (op for op in OPERATIONS if op in args.operations):
+        summary = run_operation(service, dataset, operation, args.duration, args.concurrency)
+        if not summary['requests']:
+            print(f'{operation:<24} skipped, no row to run it on')
+            continue
+        results['operations'][operation] = summary
+        print(f'{operation:<24} {summary["requests"]:>9} {summary["errors"]:>7} {summary["throughput"]:>8.1f} '
+              + ' '.join(f'{summary[k]:>8.1f}' if summary[k] is not None else f'{"-":>8}'
+                         for k in ('p50_ms', 'p95_ms', 'p99_ms')))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=2)
+        print(f'results saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the Inventory Service API
+
+Keeps a fixed number of clients sending requests to one endpoint for a given duration and reports the request
+rate and the latency percentiles. Run it against each server mode to compare them.
+
+Usage:
+    python throughput.py --base-url http://localhost:8085 [--path /api/products?limit=20] [--duration 30]
+                         [--concurrency 32] [--seed 200]
+"""
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+REQUEST_TIMEOUT = 30
+
+
+def seed_products(base_url, count):
+    prefix = f'THROUGHPUT-{uuid.uuid4()}'
+    for i in range(count):
+        product = {'name': f'Throughput Product {i}', 'sku': f'{prefix}-{i}', 'quantity': i, 'price': 1.0}
+        requests.post(f'{base_url}/api/products', json=product, timeout=REQUEST_TIMEOUT).raise_for_status()
+
+
+def client(session, url, deadline):
+    latencies = []
+    errors = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=REQUEST_TIMEOUT)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    return latencies, errors
+
+
+def percentile(values, pct):
+    return statistics.quantiles(values, n=100)[pct - 1] if len(values) > 1 else values[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput benchmark.')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='base URL of the service')
+    parser.add_argument('--path', default='/api/products?limit=20', help='endpoint to load')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to keep the load')
+    parser.add_argument('--concurrency', type=int, default=32, help='number of parallel clients')
+    parser.add_argument('--seed', type=int, default=0, help='number of products to create before the run')
+    args = parser.parse_args()
+
+    seed_products(args.base_url, args.seed)
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    url = f'{args.base_url}{args.path}'
+    client(session, url, time.perf_counter() + 1)  # Warm up
+
+    barrier = threading.Barrier(args.concurrency)
+
+    def run(_):
+        barrier.wait()
+        return client(session, url, start + args.duration)
+
+    start = time.perf_counter() + 0.5
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(run, range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    if not latencies:
+        print('FAILED: no request succeeded')
+        return
+    print(f'endpoint:    GET {args.path} with concurrency {args.concurrency} for {args.duration:.0f} s')
+    print(f'requests:    {len(latencies)} succeeded, {errors} failed')
+    print(f'throughput:  {len(latencies) / elapsed:.1f} req/s')
+    print(f'latency:     p50 {percentile(latencies, 50) * 1000:.1f} ms, p95 {percentile(latencies, 95) * 1000:.1f} ms, '
+          f'p99 {percentile(latencies, 99) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,49 +3,150 @@
 Main application entry point for User Service API
 """
 import os
+import functools
 import logging
 import logging.config
+from contextlib import asynccontextmanager
+
 import connexion
+from a2wsgi import WSGIMiddleware
+from connexion.middleware import ConnexionMiddleware, MiddlewarePosition
 from flask_cors import CORS
 from prometheus_flask_exporter import ConnexionPrometheusMetrics
+from starlette.middleware.cors import CORSMiddleware
 
+import profiling
+import response_compression
+import serialization
+import validators
+from my_config.config import Config
 from my_config.logging_config import LOGGING_CONFIG
-from db.database import db_session, init_db
+from db.database import db_session
+from db.query_metrics import QueryMetricsMiddleware
 from controllers.general import redirect_blueprint
+from controllers.stream import STREAM_PATHS, DisconnectMiddleware
+from controllers.tools import ETAG_HEADER, NEXT_CURSOR_HEADER
 
-# Create Connexion application instance
-connex_app = connexion.FlaskApp(__name__, specification_dir='./')
+settings = Config.get_settings()
 
-# Add API definition
-connex_app.add_api('./inventory.yaml', name='inventory', validate_responses=True, pythonic_params=True)
-# connex_app.add_api('./user-service.yaml', name='users', validate_responses=True, pythonic_params=True)
+# Select the JSON encoder of the API responses
+jsonifier = serialization.OrjsonJsonifier() if settings.JSON_ENCODER == 'orjson' else None
+api_options = {
+    'name': 'inventory',
+    'pythonic_params': True,
+    'jsonifier': jsonifier,
+    'validate_responses': settings.RESPONSE_VALIDATION != 'off',
+    'validator_map': validators.build_validator_map(
+        settings.RESPONSE_VALIDATION_SAMPLE_RATE if settings.RESPONSE_VALIDATION == 'sampled' else 1),
+}
 
-connex_app.app.register_blueprint(redirect_blueprint)
 
-# Get Flask application instance
-app = connex_app.app
+def add_profiling(app):
+    """Profile the requests from the security middleware on, when enabled."""
+    if settings.PROFILING_ENABLED:
+        app.add_middleware(profiling.ProfilingMiddleware, position=MiddlewarePosition.BEFORE_SECURITY,
+                           store=profiling.profile_store, sample_rate=settings.PROFILING_SAMPLE_RATE,
+                           interval=settings.PROFILING_INTERVAL)
 
-# Configure the application
-app.config.from_object('my_config.config.Config')
-logging.config.dictConfig(LOGGING_CONFIG)
 
-# Enable CORS
-CORS(app)
+def add_compression(app):
+    """Compress the responses, including the errors of the middlewares, when enabled."""
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(response_compression.CompressionMiddleware, position=MiddlewarePosition.BEFORE_EXCEPTION,
+                           encoders=response_compression.available_encoders(settings),
+                           minimum_size=settings.COMPRESSION_MIN_SIZE)
+
+
+class FlaskThreadPool:
+    """Innermost middleware running the Flask application of `app`, a connexion FlaskApp, in `workers` threads.
+
+    Connexion runs it in 10 threads. `wrap` is applied to the WSGI application, the other scopes go to `app`.
+    """
+
+    def __init__(self, app, workers: int, wrap=None):
+        self.app = app
+        wsgi_app = app.app.wsgi_app
+        self.wsgi_app = WSGIMiddleware(wrap(wsgi_app) if wrap else wsgi_app, workers=workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        return await self.wsgi_app(scope, receive, send)
+
+
+def create_flask_app():
+    """Create the Flask application, serving the sync controllers from a thread pool."""
+    # Create Connexion application instance, sizing the thread pool that runs the Flask views of each worker
+    thread_pool = functools.partial(FlaskThreadPool, workers=settings.WEB_THREADS,
+                                    wrap=profiling.profiled_wsgi if settings.PROFILING_ENABLED else None)
+    flask_app = connexion.FlaskApp(__name__, specification_dir='./',
+                                   middlewares=[*ConnexionMiddleware.default_middlewares, thread_pool])
+    # The streams of the stock feed stop when their client disconnects, which the WSGI adapter does not tell
+    flask_app.add_middleware(DisconnectMiddleware, position=MiddlewarePosition.BEFORE_CONTEXT, paths=STREAM_PATHS)
+
+    # Use the same encoder for flask.json
+    if settings.JSON_ENCODER == 'orjson':
+        flask_app.app.json = serialization.OrjsonProvider(flask_app.app)
 
-# Set Prometheus Client
-metrics = ConnexionPrometheusMetrics(connex_app)
+    # Add API definition
+    flask_app.add_api('./inventory.yaml', **api_options)
+    # flask_app.add_api('./user-service.yaml', name='users', validate_responses=True, pythonic_params=True)
 
+    flask_app.app.register_blueprint(redirect_blueprint)
 
-# Register DB session cleanup
-@app.teardown_appcontext
-def shutdown_session(exception=None):
-    if exception:
-        logging.error(f'shutdown_session : {exception}')
-    db_session.remove()
+    # Get Flask application instance
+    app = flask_app.app
 
+    # Configure the application
+    app.config.from_object('my_config.config.Config')
 
-# Initialize the database
-init_db()
+    # Enable CORS
+    CORS(app, expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER])
+
+    # Set Prometheus Client, with the SQL metrics of every request
+    ConnexionPrometheusMetrics(flask_app)
+    flask_app.add_middleware(QueryMetricsMiddleware, budget=settings.QUERY_BUDGET)
+    add_profiling(flask_app)
+    add_compression(flask_app)
+
+    # Register DB session cleanup
+    @app.teardown_appcontext
+    def shutdown_session(exception=None):
+        if exception:
+            logging.error(f'shutdown_session : {exception}')
+        db_session.remove()
+
+    return flask_app
+
+
+def create_async_app():
+    """Create the asyncio application, serving the async controllers of controllers.aio."""
+    # pylint: disable=C0415  # The async modules create the asyncpg engine, only needed in this mode
+    from controllers import aio
+    from controllers.aio import general
+    from db.async_database import async_engine
+
+    @asynccontextmanager
+    async def lifespan(_):
+        yield
+        await async_engine.dispose()
+
+    async_app = connexion.AsyncApp(__name__, specification_dir='./', lifespan=lifespan)
+    async_app.add_api('./inventory.yaml', resolver=aio.AsyncResolver(), **api_options)
+    async_app.add_url_rule('/', 'root_redirect', general.root_redirect)
+    async_app.add_url_rule('/metrics', 'metrics', general.metrics)
+    async_app.add_middleware(CORSMiddleware, position=MiddlewarePosition.BEFORE_EXCEPTION, allow_origins=['*'],
+                              allow_methods=['*'], allow_headers=['*'],
+                              expose_headers=[NEXT_CURSOR_HEADER, ETAG_HEADER])
+    async_app.add_middleware(QueryMetricsMiddleware, budget=settings.QUERY_BUDGET)
+    add_profiling(async_app)
+    add_compression(async_app)
+    return async_app
+
+
+logging.config.dictConfig(LOGGING_CONFIG)
+# The schema is created and migrated at deploy time by migrate.py, so the workers start without touching the database
+connex_app = create_async_app() if settings.APP_MODE == 'async' else create_flask_app()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
@@ -0,0 +1,70 @@
+"""
+Async controllers of the Inventory Management API, used when APP_MODE is 'async'
+
+The modules mirror the sync controllers: the operation controllers.products.product_get_by_id is served by
+controllers.aio.products.product_get_by_id when it exists, and by the sync controller otherwise.
+"""
+import functools
+import importlib.util
+import io
+
+from anyio import from_thread
+from connexion.resolver import Resolver
+
+import profiling
+from db.database import db_session
+
+
+def with_session_cleanup(function):
+    """Remove the thread-local session after a sync controller, as the Flask teardown does in the sync mode.
+
+    The worker thread is also profiled when the request is.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            with profiling.profile_thread():
+                return function(*args, **kwargs)
+        finally:
+            db_session.remove()
+
+    return wrapper
+
+
+class AsyncResolver(Resolver):
+    """Resolves an operation to its async controller, or to its sync controller run in a thread pool."""
+
+    def resolve_function_from_operation_id(self, operation_id):
+        module_name, function_name = operation_id.rsplit('.', 1)
+        async_module_name = module_name.replace('controllers.', 'controllers.aio.', 1)
+        if importlib.util.find_spec(async_module_name):
+            function = getattr(importlib.import_module(async_module_name), function_name, None)
+            if function:
+                return function
+        return with_session_cleanup(super().resolve_function_from_operation_id(operation_id))
+
+
+class ThreadBodyReader(io.RawIOBase):
+    """Readable file over the async body stream of a request, for sync code running in a worker thread.
+
+    Each read waits on the event loop for the next chunk of the body, so the body is never held in memory.
+    """
+
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = chunks.__aiter__()
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            try:
+                self._buffer = from_thread.run(self._chunks.__anext__)
+            except StopAsyncIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
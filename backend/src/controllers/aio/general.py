@@ -0,0 +1,30 @@
+"""
+Routes of the async application outside of the API specification
+"""
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client import multiprocess
+from starlette.responses import RedirectResponse, Response
+
+from controllers import general
+from db.async_database import async_engine
+from db.health import readiness
+
+
+async def root_redirect(request):
+    return RedirectResponse('/ui/')
+
+
+async def metrics(request):
+    """Export the Prometheus metrics, aggregated over the workers when they share a metrics directory."""
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+async def health_ready():
+    """Readiness: the process can reach the database, through the asyncpg engine serving the requests."""
+    return general.ready_response(await readiness.check_async(async_engine))
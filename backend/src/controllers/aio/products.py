@@ -0,0 +1,112 @@
+"""
+Async product controller functions for the Inventory Management API
+"""
+import logging
+
+import connexion
+from connexion import NoContent
+from starlette.concurrency import run_in_threadpool
+
+import exceptions
+from controllers import products, tools
+from controllers.aio import ThreadBodyReader, with_session_cleanup
+from db import bulk_import
+from db.async_database import async_session
+from models.product import Product
+
+LOG = logging.getLogger(__name__)
+
+
+@tools.expected_errors(404)
+async def product_get_by_id(product_id: int):
+    """Get product by ID."""
+    async with async_session() as session:
+        product = await Product.get_cached_async(session, product_id)
+    return products.product_response(product_id, product)
+
+
+@tools.expected_errors(400)
+async def product_get_all(limit: int = 100, cursor: str = None, fields: list = None,  # pylint: disable=R0913,R0917
+                          name: str = None, sku_prefix: str = None, min_price: float = None, max_price: float = None,
+                          min_quantity: int = None, max_quantity: int = None):
+    """Get a page of the products matching the filters, by name, SKU prefix, price and quantity.
+
+    With `fields`, only those columns are read and returned.
+    """
+    filters = products.product_filters(name, sku_prefix, min_price, max_price, min_quantity, max_quantity)
+    after = tools.decode_cursor(cursor) if cursor else None
+    async with async_session() as session:
+        # The version is read before the page, so a concurrent write can only make the tag older than the page
+        etag = tools.make_etag('products', *await Product.get_version_async(session), limit, cursor,
+                               sorted(filters.items()), sorted(fields or []))
+        if tools.not_modified(etag):
+            return NoContent, 304, tools.etag_headers(etag)
+        page, next_key = await Product.get_page_async(session, limit, after, Product.select_filtered(filters, fields))
+    return [p.to_dict(fields) for p in page], 200, {**tools.page_headers(next_key), **tools.etag_headers(etag)}
+
+
+@tools.normal_response(201)
+@tools.expected_errors(400, 409)
+async def product_create(body: dict):
+    """Add a new product."""
+    products.check_required(body)
+    async with async_session() as session:
+        created = await Product.create_many_async(session, [body])
+    return products.create_response(body, created)
+
+
+@tools.normal_response(201)
+@tools.expected_errors(400)
+async def product_create_batch(body: list):
+    """Create many products with a single statement, reporting the outcome of every item."""
+    async with async_session() as session:
+        created = await Product.create_many_async(session, body)
+    return products.batch_results(body, created)
+
+
+@tools.normal_response(200)
+@tools.expected_errors(400)
+async def product_import():
+    """Bulk import products from a streamed CSV or NDJSON request body.
+
+    The import runs in a worker thread on the sync session, reading the body from the event loop as it goes.
+    """
+    fmt = bulk_import.NDJSON if connexion.request.mimetype == tools.NDJSON_MIMETYPE else bulk_import.CSV
+    reader = ThreadBodyReader(connexion.request.stream())
+    return await run_in_threadpool(with_session_cleanup(products.import_stream), reader, fmt)
+
+
+@tools.expected_errors(400, 404, 409)
+async def product_update(product_id: int, body: dict):
+    """Update product details or stock level."""
+    async with async_session() as session:
+        product = await Product.get_by_id_async(session, product_id)
+        if not product:
+            LOG.error('Product %s was not found', product_id)
+            raise exceptions.ProductNotFound(product_id=product_id)
+
+        # If SKU is updated, check for conflict
+        if 'sku' in body and body['sku'] != product.sku:
+            sku = body['sku']
+            existing_product = await Product.get_by_sku_async(session, sku)
+            if existing_product and existing_product.id != product_id:
+                LOG.error('Product with SKU %s already exists in product %s (%i).', sku, existing_product.name,
+                          existing_product.id)
+                raise exceptions.ProductSKUAlreadyExist(sku=sku)
+
+        if await product.update_async(session, body):
+            LOG.info('Product %s was updated successfully!', product.id)
+            return product.to_dict()
+    raise products.update_error(product_id, body)
+
+
+@tools.normal_response(204)
+@tools.expected_errors(404)
+async def product_delete(product_id: int):
+    """Delete a product from the inventory, together with its restock logs."""
+    async with async_session() as session:
+        if not await Product.delete_by_id_async(session, product_id):
+            LOG.error('Product %s was not found', product_id)
+            raise exceptions.ProductNotFound(product_id=product_id)
+    LOG.info('Product %s was deleted successfully!', product_id)
+    return NoContent
@@ -0,0 +1,66 @@
+"""
+Async restocking operations controller functions for the Inventory Management API
+"""
+import exceptions
+from controllers import restock, tools
+from db.async_database import async_session
+from models.product import Product
+from models.restock_log import RestockLog
+
+
+@tools.normal_response(200)
+@tools.expected_errors(400, 404)
+async def product_restock(product_id: int, body: dict):
+    """Restock a specific product."""
+    quantity = restock.restock_quantity(product_id, body)
+
+    # Update product quantity and create a restock log entry in one transaction
+    async with async_session() as session:
+        product = await RestockLog.restock_product_async(session, product_id, quantity, body.get('reason'))
+    return restock.restock_response(product_id, quantity, product)
+
+
+@tools.normal_response(200)
+@tools.expected_errors(400)
+async def restock_batch(body: list):
+    """Restock many products in one transaction, reporting the outcome of every item."""
+    async with async_session() as session:
+        quantities = await RestockLog.restock_products_async(session, body)
+    return restock.batch_results(body, quantities)
+
+
+async def _restock_logs(fields: list, filters: dict):
+    # The session lives as long as the response streams
+    async with async_session() as session:
+        async for log in await RestockLog.stream_all_async(session, fields=fields, filters=filters):
+            yield log.to_dict(fields)
+
+
+async def _restock_history(stream: bool, fields: list, filters: dict):
+    ndjson = tools.accepts_ndjson()
+    if stream or ndjson:
+        return tools.stream_json_async(_restock_logs(fields, filters), ndjson=ndjson)
+
+    restock_logs = [log async for log in _restock_logs(fields, filters)]
+    return restock_logs, 200, {'Content-Type': tools.JSON_MIMETYPE}
+
+
+@tools.normal_response(200)
+@tools.expected_errors(400)
+async def get_restock_history(stream: bool = False, fields: list = None, product_id: int = None, since: str = None,
+                              until: str = None):
+    """Get a history of restocking logs, of a product and between two times when asked."""
+    return await _restock_history(stream, fields, restock.history_filters(product_id, since, until))
+
+
+@tools.normal_response(200)
+@tools.expected_errors(400, 404)
+async def get_product_restock_history(product_id: int, stream: bool = False, fields: list = None, since: str = None,
+                                      until: str = None):
+    """Get the restocking logs of a product, between two times when asked."""
+    filters = restock.history_filters(product_id, since, until)
+    async with async_session() as session:
+        product = await Product.get_cached_async(session, product_id)
+    if not product:
+        raise exceptions.ProductNotFound(product_id=product_id)
+    return await _restock_history(stream, fields, filters)
@@ -0,0 +1,40 @@
+"""
+Async stock change feed controller functions for the Inventory Management API
+"""
+import asyncio
+
+from starlette.responses import StreamingResponse
+
+from controllers import stream, tools
+from db.stock_feed import stock_feed
+
+
+class StockStreamingResponse(StreamingResponse):
+    """Streamed events of a subscription, unsubscribed once sent, also when the body was never read."""
+
+    def __init__(self, subscription):
+        super().__init__(_stock_messages(subscription), media_type=stream.SSE_MIMETYPE, headers=stream.SSE_HEADERS)
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send):
+        try:
+            if scope['method'] == 'HEAD':  # No body to stream, which would last until the client disconnects
+                await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+                return await send({'type': 'http.response.body', 'body': b''})
+            await super().__call__(scope, receive, send)
+        finally:
+            stock_feed.bus.unsubscribe(self.subscription)
+
+
+async def _stock_messages(subscription):
+    yield f'retry: {stream.RETRY_MILLISECONDS}\n\n'
+    while not subscription.overflowed:
+        events = await subscription.get_async(stream.settings.STOCK_FEED_HEARTBEAT)
+        yield stream.messages(events, subscription.overflowed)
+
+
+@tools.normal_response(200)
+@tools.expected_errors(503)
+async def stock_stream(product_id: list = None, last_event_id: str = None):
+    """Stream the stock changes, of some products when asked."""
+    return StockStreamingResponse(stream.subscribe(product_id, last_event_id, asyncio.get_running_loop()))
@@ -1,5 +1,8 @@
 from flask import redirect, Blueprint
 
+from db.database import engine
+from db.health import readiness
+
 redirect_blueprint = Blueprint('redirect', __name__)
 
 
@@ -13,3 +16,19 @@ def health_status():
     return {
         'status': 'ok',
     }
+
+
+def health_live():
+    """Liveness: the process serves requests, whatever the state of the database."""
+    return health_status()
+
+
+def health_ready():
+    """Readiness: the process can reach the database."""
+    return ready_response(readiness.check(engine))
+
+
+def ready_response(ready: bool):
+    if ready:
+        return {'status': 'ok', 'database': 'ok'}, 200
+    return {'status': 'unavailable', 'database': 'unreachable'}, 503
@@ -1,12 +1,15 @@
 """
 Product controller functions for the Inventory Management API
 """
+import csv
+import io
 import logging
+import flask
 from connexion import NoContent
 import exceptions
 from controllers import tools
+from db import bulk_import
 from models.product import Product
-from models.restock_log import RestockLog
 
 LOG = logging.getLogger(__name__)
 
@@ -23,38 +26,116 @@ def _get_product_by_id(id_: int):
 @tools.expected_errors(404)
 def product_get_by_id(product_id: int):
     """Get product by ID."""
-    product = _get_product_by_id(product_id)
-    return product.to_dict()
+    return product_response(product_id, Product.get_cached(product_id))
 
 
-def product_get_all():
-    """Get all products."""
-    products = Product.get_all()
-    return [p.to_dict() for p in products]
+def product_response(product_id: int, product: dict):
+    """Response of a product read, 304 if the client has it already, or raise ProductNotFound."""
+    if not product:
+        LOG.error('Product %s was not found', product_id)
+        raise exceptions.ProductNotFound(product_id=product_id)
+    etag = tools.make_etag(product['id'], product['updated_at'])
+    if tools.not_modified(etag):
+        return NoContent, 304, tools.etag_headers(etag)
+    return product, 200, tools.etag_headers(etag)
+
+
+def product_filters(name: str, sku_prefix: str, min_price: float, max_price: float,  # pylint: disable=R0913,R0917
+                    min_quantity: int, max_quantity: int) -> dict:
+    """Filters of a product list request, see Product.filter_conditions."""
+    return {'name': name, 'sku_prefix': sku_prefix, 'min_price': min_price, 'max_price': max_price,
+            'min_quantity': min_quantity, 'max_quantity': max_quantity}
+
+
+@tools.expected_errors(400)
+def product_get_all(limit: int = 100, cursor: str = None, fields: list = None,  # pylint: disable=R0913,R0917
+                    name: str = None, sku_prefix: str = None, min_price: float = None, max_price: float = None,
+                    min_quantity: int = None, max_quantity: int = None):
+    """Get a page of the products matching the filters, by name, SKU prefix, price and quantity.
+
+    With `fields`, only those columns are read and returned.
+    """
+    filters = product_filters(name, sku_prefix, min_price, max_price, min_quantity, max_quantity)
+    after = tools.decode_cursor(cursor) if cursor else None
+    # The version is read before the page, so a concurrent write can only make the tag older than the page
+    etag = tools.make_etag('products', *Product.get_version(), limit, cursor, sorted(filters.items()),
+                           sorted(fields or []))
+    if tools.not_modified(etag):
+        return NoContent, 304, tools.etag_headers(etag)
+    products, next_key = Product.get_page(limit, after, Product.select_filtered(filters, fields))
+    return [p.to_dict(fields) for p in products], 200, {**tools.page_headers(next_key), **tools.etag_headers(etag)}
 
 
 @tools.normal_response(201)
 @tools.expected_errors(400, 409)
 def product_create(body: dict):
     """Add a new product."""
-    # Check for required fields
+    check_required(body)
+    return create_response(body, Product.create_many([body]))
+
+
+def check_required(body: dict):
+    """Raise BadRequest if a product creation misses a required field."""
     if not all(k in body for k in ['name', 'sku', 'quantity', 'price']):
         raise exceptions.BadRequest(message="Name, SKU, quantity, and price are required.")
 
-    # Check for existing SKU
-    sku = body.get('sku')
-    existing_product = Product.get_by_sku(sku)
-    if existing_product:
+
+def create_response(body: dict, created: dict) -> dict:
+    """Response of a product creation, given the created products by SKU, or raise ProductSKUAlreadyExist."""
+    sku = body['sku']
+    if sku not in created:
         LOG.error('Product with SKU %s already exists.', sku)
         raise exceptions.ProductSKUAlreadyExist(sku=sku)
+    LOG.info('Product %s was created successfully!', created[sku]['id'])
+    return created[sku]
 
-    product = Product(body)
-    if product.create():
-        LOG.info('Product %s was created successfully!', product.id)
-        return product.to_dict()
 
-    LOG.error('Failed to create product with SKU %s due to unknown reason.', product.sku)
-    raise exceptions.InternalServerError(message='Failed to create product.')
+@tools.normal_response(201)
+@tools.expected_errors(400)
+def product_create_batch(body: list):
+    """Create many products with a single statement, reporting the outcome of every item."""
+    return batch_results(body, Product.create_many(body))
+
+
+def batch_results(body: list, created: dict) -> dict:
+    """Outcome of every item of a batch creation, given the created products by SKU.
+
+    When a SKU appears more than once, its first item was created and the others fail.
+    """
+    results = []
+    for index, item in enumerate(body):
+        sku = item['sku']
+        product = created.pop(sku, None)
+        if product:
+            results.append({'index': index, 'sku': sku, 'status': 'created', 'product': product})
+        else:
+            error = exceptions.ProductSKUAlreadyExist(sku=sku)
+            results.append({'index': index, 'sku': sku, 'status': 'failed', 'error': error.message})
+
+    succeeded = sum(1 for result in results if result['status'] == 'created')
+    LOG.info('Batch creation of %d products: %d created, %d failed.', len(body), succeeded, len(body) - succeeded)
+    return {'created': succeeded, 'failed': len(body) - succeeded, 'results': results}
+
+
+@tools.normal_response(200)
+@tools.expected_errors(400)
+def product_import():
+    """Bulk import products from a streamed CSV or NDJSON request body."""
+    fmt = bulk_import.NDJSON if flask.request.mimetype == tools.NDJSON_MIMETYPE else bulk_import.CSV
+    return import_stream(flask.request.stream, fmt)
+
+
+def import_stream(stream, fmt: str) -> dict:
+    """Import products from a binary stream of CSV or NDJSON."""
+    lines = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8', newline='')
+    try:
+        result = bulk_import.import_products(lines, fmt)
+    except (csv.Error, UnicodeDecodeError) as exc:
+        LOG.error('Failed to read the product import: %s', exc)
+        raise exceptions.ProductImportInvalid(error=str(exc)) from exc
+    LOG.info('Product import: %d inserted, %d updated, %d rejected.',
+             result['inserted'], result['updated'], result['rejected'])
+    return result
 
 
 @tools.expected_errors(400, 404, 409)
@@ -74,20 +155,25 @@ def product_update(product_id: int, body: dict):
     if product.update(body):
         LOG.info('Product %s was updated successfully!', product.id)
         return product.to_dict()
+    raise update_error(product_id, body)
+
 
+def update_error(product_id: int, body: dict) -> exceptions.MyBaseException:
+    """Error of a product update rejected by the database."""
+    # The only unique column a client can change is the SKU, so a rejected update lost a race on it
+    if 'sku' in body:
+        LOG.error('Product with SKU %s already exists.', body['sku'])
+        return exceptions.ProductSKUAlreadyExist(sku=body['sku'])
     LOG.error('Failed to update product %s due to unknown reason.', product_id)
-    raise exceptions.InternalServerError(message='Failed to update product.')
+    return exceptions.InternalServerError(message='Failed to update product.')
 
 
 @tools.normal_response(204)
 @tools.expected_errors(404)
 def product_delete(product_id: int):
-    """Delete a product from the inventory."""
-    restock_logs = RestockLog.get_by_product_id(product_id)
-    for restock_log in restock_logs:
-        restock_log.delete()
-
-    product = _get_product_by_id(product_id)
-    product.delete()
-    LOG.info('Product %s was deleted successfully!', product.id)
+    """Delete a product from the inventory, together with its restock logs."""
+    if not Product.delete_by_id(product_id):
+        LOG.error('Product %s was not found', product_id)
+        raise exceptions.ProductNotFound(product_id=product_id)
+    LOG.info('Product %s was deleted successfully!', product_id)
     return NoContent
@@ -0,0 +1,35 @@
+"""
+Profile controller functions for the Inventory Management API
+"""
+import logging
+import os
+
+import exceptions
+import profiling
+from controllers import tools
+
+LOG = logging.getLogger(__name__)
+
+MIMETYPES = {
+    profiling.PSTATS: 'application/octet-stream',
+    profiling.COLLAPSED: 'text/plain',
+}
+
+
+@tools.normal_response(200)
+def profile_get_all():
+    """Get the stored profiles, newest first."""
+    return profiling.profile_store.get_all()
+
+
+@tools.expected_errors(404)
+def profile_get(name: str, format_: str = profiling.PSTATS):
+    """Download a stored profile."""
+    path = profiling.profile_store.path(name, format_)
+    if not path:
+        LOG.error('Profile %s was not found in %s format', name, format_)
+        raise exceptions.ProfileNotFound(name=name, format=format_)
+    with open(path, 'rb') as profile:
+        data = profile.read()
+    filename = os.path.basename(path)
+    return data, 200, {'Content-Type': MIMETYPES[format_], 'Content-Disposition': f'attachment; filename={filename}'}
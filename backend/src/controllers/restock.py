@@ -4,49 +4,98 @@ Restocking Operations controller functions for the Inventory Management API
 import logging
 import exceptions
 from controllers import tools
-from models.product import Product  # Import Product model
+from models.product import Product
 from models.restock_log import RestockLog  # Import RestockLog model
 
 LOG = logging.getLogger(__name__)
 
 
-def _get_product_by_id_for_restock(id_: int):
-    """Helper to get product by ID or raise ProductNotFound (specific for restock)."""
-    product = Product.get_by_id(id_)
-    if not product:
-        LOG.error('Product %s was not found for restock operation', id_)
-        raise exceptions.ProductNotFound(product_id=id_)
-    return product
-
-
 @tools.normal_response(200)
 @tools.expected_errors(400, 404)
 def product_restock(product_id: int, body: dict):
     """Restock a specific product."""
-    quantity = body.get('quantity')
+    quantity = restock_quantity(product_id, body)
+
+    # Update product quantity and create a restock log entry in one transaction
+    product = RestockLog.restock_product(product_id, quantity, body.get('reason'))
+    return restock_response(product_id, quantity, product)
 
-    product = _get_product_by_id_for_restock(product_id)
 
+def restock_quantity(product_id: int, body: dict) -> int:
+    """Get the quantity of a restock request or raise RestockLogInvalidQuantity."""
+    quantity = body.get('quantity')
     if not isinstance(quantity, int) or quantity <= 0:
-        LOG.info('Product %s restocked by %d units. New quantity: %d', product.id, quantity, product.quantity)
+        LOG.error('Invalid restock quantity %s for product %s', quantity, product_id)
         raise exceptions.RestockLogInvalidQuantity(quantity=quantity)
+    return quantity
 
-    # Update product quantity
-    product.quantity += quantity
-    product.update({'quantity': product.quantity})
-    LOG.info('Product %s restocked by %d units. New quantity: %d', product.id, quantity, product.quantity)
 
-    # Create a restock log entry
-    data = {'product_id': product_id, **body}
-    restock_log = RestockLog(data)
+def restock_response(product_id: int, quantity: int, product) -> dict:
+    """Response of a restock, given the restocked product, or raise ProductNotFound."""
+    if not product:
+        LOG.error('Product %s was not found for restock operation', product_id)
+        raise exceptions.ProductNotFound(product_id=product_id)
 
-    restock_log.create()
-    LOG.info('Restock log created for product %s.', product.id)
+    LOG.info('Product %s restocked by %d units. New quantity: %d', product.id, quantity, product.quantity)
     return product.to_dict()  # Return updated product details
 
 
+def batch_results(body: list, quantities: dict) -> dict:
+    """Outcome of every item of a batch restock, given the new quantities of the restocked products."""
+    results = []
+    for index, item in enumerate(body):
+        product_id = item['product_id']
+        if product_id in quantities:
+            results.append({'index': index, 'product_id': product_id, 'status': 'restocked',
+                            'quantity': quantities[product_id]})
+        else:
+            error = exceptions.ProductNotFound(product_id=product_id)
+            results.append({'index': index, 'product_id': product_id, 'status': 'failed', 'error': error.message})
+
+    restocked = sum(1 for result in results if result['status'] == 'restocked')
+    LOG.info('Batch restock of %d items: %d restocked, %d failed.', len(body), restocked, len(body) - restocked)
+    return {'restocked': restocked, 'failed': len(body) - restocked, 'results': results}
+
+
 @tools.normal_response(200)
-def get_restock_history():
-    """Get a history of restocking logs."""
-    restock_logs = RestockLog.get_all()
-    return [log.to_dict() for log in restock_logs]
+@tools.expected_errors(400)
+def restock_batch(body: list):
+    """Restock many products in one transaction, reporting the outcome of every item."""
+    quantities = RestockLog.restock_products(body)
+    return batch_results(body, quantities)
+
+
+def history_filters(product_id: int = None, since: str = None, until: str = None) -> dict:
+    """Filters of a restock history request, with the timestamps parsed or BadRequest raised."""
+    return {'product_id': product_id, 'since': tools.parse_timestamp(since, 'since'),
+            'until': tools.parse_timestamp(until, 'until')}
+
+
+def restock_history(stream: bool, fields: list, filters: dict):
+    """Restock logs matching `filters`, streamed on request or when NDJSON is accepted."""
+    ndjson = tools.accepts_ndjson()
+    if stream or ndjson:
+        restock_logs = RestockLog.iter_all(fields=fields, filters=filters)
+        return tools.stream_json((log.to_dict(fields) for log in restock_logs), ndjson=ndjson)
+
+    restock_logs = RestockLog.get_all(fields, filters)
+    return [log.to_dict(fields) for log in restock_logs], 200, {'Content-Type': tools.JSON_MIMETYPE}
+
+
+@tools.normal_response(200)
+@tools.expected_errors(400)
+def get_restock_history(stream: bool = False, fields: list = None, product_id: int = None, since: str = None,
+                        until: str = None):
+    """Get a history of restocking logs, of a product and between two times when asked."""
+    return restock_history(stream, fields, history_filters(product_id, since, until))
+
+
+@tools.normal_response(200)
+@tools.expected_errors(400, 404)
+def get_product_restock_history(product_id: int, stream: bool = False, fields: list = None, since: str = None,
+                                until: str = None):
+    """Get the restocking logs of a product, between two times when asked."""
+    filters = history_filters(product_id, since, until)
+    if not Product.get_cached(product_id):
+        raise exceptions.ProductNotFound(product_id=product_id)
+    return restock_history(stream, fields, filters)
@@ -0,0 +1,108 @@
+"""
+Stock change feed controller functions for the Inventory Management API
+"""
+import asyncio
+import json
+import logging
+import threading
+
+import connexion
+import flask
+from werkzeug.wsgi import ClosingIterator
+
+import exceptions
+from controllers import tools
+from db.stock_feed import OVERFLOW, TooManySubscribers, stock_feed
+from my_config.config import Config
+
+LOG = logging.getLogger(__name__)
+
+SSE_MIMETYPE = 'text/event-stream'
+# Proxies must neither cache nor buffer the stream
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+RETRY_MILLISECONDS = 3000  # Delay before the browsers reconnect
+KEEP_ALIVE = ': keep-alive\n\n'
+STREAM_PATHS = {'/api/stream/stock'}
+DISCONNECTED_KEY = 'inventory.disconnected'  # Scope key of the DisconnectMiddleware flag
+OVERFLOW_MESSAGE = f'event: {OVERFLOW}\ndata: {json.dumps({"reason": "Events were produced faster than read"})}\n\n'
+
+settings = Config.get_settings()
+
+
+def subscribe(product_id: list, last_event_id: str, loop=None):
+    """Subscription of a stream request, resuming after the Last-Event-ID header, or raise StockFeedFull."""
+    last_event_id = connexion.request.headers.get('Last-Event-ID') or last_event_id
+    try:
+        return stock_feed.subscribe(last_event_id, set(product_id) if product_id else None, loop)
+    except TooManySubscribers as exc:
+        LOG.warning('Stock feed subscription refused, %d subscribers already', stock_feed.bus.max_subscribers)
+        raise exceptions.StockFeedFull(subscribers=stock_feed.bus.max_subscribers) from exc
+
+
+def format_event(stock_event) -> str:
+    # The reset event has no id, so the client keeps the id of the last event it received
+    lines = [f'id: {stock_event.id}'] if stock_event.id else []
+    lines += [f'event: {stock_event.type}', f'data: {stock_event.data}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def messages(events: list, overflowed: bool) -> str:
+    """Messages of the events taken from a subscription, then the overflow event when it overflowed."""
+    if not events and not overflowed:
+        return KEEP_ALIVE
+    return ''.join(format_event(stock_event) for stock_event in events) + (OVERFLOW_MESSAGE if overflowed else '')
+
+
+class DisconnectMiddleware:
+    """ASGI middleware telling the Flask views streaming endless bodies that their client disconnected.
+
+    The WSGI adapter never reads the disconnection, and the server drops what is sent afterwards, so a stream would
+    run (and hold its thread) forever. The request of a path of `paths` gets a threading.Event in its scope, read
+    from environ['asgi.scope'], set when the client disconnects. Only for requests without a body.
+    """
+
+    def __init__(self, app, paths: set):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            return await self.app(scope, receive, send)
+        pending = [await receive()]
+        disconnected = threading.Event()
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        async def replay():
+            if pending:
+                return pending.pop()
+            await asyncio.shield(watcher)
+            return {'type': 'http.disconnect'}
+
+        watcher = asyncio.create_task(watch())
+        try:
+            return await self.app({**scope, DISCONNECTED_KEY: disconnected}, replay, send)
+        finally:
+            watcher.cancel()
+
+
+def stock_messages(subscription, disconnected: threading.Event):
+    yield f'retry: {RETRY_MILLISECONDS}\n\n'
+    while not subscription.overflowed and not disconnected.is_set():
+        events = subscription.get(settings.STOCK_FEED_HEARTBEAT)
+        yield messages(events, subscription.overflowed)
+
+
+@tools.normal_response(200)
+@tools.expected_errors(503)
+def stock_stream(product_id: list = None, last_event_id: str = None):
+    """Stream the stock changes, of some products when asked."""
+    disconnected = flask.request.environ.get('asgi.scope', {}).get(DISCONNECTED_KEY) or threading.Event()
+    subscription = subscribe(product_id, last_event_id)
+    # Unsubscribed when the response is closed, also when the body was never read (HEAD, client gone)
+    body = ClosingIterator(stock_messages(subscription, disconnected),
+                           lambda: stock_feed.bus.unsubscribe(subscription))
+    return flask.Response(body, mimetype=SSE_MIMETYPE, headers=SSE_HEADERS)
@@ -1,16 +1,50 @@
+import base64
+import binascii
 import functools
+import hashlib
+import inspect
+import json
+import logging
+from datetime import datetime, timezone
+
+import connexion
+import flask
+from starlette.responses import Response as StarletteResponse, StreamingResponse
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
 import exceptions
+import serialization
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+ETAG_HEADER = 'ETag'
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Errors are always JSON, also of operations producing other content types
+ERROR_HEADERS = {'Content-Type': JSON_MIMETYPE}
+STREAM_CHUNK_ITEMS = 500
+
+LOG = logging.getLogger(__name__)
 
 
 def normal_response(code):
     def decorator_func(func):
-        @functools.wraps(func)
-        def wrapper_func(*args, **kwargs):
-            retval = func(*args, **kwargs)
-            if isinstance(retval, tuple):
+        def response(retval):
+            if isinstance(retval, (tuple, flask.Response, StarletteResponse)):
                 return retval
             return retval, code
 
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper_func(*args, **kwargs):
+                return response(await func(*args, **kwargs))
+
+            return async_wrapper_func
+
+        @functools.wraps(func)
+        def wrapper_func(*args, **kwargs):
+            return response(func(*args, **kwargs))
+
         return wrapper_func
 
     return decorator_func
@@ -18,25 +52,143 @@ def normal_response(code):
 
 def expected_errors(*errors):
     def decorator_func(func):
+        def error_response(exc):
+            if isinstance(exc, exceptions.MyBaseException):
+                if exc.code not in errors:
+                    msg = f'Unexpected error code {exc.code} {exc.final_message()}!!!'
+                    LOG.exception(msg)
+                    return {"message": msg}, 500, ERROR_HEADERS
+                return exc.final_message(), exc.code, ERROR_HEADERS
+            msg = f'Unexpected error code {str(exc)}!!!'
+            LOG.exception(msg)
+            return {"message": msg}, 500, ERROR_HEADERS
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper_func(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as exc:  # pylint: disable=W0718
+                    return error_response(exc)
+
+            return async_wrapper_func
+
         @functools.wraps(func)
         def wrapper_func(*args, **kwargs):
             try:
                 rv = func(*args, **kwargs)
                 return rv
-            except exceptions.MyBaseException as exc:
-                if exc.code not in errors:
-                    msg = f'Unexpected error code {exc.code} {exc.final_message()}!!!'
-                    print(msg)
-                    # LOG.exception(msg)
-                    return {"message": msg}, 500
-                # LOG.error(exc.message)
-                return exc.final_message(), exc.code
             except Exception as exc:  # pylint: disable=W0718
-                msg = f'Unexpected error code {str(exc)}!!!'
-                print(msg)
-                # LOG.exception(msg)
-                return {"message": msg}, 500
+                return error_response(exc)
 
         return wrapper_func
 
     return decorator_func
+
+
+def encode_cursor(key: tuple) -> str:
+    """Encode a (created_at, id) keyset into an opaque pagination cursor."""
+    created_at, id_ = key
+    raw = json.dumps([created_at.isoformat(), id_]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode an opaque pagination cursor back into a (created_at, id) keyset or raise InvalidCursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, id_ = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id_)
+    except (binascii.Error, ValueError, TypeError) as exc:
+        raise exceptions.InvalidCursor(cursor=cursor) from exc
+
+
+def parse_timestamp(value: str, name: str):
+    """Naive UTC datetime of an ISO 8601 query parameter, as the database stores them, or raise BadRequest."""
+    if value is None:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise exceptions.InvalidTimestamp(name=name, value=value) from exc
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def page_headers(next_key: tuple) -> dict:
+    """Response headers pointing at the next page, if there is one."""
+    if next_key is None:
+        return {}
+    return {NEXT_CURSOR_HEADER: encode_cursor(next_key)}
+
+
+def make_etag(*parts) -> str:
+    """Strong entity tag (unquoted) of the representation identified by `parts`.
+
+    The parts are serialized like the response bodies, so a datetime gives the same tag whether it comes from the
+    database or from a cache holding its JSON form.
+    """
+    return hashlib.sha1(serialization.dumps(parts)).hexdigest()
+
+
+def not_modified(etag: str) -> bool:
+    """Whether the If-None-Match header of the request matches `etag`."""
+    return parse_etags(connexion.request.headers.get('If-None-Match')).contains_weak(etag)
+
+
+def etag_headers(etag: str) -> dict:
+    """Response headers carrying `etag`."""
+    return {ETAG_HEADER: quote_etag(etag)}
+
+
+def accepts_ndjson() -> bool:
+    """Whether the client prefers NDJSON over a JSON array."""
+    accept = parse_accept_header(connexion.request.headers.get('Accept'), MIMEAccept)
+    return accept.best_match([JSON_MIMETYPE, NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_json(items, ndjson: bool = False) -> flask.Response:
+    """Stream `items` as a JSON array (or NDJSON) without building the whole body in memory."""
+    def generate():
+        chunk = [] if ndjson else ['[']
+        separator = ''
+        for count, item in enumerate(items, start=1):
+            if ndjson:
+                chunk.append(flask.json.dumps(item) + '\n')
+            else:
+                chunk.append(separator + flask.json.dumps(item))
+                separator = ','
+            if count % STREAM_CHUNK_ITEMS == 0:
+                yield ''.join(chunk)
+                chunk = []
+        if not ndjson:
+            chunk.append(']')
+        yield ''.join(chunk)
+
+    mimetype = NDJSON_MIMETYPE if ndjson else JSON_MIMETYPE
+    return flask.Response(flask.stream_with_context(generate()), mimetype=mimetype)
+
+
+def stream_json_async(items, ndjson: bool = False) -> StreamingResponse:
+    """stream_json() for the async controllers, `items` is an async iterator."""
+    async def generate():
+        chunk = [] if ndjson else [b'[']
+        separator = b''
+        count = 0
+        async for item in items:
+            count += 1
+            if ndjson:
+                chunk.append(serialization.dumps(item) + b'\n')
+            else:
+                chunk.append(separator + serialization.dumps(item))
+                separator = b','
+            if count % STREAM_CHUNK_ITEMS == 0:
+                yield b''.join(chunk)
+                chunk = []
+        if not ndjson:
+            chunk.append(b']')
+        yield b''.join(chunk)
+
+    mimetype = NDJSON_MIMETYPE if ndjson else JSON_MIMETYPE
+    return StreamingResponse(generate(), media_type=mimetype)
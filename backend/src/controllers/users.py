@@ -19,17 +19,26 @@ def get_user_by_id(id_: int):
     return user
 
 
-def user_get_all():
-    """Get all users."""
-    users = User.get_all()
-    return [user.to_dict() for user in users]
+@tools.expected_errors(400)
+def user_get_all(limit: int = 100, cursor: str = None):
+    """Get a page of users."""
+    after = tools.decode_cursor(cursor) if cursor else None
+    # The version is read before the page, so a concurrent write can only make the tag older than the page
+    etag = tools.make_etag('users', *User.get_version(), limit, cursor)
+    if tools.not_modified(etag):
+        return NoContent, 304, tools.etag_headers(etag)
+    users, next_key = User.get_page(limit, after)
+    return [user.to_dict() for user in users], 200, {**tools.page_headers(next_key), **tools.etag_headers(etag)}
 
 
 @tools.expected_errors(404)
 def user_get_by_id(id_: int):
     """Get user by ID."""
     user = get_user_by_id(id_)
-    return user.to_dict()
+    etag = tools.make_etag(user.id, user.updated_at)
+    if tools.not_modified(etag):
+        return NoContent, 304, tools.etag_headers(etag)
+    return user.to_dict(), 200, tools.etag_headers(etag)
 
 
 @tools.normal_response(201)
@@ -0,0 +1,22 @@
+"""
+Asyncio database connection handling for the Inventory Service API
+
+Used by the async controllers when APP_MODE is 'async'. Each request opens its own AsyncSession:
+    async with async_session() as session:
+        ...
+"""
+import logging
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from my_config.config import Config
+from db import pool, query_metrics
+
+# Create engine
+async_engine = create_async_engine(Config.get_async_url(), **pool.pool_options(Config.get_settings(), asyncio=True))
+logging.info('Set async DB in URL : %s', async_engine.url.render_as_string(hide_password=True))
+pool.instrument(async_engine.sync_engine, 'async')
+query_metrics.instrument(async_engine.sync_engine)
+
+# Objects stay usable after commit, the controllers serialize them once the session is closed
+async_session = async_sessionmaker(async_engine, expire_on_commit=False)
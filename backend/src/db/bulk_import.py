@@ -0,0 +1,173 @@
+"""
+Bulk product import for the Inventory Service API
+
+Records are validated in Python, streamed into a temporary staging table with COPY FROM STDIN in
+bounded chunks, and finally merged into products with one INSERT ... ON CONFLICT (sku) upsert. Memory
+use depends on the chunk size only, never on the size of the input.
+"""
+import csv
+import io
+import json
+import logging
+import math
+
+from db.cache import product_cache
+from db.database import db_session
+
+LOG = logging.getLogger(__name__)
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+
+COPY_CHUNK_ROWS = 10_000
+MAX_REPORTED_ERRORS = 100
+MAX_QUANTITY = 2**31 - 1  # INTEGER column
+
+CREATE_STAGING_TABLE = """
+CREATE TEMPORARY TABLE products_import (
+    line BIGINT NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    sku VARCHAR(100) NOT NULL,
+    description TEXT,
+    quantity INTEGER NOT NULL,
+    price DOUBLE PRECISION NOT NULL
+) ON COMMIT DROP
+"""
+
+COPY_STAGING_TABLE = """
+COPY products_import (line, name, sku, description, quantity, price) FROM STDIN WITH (FORMAT csv)
+"""
+
+# When a SKU appears more than once in the input, its last occurrence wins
+MERGE_STAGING_TABLE = """
+WITH merged AS (
+    INSERT INTO products (uuid, name, sku, description, quantity, price, created_at, updated_at)
+    SELECT DISTINCT ON (sku)
+        gen_random_uuid()::text, name, sku, coalesce(description, ''), quantity, price,
+        now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc'
+    FROM products_import
+    ORDER BY sku, line DESC
+    ON CONFLICT (sku) DO UPDATE SET
+        name = EXCLUDED.name,
+        description = EXCLUDED.description,
+        quantity = EXCLUDED.quantity,
+        price = EXCLUDED.price,
+        updated_at = EXCLUDED.updated_at
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+"""
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def parse_records(lines, fmt: str):
+    """Yield (line number, record or InvalidRecord) for every data line of a CSV or NDJSON input.
+
+    `lines` is an iterable of text lines. CSV input needs a header naming the columns.
+    """
+    if fmt == CSV:
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_num, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_num, InvalidRecord(f'invalid JSON: {exc}')
+                continue
+            if not isinstance(record, dict):
+                record = InvalidRecord('a product must be a JSON object')
+            yield line_num, record
+
+
+def validate_record(record: dict) -> tuple:
+    """Convert a raw record into a staging row or raise InvalidRecord."""
+    name = str(record.get('name') or '').strip()
+    sku = str(record.get('sku') or '').strip()
+    if not name or not sku:
+        raise InvalidRecord('name and sku are required')
+    if len(name) > 255 or len(sku) > 100:
+        raise InvalidRecord('name or sku is too long')
+    quantity, price = record.get('quantity', 0), record.get('price', 0)
+    try:
+        if isinstance(quantity, bool) or isinstance(price, bool):
+            raise TypeError('booleans are not numbers')
+        if isinstance(quantity, float) and not quantity.is_integer():
+            raise ValueError(quantity)
+        quantity = int(quantity)  # Not int(float()), strings with a fraction are rejected too
+        price = float(price)
+    except (TypeError, ValueError) as exc:
+        raise InvalidRecord('quantity must be an integer and price a number') from exc
+    if quantity < 0 or price < 0:
+        raise InvalidRecord('quantity and price must not be negative')
+    # Checked here as COPY would fail the whole import on them
+    if quantity > MAX_QUANTITY:
+        raise InvalidRecord(f'quantity must not exceed {MAX_QUANTITY}')
+    if not math.isfinite(price):
+        raise InvalidRecord('price must be a finite number')
+    return name, sku, str(record.get('description') or ''), quantity, price
+
+
+def _copy_rows(cursor, rows: list):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(COPY_STAGING_TABLE, buffer)
+
+
+def import_products(lines, fmt: str, chunk_rows: int = COPY_CHUNK_ROWS) -> dict:
+    """Import products from CSV or NDJSON text lines in a single transaction.
+
+    Existing products (by SKU) are updated, new ones are inserted and invalid records are rejected.
+    Returns the counters and the first rejected lines.
+    """
+    received = rejected = 0
+    errors = []
+    try:
+        cursor = db_session.connection().connection.dbapi_connection.cursor()
+        cursor.execute(CREATE_STAGING_TABLE)
+
+        rows = []
+        for line_num, record in parse_records(lines, fmt):
+            received += 1
+            try:
+                if isinstance(record, InvalidRecord):
+                    raise record
+                rows.append((line_num,) + validate_record(record))
+            except InvalidRecord as exc:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line_num, 'error': str(exc)})
+                continue
+            if len(rows) >= chunk_rows:
+                _copy_rows(cursor, rows)
+                rows = []
+        if rows:
+            _copy_rows(cursor, rows)
+
+        cursor.execute(MERGE_STAGING_TABLE)
+        inserted, updated = cursor.fetchone()
+        db_session.commit()
+        if updated:
+            product_cache.clear()
+    except Exception as e:  # pylint: disable=W0718
+        LOG.exception(f'import_products : unexpected exception : {e}')
+        db_session.rollback()
+        raise e
+
+    LOG.info(f'Imported products: {inserted} inserted, {updated} updated, {rejected} rejected')
+    return {
+        'received': received,
+        'inserted': inserted,
+        'updated': updated,
+        'rejected': rejected,
+        'duplicates': received - rejected - inserted - updated,
+        'errors': errors,
+    }
@@ -0,0 +1,246 @@
+"""
+Read-through caches for the Inventory Service API
+
+Values are the dictionaries the API returns, so a cached read never touches the database session. With
+CACHE_REDIS_URL set the processes share a Redis cache (any server speaking the Redis protocol), the default when
+caching. Writes delete the entries they change, in every process. The per-process LRU with a TTL only sees the
+writes of its own process: under several workers the others serve old values for up to CACHE_TTL seconds, so it
+must be enabled explicitly.
+"""
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import monotonic
+
+from connexion.jsonifier import JSONEncoder
+from prometheus_client import Counter
+
+from my_config.config import Config
+
+LOG = logging.getLogger(__name__)
+
+CACHE_HITS = Counter('cache_hits_total', 'Number of reads served by the cache', ['cache'])
+CACHE_MISSES = Counter('cache_misses_total', 'Number of reads that went to the database', ['cache'])
+CACHE_EVICTIONS = Counter('cache_evictions_total', 'Number of entries dropped before being invalidated',
+                          ['cache', 'reason'])
+
+
+class Cache(ABC):
+    """Base class of the caches, implementing the read-through logic.
+
+    A value loaded from the database is only cached if no write invalidated its entry since the load started, as
+    it may predate that write: version() is read before the load and set_if_unchanged() compares it atomically.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @abstractmethod
+    def get(self, key):
+        """The cached value of `key`, or None."""
+
+    @abstractmethod
+    def version(self, key):
+        """Token changing whenever the entry of `key` is invalidated."""
+
+    @abstractmethod
+    def set_if_unchanged(self, key, value: dict, version):
+        """Cache `value` unless the entry of `key` was invalidated since version() returned `version`."""
+
+    @abstractmethod
+    def delete(self, *keys):
+        """Invalidate the entries of `keys`."""
+
+    @abstractmethod
+    def clear(self):
+        """Invalidate all the entries."""
+
+    def get_or_load(self, key, loader):
+        """Get the value of `key`, calling `loader` and caching its result on a miss. A None result is not cached."""
+        value = self.get(key)
+        if value is not None:
+            CACHE_HITS.labels(self.name).inc()
+            return value
+        CACHE_MISSES.labels(self.name).inc()
+        version = self.version(key)
+        value = loader()
+        if value is not None:
+            self.set_if_unchanged(key, value, version)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """get_or_load() with a coroutine function `loader`."""
+        value = self.get(key)
+        if value is not None:
+            CACHE_HITS.labels(self.name).inc()
+            return value
+        CACHE_MISSES.labels(self.name).inc()
+        version = self.version(key)
+        value = await loader()
+        if value is not None:
+            self.set_if_unchanged(key, value, version)
+        return value
+
+
+class LRUCache(Cache):
+    """Bounded in-process cache, dropping the least recently used entries and the entries older than `ttl`.
+
+    Its version is the number of invalidations of the whole cache, any write keeps the values loaded meanwhile out.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        super().__init__(name)
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= monotonic():
+                del self._entries[key]
+                CACHE_EVICTIONS.labels(self.name, 'expired').inc()
+                return None
+            self._entries.move_to_end(key)
+        return dict(value)
+
+    def version(self, key):
+        return self._invalidations
+
+    def set_if_unchanged(self, key, value: dict, version):
+        with self._lock:
+            if version != self._invalidations:
+                return
+            self._entries[key] = (dict(value), monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.labels(self.name, 'size').inc()
+
+    def delete(self, *keys):
+        with self._lock:
+            self._invalidations += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(Cache):
+    """Cache shared by the processes, stored in Redis with a TTL.
+
+    `client` is a redis-py client. Every entry has a version key, incremented with the deletion of the entry, and
+    clear() increments the generation of the whole cache; a loaded value is set in a WATCH transaction on both, so
+    an invalidation by any process keeps it out.
+    The cache is an optimization, so the errors of the server are logged and treated as misses.
+    The calls are blocking, in the async mode each one holds the event loop for a round trip to the server.
+    """
+
+    def __init__(self, name: str, client, ttl: float):
+        super().__init__(name)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = f'inventory:{name}:'
+        self.generation_key = f'inventory:{name}-generation'
+
+    def _version_key(self, key) -> str:
+        # Outside of the prefix of the entries, which clear() deletes. Never expires, one per key ever invalidated.
+        return f'inventory:{self.name}-version:{key}'
+
+    def get(self, key):
+        try:
+            data = self.client.get(f'{self.prefix}{key}')
+        except Exception as e:  # pylint: disable=W0718
+            LOG.warning(f'get : cache {self.name} is unavailable : {e}')
+            return None
+        return json.loads(data) if data is not None else None
+
+    def version(self, key):
+        try:
+            return self.client.mget(self.generation_key, self._version_key(key))
+        except Exception as e:  # pylint: disable=W0718
+            LOG.warning(f'version : cache {self.name} is unavailable : {e}')
+            return None
+
+    def set_if_unchanged(self, key, value: dict, version):
+        from redis import WatchError  # pylint: disable=C0415,E0401  # Installed, as the client is
+        if version is None:
+            return
+        watched = (self.generation_key, self._version_key(key))
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.watch(*watched)
+                if pipe.mget(*watched) != version:
+                    return
+                pipe.multi()
+                pipe.set(f'{self.prefix}{key}', json.dumps(value, cls=JSONEncoder), px=int(self.ttl * 1000))
+                pipe.execute()
+        except WatchError:
+            pass  # Invalidated between the comparison and the set
+        except Exception as e:  # pylint: disable=W0718
+            LOG.warning(f'set : cache {self.name} is unavailable : {e}')
+
+    def delete(self, *keys):
+        try:
+            with self.client.pipeline() as pipe:
+                for key in keys:
+                    pipe.incr(self._version_key(key))
+                pipe.delete(*(f'{self.prefix}{key}' for key in keys))
+                pipe.execute()
+        except Exception as e:  # pylint: disable=W0718
+            LOG.error(f'delete : cache {self.name} is unavailable, entries may be stale for {self.ttl}s : {e}')
+
+    def clear(self):
+        try:
+            self.client.incr(self.generation_key)
+            keys = list(self.client.scan_iter(match=f'{self.prefix}*', count=1000))
+            if keys:
+                self.client.delete(*keys)
+        except Exception as e:  # pylint: disable=W0718
+            LOG.error(f'clear : cache {self.name} is unavailable, entries may be stale for {self.ttl}s : {e}')
+
+
+class NullCache(Cache):
+    """Cache that keeps nothing, every read goes to the database."""
+
+    def get(self, key):
+        return None
+
+    def version(self, key):
+        return None
+
+    def set_if_unchanged(self, key, value: dict, version):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+def create_cache(name: str, settings) -> Cache:
+    """Create the cache configured by the settings, by default only the shared one when CACHE_REDIS_URL is set."""
+    enabled = settings.CACHE_ENABLED if settings.CACHE_ENABLED is not None else bool(settings.CACHE_REDIS_URL)
+    if not enabled:
+        return NullCache(name)
+    if settings.CACHE_REDIS_URL:
+        import redis  # pylint: disable=C0415,E0401  # Optional dependency, only needed for a shared cache
+        return RedisCache(name, redis.Redis.from_url(settings.CACHE_REDIS_URL), settings.CACHE_TTL)
+    return LRUCache(name, settings.CACHE_MAX_SIZE, settings.CACHE_TTL)
+
+
+product_cache = create_cache('products', Config.get_settings())
@@ -2,6 +2,7 @@
 Database connection handling for the User Service API
 """
 import logging
+import random
 from time import sleep
 import sqlalchemy.exc
 from sqlalchemy import create_engine
@@ -9,14 +10,17 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
 
 from my_config.config import Config
+from db import pool, query_metrics
 
 MAX_RETRIES = 10
-RETRY_DELAY = 2
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10
 
 # Create engine
-url = Config.get_url()
-logging.info(f'Set DB in URL : {url}')
-engine = create_engine(url)
+engine = create_engine(Config.get_url(), **pool.pool_options(Config.get_settings()))
+logging.info('Set DB in URL : %s', engine.url.render_as_string(hide_password=True))
+pool.instrument(engine, 'sync')
+query_metrics.instrument(engine)
 
 # Create scoped session
 db_session = scoped_session(
@@ -28,25 +32,20 @@ Base = declarative_base()
 Base.query = db_session.query_property()
 
 
-def init_db():
-    """Initialize the database."""
-    sleep(RETRY_DELAY)
+def with_retries(function, description: str):
+    """Call `function` until it does not fail with OperationalError, for MAX_RETRIES attempts.
 
+    The first attempt runs right away, then the delays grow exponentially from RETRY_BASE_DELAY up to
+    RETRY_MAX_DELAY, with full jitter so that many processes waiting on the same database do not retry in step.
+    """
     for attempt in range(1, MAX_RETRIES + 1):
-        logging.info(f'Attempt {attempt} of {MAX_RETRIES} to create database tables...')
         try:
-            # Import models here to ensure they are registered properly on the metadata
-            from models.user import User  # pylint: disable=C0415,W0611,R0401
-            from models.product import Product  # pylint: disable=C0415,W0611,R0401
-            from models.restock_log import RestockLog  # pylint: disable=C0415,W0611,R0401
-
-            Base.metadata.create_all(bind=engine)
-            logging.info('Database tables created successfully!')
-            break  # Exit the loop if successful
+            return function()
         except sqlalchemy.exc.OperationalError as e:
-            logging.error(f'Error creating tables: {e}')
+            logging.error(f'Attempt {attempt} of {MAX_RETRIES} to {description} failed: {e}')
+            error = e
             if attempt < MAX_RETRIES:
-                logging.info(f'Retrying in {RETRY_DELAY} seconds...')
-                sleep(RETRY_DELAY)
-            else:
-                logging.info('Maximum retry attempts reached. Could not create database tables.')
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+                logging.info(f'Retrying in {delay:.1f} seconds...')
+                sleep(delay)
+    raise error
@@ -0,0 +1,95 @@
+"""
+Database readiness probe for the Inventory Service API
+
+/health/ready reports whether the process can reach the database. Kubernetes polls it on every pod, and load
+balancers may poll it much more often, so the result of a probe is shared by the callers for `ttl` seconds and at
+most one probe runs at a time. While a probe runs, the other callers get the previous result instead of waiting.
+"""
+import asyncio
+import logging
+import threading
+from time import monotonic
+
+import sqlalchemy.exc
+from sqlalchemy import text
+
+from my_config.config import Config
+
+LOG = logging.getLogger(__name__)
+
+PROBE_ERRORS = (sqlalchemy.exc.SQLAlchemyError, OSError, asyncio.TimeoutError)
+
+
+class ReadinessProbe:
+    """Cached and rate-limited connectivity check of an engine, sync or async."""
+
+    def __init__(self, ttl: float, timeout: float):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.ready = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._async_lock = None  # Created in the event loop
+
+    def _fresh(self) -> bool:
+        return self._checked_at is not None and monotonic() - self._checked_at < self.ttl
+
+    def _store(self, error):
+        ready = error is None
+        if ready != self.ready:
+            if ready:
+                LOG.info('Database is reachable, the service is ready')
+            else:
+                LOG.error(f'Database is unreachable, the service is not ready: {error}')
+        self.ready = ready
+        self._checked_at = monotonic()
+
+    def check(self, engine) -> bool:
+        """Whether the database of `engine` is reachable, probed at most once per `ttl` seconds."""
+        if self._fresh():
+            return self.ready
+        # The first callers wait for the first probe, later ones keep the last result while a probe runs
+        if not self._lock.acquire(blocking=self.ready is None):  # pylint: disable=R1732
+            return self.ready
+        try:
+            if not self._fresh():
+                error = None
+                try:
+                    with engine.connect() as connection:
+                        connection.execute(text('SELECT 1'))
+                except PROBE_ERRORS as e:
+                    error = e
+                self._store(error)
+            return self.ready
+        finally:
+            self._lock.release()
+
+    async def check_async(self, engine) -> bool:
+        """Whether the database of the async `engine` is reachable, probed at most once per `ttl` seconds."""
+        if self._fresh():
+            return self.ready
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        if self._async_lock.locked() and self.ready is not None:
+            return self.ready
+        async with self._async_lock:
+            if not self._fresh():
+                error = None
+                try:
+                    await asyncio.wait_for(self._select_async(engine), self.timeout)
+                except PROBE_ERRORS as e:
+                    error = e
+                self._store(error)
+            return self.ready
+
+    @staticmethod
+    async def _select_async(engine):
+        async with engine.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+
+
+def create_probe(settings) -> ReadinessProbe:
+    return ReadinessProbe(settings.READINESS_CACHE_TTL, settings.READINESS_TIMEOUT)
+
+
+readiness = create_probe(Config.get_settings())
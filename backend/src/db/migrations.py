@@ -0,0 +1,194 @@
+"""
+Versioned schema migrations for the Inventory Service API
+
+Migrations run at deploy time (see migrate.py), never from the application workers. Every applied
+version is recorded in the schema_migrations table, and a PostgreSQL advisory lock makes sure only
+one migrator runs at a time.
+"""
+import logging
+
+from sqlalchemy import text
+
+from db import partitions
+from db.database import Base
+
+LOG = logging.getLogger(__name__)
+
+MIGRATIONS_LOCK_ID = 724_001  # Arbitrary key of the advisory lock taken while migrating
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+)
+"""
+
+INVALID_INDEX = """
+SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+WHERE c.relname = :name AND NOT i.indisvalid
+"""
+
+AVAILABLE_EXTENSION = 'SELECT 1 FROM pg_available_extensions WHERE name = :name'
+
+
+class Migration:
+    """A schema change identified by a version number.
+
+    Steps are SQL strings or callables taking the connection. Non transactional migrations run in
+    autocommit mode, which statements such as CREATE INDEX CONCURRENTLY require.
+    """
+
+    def __init__(self, version: int, description: str, steps: list, transactional: bool = True):
+        self.version = version
+        self.description = description
+        self.steps = steps
+        self.transactional = transactional
+
+    def apply(self, connection):
+        for step in self.steps:
+            if callable(step):
+                step(connection)
+            else:
+                connection.execute(text(step))
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.version}: {self.description}>'
+
+
+def create_index(name: str, table: str, columns: str, unique: bool = False, using: str = 'btree'):
+    """Step building an index without locking the table against writes.
+
+    A failed concurrent build leaves an invalid index behind, which is dropped and built again.
+    """
+    def step(connection):
+        if connection.execute(text(INVALID_INDEX), {'name': name}).first():
+            LOG.warning(f'Dropping invalid index {name} left by a failed build')
+            connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+        unique_sql = 'UNIQUE ' if unique else ''
+        connection.execute(text(
+            f'CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {using} ({columns})'))
+
+    return step
+
+
+def with_extension(extension: str, step):
+    """Step creating `extension` then running `step`, skipped with a warning when the server lacks the extension.
+
+    For optional indexes: the queries they speed up still work without them.
+    """
+    def extension_step(connection):
+        if not connection.execute(text(AVAILABLE_EXTENSION), {'name': extension}).first():
+            LOG.warning(f'Extension {extension} is not available on the server, skipping the step that needs it')
+            return
+        connection.execute(text(f'CREATE EXTENSION IF NOT EXISTS {extension}'))
+        step(connection)
+
+    return extension_step
+
+
+def ensure_unique(table: str, column: str):
+    """Step failing with a readable error when a unique index cannot be built because of duplicates."""
+    def step(connection):
+        duplicates = connection.execute(text(
+            f'SELECT {column} FROM {table} GROUP BY {column} HAVING count(*) > 1 LIMIT 10')).scalars().all()
+        if duplicates:
+            raise RuntimeError(f'Duplicate values of {table}.{column} must be resolved first: {duplicates}')
+
+    return step
+
+
+MIGRATIONS = [
+    Migration(1, 'Index products.sku for Product.get_by_sku', [
+        create_index('ix_products_sku', 'products', 'sku'),
+    ], transactional=False),
+    Migration(2, 'Index products.quantity for Product.get_low_quantity', [
+        create_index('ix_products_quantity', 'products', 'quantity'),
+    ], transactional=False),
+    Migration(3, 'Index restock_logs.product_id for RestockLog.get_by_product_id', [
+        create_index('ix_restock_logs_product_id', 'restock_logs', 'product_id'),
+    ], transactional=False),
+    Migration(4, 'Index (created_at, id) for ordered and paginated listings', [
+        create_index('ix_products_created_at_id', 'products', 'created_at, id'),
+        create_index('ix_users_created_at_id', 'users', 'created_at, id'),
+        create_index('ix_restock_logs_created_at_id', 'restock_logs', 'created_at, id'),
+    ], transactional=False),
+    Migration(5, 'Make products.sku unique for INSERT ... ON CONFLICT (sku)', [
+        ensure_unique('products', 'sku'),
+        create_index('uq_products_sku', 'products', 'sku', unique=True),
+        'DROP INDEX CONCURRENTLY IF EXISTS ix_products_sku',
+    ], transactional=False),
+    Migration(6, 'Delete restock logs with their product (ON DELETE CASCADE)', [
+        # Added as NOT VALID so that only the short validation scan runs without blocking writes
+        'ALTER TABLE restock_logs DROP CONSTRAINT IF EXISTS restock_logs_product_id_fkey, '
+        'ADD CONSTRAINT restock_logs_product_id_fkey FOREIGN KEY (product_id) REFERENCES products (id) '
+        'ON DELETE CASCADE NOT VALID',
+        'ALTER TABLE restock_logs VALIDATE CONSTRAINT restock_logs_product_id_fkey',
+    ], transactional=False),
+    Migration(7, 'Index the product filters: name substring, SKU prefix and price range', [
+        with_extension('pg_trgm', create_index('ix_products_name_trgm', 'products', 'name gin_trgm_ops', using='gin')),
+        create_index('ix_products_sku_pattern', 'products', 'sku varchar_pattern_ops'),
+        create_index('ix_products_price', 'products', 'price'),
+    ], transactional=False),
+    Migration(8, 'Partition restock_logs by month of restocked_at', [
+        partitions.partition_table,
+    ]),
+    Migration(9, 'Sequence of the stock feed event ids', [
+        'CREATE SEQUENCE IF NOT EXISTS stock_event_ids',
+    ]),
+    Migration(10, 'Index updated_at for the list versions (ETag) of BaseModel.get_version', [
+        create_index('ix_products_updated_at', 'products', 'updated_at'),
+        create_index('ix_users_updated_at', 'users', 'updated_at'),
+    ], transactional=False),
+]
+
+
+def _record(connection, migration: Migration):
+    connection.execute(
+        text('INSERT INTO schema_migrations (version, description) VALUES (:version, :description)'),
+        {'version': migration.version, 'description': migration.description},
+    )
+
+
+def applied_versions(connection) -> set:
+    connection.execute(text(CREATE_MIGRATIONS_TABLE))
+    return set(connection.execute(text('SELECT version FROM schema_migrations')).scalars())
+
+
+def pending_migrations(connection) -> list:
+    applied = applied_versions(connection)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def migrate(engine) -> list:
+    """Create missing tables, apply all pending migrations in version order and create the coming partitions.
+
+    Returns the applied migrations.
+    """
+    # Import models here to ensure they are registered properly on the metadata
+    from models.user import User  # pylint: disable=C0415,W0611,R0401
+    from models.product import Product  # pylint: disable=C0415,W0611,R0401
+    from models.restock_log import RestockLog  # pylint: disable=C0415,W0611,R0401
+
+    Base.metadata.create_all(bind=engine)
+
+    applied = []
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATIONS_LOCK_ID})
+        try:
+            for migration in pending_migrations(connection):
+                LOG.info(f'Applying migration {migration.version}: {migration.description}')
+                if migration.transactional:
+                    # The migration and its version record are committed together
+                    with engine.begin() as transaction:
+                        migration.apply(transaction)
+                        _record(transaction, migration)
+                else:
+                    migration.apply(connection)
+                    _record(connection, migration)
+                applied.append(migration)
+            created = partitions.ensure_partitions(engine)
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATIONS_LOCK_ID})
+    LOG.info(f'Database schema is up to date ({len(applied)} migrations applied, {len(created)} partitions created)')
+    return applied
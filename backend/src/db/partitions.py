@@ -0,0 +1,157 @@
+"""
+Monthly partitions of the restock_logs table for the Inventory Service API
+
+restock_logs is range partitioned by restocked_at, one partition per month (restock_logs_YYYY_MM), so the queries
+bounded in time only read the partitions of their months and an old month is removed by detaching its partition
+instead of deleting its rows. The partitions of the next PARTITION_MONTHS_AHEAD months are created at every
+deploy (see migrate.py); rows of a month without a partition land in restock_logs_default, and move to the
+partition of their month when it is created.
+
+A partitioned table only holds unique constraints including the partition key, so the primary key of restock_logs
+is (id, restocked_at), still unique as the ids come from a sequence, and its uuid column is not indexed.
+"""
+import logging
+import re
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+LOG = logging.getLogger(__name__)
+
+TABLE = 'restock_logs'
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_(\d{{4}})_(\d{{2}})$')
+PARTITION_MONTHS_AHEAD = 3
+
+IS_PARTITIONED = """
+SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :table
+"""
+
+PARTITIONS = """
+SELECT c.relname FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class parent ON parent.oid = i.inhparent
+WHERE parent.relname = :table
+"""
+
+
+def month_start(day) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{TABLE}_{month:%Y_%m}'
+
+
+def partition_month(name: str):
+    """Month of a monthly partition from its name, None for other tables (such as the default partition)."""
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(connection) -> bool:
+    return connection.execute(text(IS_PARTITIONED), {'table': TABLE}).first() is not None
+
+
+def partitions(connection) -> dict:
+    """Monthly partitions attached to the table, by month."""
+    names = connection.execute(text(PARTITIONS), {'table': TABLE}).scalars()
+    return {partition_month(name): name for name in names if partition_month(name)}
+
+
+def _months(first: date, last: date):
+    month = first
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def _bounds(month: date) -> str:
+    return f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+
+
+def partition_table(connection):
+    """Migration step rebuilding restock_logs as a partitioned table, with the partitions of its rows' months.
+
+    The rows are copied in the transaction of the migration, which blocks the writes to the table meanwhile.
+    """
+    if is_partitioned(connection):
+        return
+    sequence = connection.execute(text(f"SELECT pg_get_serial_sequence('{TABLE}', 'id')")).scalar()
+    connection.execute(text(
+        f"UPDATE {TABLE} SET restocked_at = coalesce(created_at, now() AT TIME ZONE 'utc') "
+        f"WHERE restocked_at IS NULL"))
+    first = connection.execute(text(f'SELECT min(restocked_at) FROM {TABLE}')).scalar() or datetime.utcnow()
+    last = add_months(month_start(datetime.utcnow()), PARTITION_MONTHS_AHEAD)
+
+    new_table = f'{TABLE}_partitioned'
+    statements = [
+        f'CREATE TABLE {new_table} (LIKE {TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (restocked_at)',
+        f'ALTER TABLE {new_table} ALTER COLUMN restocked_at SET NOT NULL',
+        f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {new_table} DEFAULT',
+        *(f'CREATE TABLE {partition_name(month)} PARTITION OF {new_table} FOR VALUES {_bounds(month)}'
+          for month in _months(month_start(first), last)),
+        f'INSERT INTO {new_table} SELECT * FROM {TABLE}',
+        f'ALTER SEQUENCE {sequence} OWNED BY {new_table}.id',
+        f'DROP TABLE {TABLE}',
+        f'ALTER TABLE {new_table} RENAME TO {TABLE}',
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, restocked_at)',
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_product_id_fkey FOREIGN KEY (product_id) '
+        f'REFERENCES products (id) ON DELETE CASCADE',
+        f'CREATE INDEX ix_{TABLE}_product_id ON {TABLE} (product_id)',
+        f'CREATE INDEX ix_{TABLE}_created_at_id ON {TABLE} (created_at, id)',
+    ]
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def create_partition(transaction, month: date):
+    """Create the partition of `month`, moving its rows out of the default partition."""
+    name = partition_name(month)
+    transaction.execute(text(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)'))
+    moved = transaction.execute(text(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE restocked_at >= :start AND restocked_at < :end '
+        f'RETURNING *) INSERT INTO {name} SELECT * FROM moved'),
+        {'start': month, 'end': add_months(month, 1)}).rowcount
+    transaction.execute(text(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES {_bounds(month)}'))
+    LOG.info(f'Created partition {name} ({moved} rows moved from {DEFAULT_PARTITION})')
+
+
+def _partitions(engine) -> dict:
+    with engine.connect() as connection:
+        return partitions(connection) if is_partitioned(connection) else None
+
+
+def ensure_partitions(engine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> list:
+    """Create the missing partitions from the current month to `months_ahead` months later, one per transaction.
+
+    Returns the months of the created partitions.
+    """
+    existing = _partitions(engine)
+    if existing is None:
+        return []
+    current = month_start(datetime.utcnow())
+    created = [month for month in _months(current, add_months(current, months_ahead)) if month not in existing]
+    for month in created:
+        with engine.begin() as transaction:
+            create_partition(transaction, month)
+    return created
+
+
+def detach_partitions(engine, before: date) -> list:
+    """Detach the partitions of the months before `before`, which stay as standalone tables to archive or drop.
+
+    Detaching only changes the catalog, however many rows the partition holds. Returns the detached tables.
+    """
+    detached = []
+    for month, name in sorted((_partitions(engine) or {}).items()):
+        if month < month_start(before):
+            with engine.begin() as transaction:
+                transaction.execute(text(f'ALTER TABLE {TABLE} DETACH PARTITION {name}'))
+            LOG.info(f'Detached partition {name}')
+            detached.append(name)
+    return detached
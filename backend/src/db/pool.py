@@ -0,0 +1,104 @@
+"""
+Configurable and instrumented SQLAlchemy connection pools for the Inventory Service API
+
+The pool metrics live in the default Prometheus registry, so they are exported on /metrics together
+with the request metrics of ConnexionPrometheusMetrics.
+"""
+from time import perf_counter
+
+import sqlalchemy.exc
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a database connection from the pool',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total', 'Number of pool checkouts that timed out waiting for a connection')
+# The usage gauges are summed over the live processes when running with several workers. The async mode also
+# has the sync engine, for the operations without an async controller, so they are labelled with the engine.
+POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Number of database connections checked out of the pool',
+                    ['engine'], multiprocess_mode='livesum')
+POOL_SIZE = Gauge('db_pool_size', 'Number of persistent connections the pool of each process keeps',
+                  ['engine'], multiprocess_mode='livemax')
+POOL_OVERFLOW = Gauge('db_pool_overflow', 'Number of connections opened above the pool size',
+                      ['engine'], multiprocess_mode='livesum')
+
+
+class CheckoutTimingMixin:
+    """Times how long getting a connection takes, including waiting for a free one."""
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.observe(perf_counter() - start)
+
+
+class InstrumentedQueuePool(CheckoutTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+class InstrumentedNullPool(CheckoutTimingMixin, NullPool):
+    pass
+
+
+def pool_options(settings, asyncio: bool = False) -> dict:
+    """create_engine() pool options from the DB_POOL_* settings, for create_async_engine() with `asyncio`.
+
+    The 'null' mode opens a connection per checkout and closes it on checkin, leaving the pooling to
+    an external pooler such as PgBouncer.
+    """
+    # asyncpg and psycopg2 name the connection timeout differently
+    connect_args = {'timeout': settings.DB_CONNECT_TIMEOUT} if asyncio else {
+        'connect_timeout': settings.DB_CONNECT_TIMEOUT}
+    if settings.DB_POOL_MODE == 'null':
+        return {
+            'poolclass': InstrumentedNullPool,
+            'pool_pre_ping': settings.DB_POOL_PRE_PING,
+            'connect_args': connect_args,
+        }
+    return {
+        'poolclass': InstrumentedAsyncAdaptedQueuePool if asyncio else InstrumentedQueuePool,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+def instrument(engine, name: str):
+    """Export the pool usage of the engine as Prometheus gauges, with the `name` engine label."""
+    in_use, size, overflow = POOL_IN_USE.labels(name), POOL_SIZE.labels(name), POOL_OVERFLOW.labels(name)
+
+    # The engine replaces its pool when it is disposed (after a fork), so always look up the current one
+    def update_overflow():
+        if isinstance(engine.pool, QueuePool):
+            overflow.set(max(engine.pool.overflow(), 0))
+
+    def on_connect(*_):
+        if isinstance(engine.pool, QueuePool):
+            size.set(engine.pool.size())
+
+    def on_checkout(*_):
+        in_use.inc()
+        update_overflow()
+
+    def on_checkin(*_):
+        in_use.dec()
+        update_overflow()
+
+    event.listen(engine, 'connect', on_connect)
+    event.listen(engine, 'checkout', on_checkout)
+    event.listen(engine, 'checkin', on_checkin)
@@ -0,0 +1,101 @@
+"""
+Per-request SQL metrics for the Inventory Service API
+
+Every statement run by an instrumented engine is counted and timed against the request that runs it, found through
+a context variable. When the request ends, its statement count, total SQL time and slowest statement are exported
+as Prometheus histograms labelled by operationId, next to the request metrics of ConnexionPrometheusMetrics. A
+request running more statements than its budget is logged with its slowest statement, as it usually hides an N+1
+pattern.
+"""
+import logging
+from contextvars import ContextVar
+from time import perf_counter
+
+from connexion.middleware.abstract import ROUTING_CONTEXT
+from prometheus_client import Histogram
+from sqlalchemy import event
+
+LOG = logging.getLogger(__name__)
+
+MAX_LOGGED_STATEMENT = 500
+
+REQUEST_QUERIES = Histogram(
+    'db_request_queries', 'Number of SQL statements run by a request', ['operation'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000))
+REQUEST_QUERY_TIME = Histogram(
+    'db_request_query_seconds', 'Time a request spent running SQL statements', ['operation'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+REQUEST_SLOWEST_QUERY = Histogram(
+    'db_request_slowest_query_seconds', 'Duration of the slowest SQL statement of a request', ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+
+class QueryStats:
+    """SQL statements run by one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        if duration >= self.slowest:
+            self.slowest = duration
+            self.slowest_statement = statement
+
+
+_current_stats: ContextVar[QueryStats] = ContextVar('query_stats', default=None)
+
+
+def instrument(engine):
+    """Record the statements of the engine against the current request. Pass the sync_engine of an async engine."""
+
+    def before_cursor_execute(conn, *_):
+        if _current_stats.get() is not None:
+            conn.info.setdefault('query_start', []).append(perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, *_):
+        stats = _current_stats.get()
+        if stats is not None and conn.info.get('query_start'):
+            stats.record(statement, perf_counter() - conn.info['query_start'].pop())
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+class QueryMetricsMiddleware:
+    """ASGI middleware collecting the SQL statements of every API request, after the routing of connexion.
+
+    The stats object is shared by the worker threads and tasks the request runs in, as they copy the context.
+    A `budget` of 0 disables the warning.
+    """
+
+    def __init__(self, app, budget: int = 0):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        operation_id = scope.get('extensions', {}).get(ROUTING_CONTEXT, {}).get('operation_id')
+        if scope['type'] != 'http' or operation_id is None:
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            _current_stats.reset(token)
+            self.report(operation_id, stats)
+
+    def report(self, operation_id: str, stats: QueryStats):
+        REQUEST_QUERIES.labels(operation_id).observe(stats.count)
+        REQUEST_QUERY_TIME.labels(operation_id).observe(stats.duration)
+        if stats.count:
+            REQUEST_SLOWEST_QUERY.labels(operation_id).observe(stats.slowest)
+        if self.budget and stats.count > self.budget:
+            LOG.warning('%s ran %d SQL statements (budget %d) in %.1f ms, the slowest took %.1f ms: %s',
+                        operation_id, stats.count, self.budget, stats.duration * 1000, stats.slowest * 1000,
+                        stats.slowest_statement[:MAX_LOGGED_STATEMENT])
@@ -0,0 +1,313 @@
+"""
+Stock change feed for the Inventory Service API
+
+The writes changing the stock of a product (update, restock, batch restock, delete) record a stock event on their
+session, and the event is published when the session commits, never for a rolled back transaction. Each process
+fans the events out to its subscribers, the clients of /api/stream/stock:
+- with STOCK_FEED_BACKEND 'postgres', the events are sent with NOTIFY in the transaction of the write and every
+  process LISTENs, so the subscribers of any process see the writes of all of them. Event ids come from a
+  database sequence.
+- with 'local', the events are published in the process that wrote them, which only suits a single process.
+
+Each process keeps its last STOCK_FEED_BUFFER_SIZE events, so a client reconnecting with the id of the last event it
+received (Last-Event-ID) gets the events it missed. When that event is no longer known, or the listener lost its
+connection and may have missed events, the client receives a reset event and should read the stock again.
+
+A subscriber holds at most STOCK_FEED_QUEUE_SIZE events waiting to be sent. A client reading slower than the stock
+changes fills it and is disconnected with an overflow event, instead of holding memory or slowing the writes; it
+can reconnect and resume from the buffer.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import random
+import select
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from time import sleep
+from typing import NamedTuple
+
+from prometheus_client import Counter, Gauge
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from my_config.config import Config
+
+LOG = logging.getLogger(__name__)
+
+CHANNEL = 'stock_events'
+EVENT_SEQUENCE = 'stock_event_ids'
+EVENTS_KEY = 'stock_events'  # Events recorded on a session, in Session.info
+STOCK_UPDATED = 'stock.updated'
+STOCK_RESTOCKED = 'stock.restocked'
+PRODUCT_DELETED = 'product.deleted'
+RESET = 'reset'
+OVERFLOW = 'overflow'
+LISTEN_POLL_INTERVAL = 5
+LISTEN_RETRY_MAX_DELAY = 10
+
+NOTIFY = f"""
+SELECT pg_notify('{CHANNEL}', nextval('{EVENT_SEQUENCE}') || ' ' || payload)
+FROM unnest(CAST(:payloads AS text[])) WITH ORDINALITY AS events (payload, position) ORDER BY position
+"""
+
+EVENTS_PUBLISHED = Counter('stock_feed_events_total', 'Number of stock events received by the feed', ['type'])
+SUBSCRIBERS = Gauge('stock_feed_subscribers', 'Number of clients subscribed to the stock feed',
+                    multiprocess_mode='livesum')
+SUBSCRIBERS_DROPPED = Counter('stock_feed_subscribers_dropped_total',
+                              'Number of subscribers disconnected for not reading their events fast enough')
+
+
+class StockEvent(NamedTuple):
+    id: str
+    type: str
+    product_id: int
+    data: str  # JSON document
+
+
+RESET_EVENT = StockEvent(None, RESET, None, '{}')
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    """Events waiting to be sent to one subscriber, at most `size` of them.
+
+    A subscription is read by one thread, or by one task of `loop`, and fed by the publishing threads.
+    """
+
+    def __init__(self, size: int, product_ids: set = None, loop=None):
+        self.size = size
+        self.product_ids = product_ids
+        self.overflowed = False
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._ready = asyncio.Event() if loop else threading.Event()
+
+    def put(self, stock_event: StockEvent, force: bool = False):
+        """Queue an event of a product the subscriber follows, or flag the overflow when the queue is full."""
+        if stock_event.type != RESET and self.product_ids and stock_event.product_id not in self.product_ids:
+            return
+        with self._lock:
+            if self.overflowed:
+                return
+            if len(self._events) >= self.size and not force:
+                self.overflowed = True
+                SUBSCRIBERS_DROPPED.inc()
+            else:
+                self._events.append(stock_event)
+        self._wake()
+
+    def _wake(self):
+        if self._loop is None:
+            self._ready.set()
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # The loop is closed, nobody reads the subscription anymore
+
+    def _take(self) -> list:
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            self._ready.clear()
+        return events
+
+    def get(self, timeout: float) -> list:
+        """Wait up to `timeout` seconds for events and take them all."""
+        self._ready.wait(timeout)
+        return self._take()
+
+    async def get_async(self, timeout: float) -> list:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._take()
+
+
+class StockBus:
+    """In-process fan-out of the stock events to the subscriptions, with the last `buffer_size` events."""
+
+    def __init__(self, buffer_size: int, queue_size: int, max_subscribers: int):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._buffer = deque(maxlen=buffer_size)
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, last_event_id: str = None, product_ids: set = None, loop=None) -> Subscription:
+        """Subscribe to the events following `last_event_id`, or to the next ones.
+
+        The missed events still in the buffer are queued first, or a reset event when `last_event_id` is unknown.
+        Raises TooManySubscribers when the process has `max_subscribers` already.
+        """
+        subscription = Subscription(self.queue_size, product_ids, loop)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                raise TooManySubscribers()
+            if last_event_id is not None:
+                ids = [stock_event.id for stock_event in self._buffer]
+                missed = list(self._buffer)[ids.index(last_event_id) + 1:] if last_event_id in ids else [RESET_EVENT]
+                for stock_event in missed:
+                    subscription.put(stock_event, force=True)
+            self._subscriptions.add(subscription)
+        SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions.discard(subscription)
+        SUBSCRIBERS.dec()
+
+    def publish(self, events: list):
+        # Under the lock, so every subscriber gets the events in the order of the buffer
+        with self._lock:
+            for stock_event in events:
+                EVENTS_PUBLISHED.labels(stock_event.type).inc()
+                self._buffer.append(stock_event)
+                for subscription in self._subscriptions:
+                    subscription.put(stock_event)
+
+    def reset(self):
+        """Forget the buffered events and tell the subscribers that events may have been missed."""
+        with self._lock:
+            self._buffer.clear()
+            for subscription in self._subscriptions:
+                subscription.put(RESET_EVENT, force=True)
+
+
+class _Listener:
+    """Thread LISTENing to the stock events of all the processes and publishing them to `bus`."""
+
+    def __init__(self, bus: StockBus, url: str, connect_timeout: float = None):
+        self.bus = bus
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self._thread = None
+        self._lock = threading.Lock()
+        self._listening = threading.Event()
+
+    def start(self):
+        """Start the thread unless it runs already."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name='stock-feed-listener', daemon=True)
+                self._thread.start()
+                # So the first subscriber does not miss the writes following its subscription
+                self._listening.wait(self.connect_timeout)
+
+    def _listen(self):
+        import psycopg2  # pylint: disable=C0415  # Only the 'postgres' backend listens
+        attempt = 0
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(self.url, connect_timeout=self.connect_timeout)
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {CHANNEL}')
+                self._listening.set()
+                if attempt:
+                    LOG.info('Stock feed listener reconnected, the subscribers are told to read the stock again')
+                    self.bus.reset()
+                attempt = 0
+                self._receive(connection)
+            except (psycopg2.Error, OSError) as e:
+                self._listening.clear()
+                attempt += 1
+                delay = random.uniform(0, min(LISTEN_RETRY_MAX_DELAY, 0.5 * 2 ** (attempt - 1)))
+                LOG.error(f'Stock feed listener failed ({e}), reconnecting in {delay:.1f} seconds')
+                sleep(delay)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _receive(self, connection):
+        while True:
+            if select.select([connection], [], [], LISTEN_POLL_INTERVAL) == ([], [], []):
+                continue
+            connection.poll()
+            events = []
+            while connection.notifies:
+                event_id, payload = connection.notifies.pop(0).payload.split(' ', 1)
+                document = json.loads(payload)
+                events.append(StockEvent(event_id, document.pop('type'), document['product_id'],
+                                         json.dumps(document)))
+            if events:
+                self.bus.publish(events)
+
+
+class StockFeed:
+    """Publication of the stock events recorded on the sessions, locally or through LISTEN/NOTIFY."""
+
+    def __init__(self, bus: StockBus, backend: str, url: str = None, connect_timeout: float = None):
+        self.bus = bus
+        self.backend = backend
+        self._local_ids = itertools.count(1)
+        self._local_prefix = uuid.uuid4().hex[:8]  # Ids of a restarted process never match the ones before
+        self._listener = _Listener(bus, url, connect_timeout) if backend == 'postgres' else None
+
+    @staticmethod
+    def record(session, event_type: str, product_id: int, quantity: int = None, change: int = None):
+        """Record a stock event on `session` (sync or async), published when the session commits."""
+        document = {'product_id': product_id, 'quantity': quantity, 'change': change,
+                    'at': datetime.utcnow().isoformat() + 'Z'}
+        session.info.setdefault(EVENTS_KEY, []).append((event_type, product_id, document))
+
+    def subscribe(self, last_event_id: str = None, product_ids: set = None, loop=None) -> Subscription:
+        if self._listener is not None:
+            self._listener.start()
+        return self.bus.subscribe(last_event_id, product_ids, loop)
+
+    # Session events
+
+    def before_commit(self, session):
+        events = session.info.get(EVENTS_KEY)
+        if events and self.backend == 'postgres':
+            # Delivered to the listeners only if the transaction commits
+            payloads = [json.dumps({'type': event_type, **document}) for event_type, _, document in events]
+            session.execute(text(NOTIFY), {'payloads': payloads})
+
+    def after_commit(self, session):
+        events = session.info.pop(EVENTS_KEY, None)
+        if events and self.backend == 'local':
+            self.bus.publish([StockEvent(f'{self._local_prefix}-{next(self._local_ids)}', event_type, product_id,
+                                         json.dumps(document)) for event_type, product_id, document in events])
+
+    @staticmethod
+    def after_rollback(session):
+        session.info.pop(EVENTS_KEY, None)
+
+
+def subscribers_limit(settings) -> int:
+    """Subscribers allowed per process.
+
+    In the sync mode each subscriber holds one of the WEB_THREADS as long as it streams, STOCK_FEED_RESERVED_THREADS
+    of them are kept for the other requests, the health checks included.
+    """
+    if settings.APP_MODE == 'sync':
+        return max(0, min(settings.STOCK_FEED_MAX_SUBSCRIBERS,
+                          settings.WEB_THREADS - settings.STOCK_FEED_RESERVED_THREADS))
+    return settings.STOCK_FEED_MAX_SUBSCRIBERS
+
+
+def create_feed(settings) -> StockFeed:
+    bus = StockBus(settings.STOCK_FEED_BUFFER_SIZE, settings.STOCK_FEED_QUEUE_SIZE, subscribers_limit(settings))
+    return StockFeed(bus, settings.STOCK_FEED_BACKEND, Config.get_url(), settings.DB_CONNECT_TIMEOUT)
+
+
+stock_feed = create_feed(Config.get_settings())
+
+# Every session publishes its events, the async sessions through their sync session
+event.listen(Session, 'before_commit', stock_feed.before_commit)
+event.listen(Session, 'after_commit', stock_feed.after_commit)
+event.listen(Session, 'after_rollback', stock_feed.after_rollback)
@@ -76,8 +76,22 @@ class Conflict(MyBaseException):
 class InternalServerError(MyBaseException):
     pass
 
+
+class ServiceUnavailable(MyBaseException):
+    msg_fmt = 'Service temporarily unavailable.'
+    title = 'Service Unavailable'
+    code = 503
+
 # Specific exceptions
 
+class InvalidCursor(BadRequest):
+    msg_fmt = 'Invalid pagination cursor %(cursor)s.'
+
+
+class InvalidTimestamp(BadRequest):
+    msg_fmt = 'Invalid %(name)s timestamp %(value)s. Use an ISO 8601 date or date and time.'
+
+
 class UserNotFound(ItemNotFound):
     msg_fmt = 'User %(user_id)s could not be found.'
 
@@ -94,9 +108,25 @@ class ProductSKUAlreadyExist(Conflict):
     msg_fmt = 'Product with SKU %(sku)s already exists.'
 
 
+class ProductImportInvalid(BadRequest):
+    msg_fmt = 'Product import could not be read: %(error)s.'
+
+
 class RestockLogInvalidQuantity(BadRequest):
     msg_fmt = 'Restock log request has invalid quantity %(quantity)i. Quantity must be a positive integer.'
 
 
 class AnalyticsInvalidThreshold(BadRequest):
     msg_fmt = 'Invalid low stock threshold %(threshold)i. Threshold must be a not negative integer.'
+
+
+class AnalyticsInvalidDays(BadRequest):
+    msg_fmt = 'Invalid number of trend days %(days)i. Days must be a positive integer.'
+
+
+class ProfileNotFound(ItemNotFound):
+    msg_fmt = 'Profile %(name)s could not be found in %(format)s format.'
+
+
+class StockFeedFull(ServiceUnavailable):
+    msg_fmt = 'The stock feed has %(subscribers)i subscribers already, retry later or on another instance.'
@@ -0,0 +1,71 @@
+"""
+Gunicorn configuration for running the Inventory Service API in production
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:connex_app
+
+Every setting can be overridden through the environment:
+    PORT                     Port to listen on (default 8080)
+    WEB_CONCURRENCY          Number of worker processes (default 2 * CPUs + 1)
+    WEB_THREADS              Threads per worker serving the Flask views (read by app.py, default 10)
+    WEB_TIMEOUT              Seconds before a silent worker is killed and restarted (default 60)
+    WEB_GRACEFUL_TIMEOUT     Seconds a worker has to finish its in-flight requests on shutdown (default 25)
+    WEB_KEEPALIVE            Seconds an idle keep-alive connection is kept open (default 5)
+    WEB_MAX_REQUESTS         Requests after which a worker is recycled, 0 to disable (default 0)
+    PROMETHEUS_MULTIPROC_DIR Directory where the workers share their Prometheus metrics (default /tmp/prometheus)
+    LOG_FILE                 Log file, one per worker named after its pid (default none, the console only)
+"""
+# pylint: disable=C0103  # Gunicorn settings are lowercase module variables
+import multiprocessing
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# Uvicorn workers, as connexion 3 applications are ASGI applications
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Import the application once in the master, so the workers start faster and share its memory
+preload_app = True
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+# Kubernetes kills the pod 30 seconds after SIGTERM, the workers must be done before that
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 25))
+# Keep it above the idle timeout of the load balancer in front of the service, to avoid resets
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = None
+errorlog = '-'
+# The console is the log of a container. Set before the application is preloaded, as LOG_FILE defaults to app.log.
+os.environ.setdefault('LOG_FILE', '')
+
+# The workers share their metrics through this directory. It is only set for the gunicorn processes: the other
+# commands of the image (migrate.py, import_products.py) keep the single process metrics and need no directory.
+# Metrics files of a previous run must not be summed with the ones of this run.
+# This runs when the configuration is loaded, before the application is preloaded.
+PROMETHEUS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+shutil.rmtree(PROMETHEUS_DIR, ignore_errors=True)
+os.makedirs(PROMETHEUS_DIR, exist_ok=True)
+
+
+def post_fork(server, worker):  # pylint: disable=W0613
+    """Drop the connections inherited from the master, every worker opens its own, and start its log writer."""
+    from db.database import engine  # pylint: disable=C0415
+    from my_config import logging_config  # pylint: disable=C0415
+    engine.dispose(close=False)
+    logging_config.after_fork()
+
+
+def worker_exit(server, worker):  # pylint: disable=W0613
+    """Close the pooled connections of a worker that stops."""
+    from db.database import engine  # pylint: disable=C0415
+    engine.dispose()
+
+
+def child_exit(server, worker):  # pylint: disable=W0613
+    """Stop reporting the live gauges of a worker that exited."""
+    from prometheus_client import multiprocess  # pylint: disable=C0415
+    multiprocess.mark_process_dead(worker.pid)
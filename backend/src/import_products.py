@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Bulk product import command line tool for the Inventory Service API
+
+Usage:
+    python import_products.py products.csv
+    python import_products.py products.jsonl --format ndjson
+    cat products.csv | python import_products.py -
+"""
+import argparse
+import json
+import logging.config
+import sys
+
+from my_config.logging_config import LOGGING_CONFIG
+from db import bulk_import
+
+
+def guess_format(path: str) -> str:
+    return bulk_import.NDJSON if path.endswith(('.ndjson', '.jsonl')) else bulk_import.CSV
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Insert or update products from a CSV or NDJSON file.')
+    parser.add_argument('path', help="CSV or NDJSON file, '-' to read the standard input")
+    parser.add_argument('--format', choices=bulk_import.FORMATS,
+                        help='input format, guessed from the file extension by default')
+    args = parser.parse_args()
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    fmt = args.format or guess_format(args.path)
+
+    if args.path == '-':
+        result = bulk_import.import_products(sys.stdin, fmt)
+    else:
+        with open(args.path, newline='', encoding='utf-8') as lines:
+            result = bulk_import.import_products(lines, fmt)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Deploy-time schema migration entry point for the Inventory Service API
+
+Usage:
+    python migrate.py           Apply all pending migrations
+    python migrate.py --list    Show the pending migrations without applying them
+    python migrate.py --detach-before 2025-01
+                                Detach the restock_logs partitions of the months before January 2025
+"""
+import argparse
+import logging
+import logging.config
+from datetime import datetime
+
+from my_config.logging_config import LOGGING_CONFIG
+from db.database import engine, with_retries
+from db import migrations, partitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply the database schema migrations.')
+    parser.add_argument('--list', action='store_true', help='only list the pending migrations')
+    parser.add_argument('--detach-before', metavar='YYYY-MM', type=lambda value: datetime.strptime(value, '%Y-%m'),
+                        help='only detach the restock_logs partitions of the months before this one')
+    args = parser.parse_args()
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+
+    def list_pending():
+        with engine.connect() as connection:
+            for migration in migrations.pending_migrations(connection):
+                print(f'{migration.version}: {migration.description}')
+            connection.commit()
+
+    if args.list:
+        with_retries(list_pending, 'list the pending migrations')
+    elif args.detach_before:
+        with_retries(lambda: partitions.detach_partitions(engine, args.detach_before), 'detach the old partitions')
+    else:
+        with_retries(lambda: migrations.migrate(engine), 'migrate the database')
+
+
+if __name__ == '__main__':
+    main()
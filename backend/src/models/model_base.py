@@ -5,8 +5,9 @@ import logging
 import uuid
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, func, select, tuple_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 from db.database import db_session
 
 
@@ -78,5 +79,96 @@ class BaseModel:
         user_list = cls.query.order_by(cls.created_at.asc()).all()  # pylint: disable=E1101
         return user_list
 
+    @classmethod
+    def select_fields(cls, fields: list = None):
+        """SELECT of the rows reading only the columns of `fields`, plus the id and created_at keys.
+
+        All the columns are read when `fields` is empty. The other columns are left unloaded: reading them from a
+        row would run one more query.
+        """
+        statement = select(cls)
+        if fields:
+            statement = statement.options(load_only(*(getattr(cls, name) for name in {*fields, 'id', 'created_at'})))
+        return statement
+
+    @classmethod
+    def _page_statement(cls, limit: int, after: tuple = None, statement=None):
+        """Select one row more than the page, to know whether there is a next page."""
+        statement = (select(cls) if statement is None else statement).order_by(cls.created_at.asc(), cls.id.asc())
+        if after:
+            statement = statement.where(tuple_(cls.created_at, cls.id) > after)
+        return statement.limit(limit + 1)
+
+    @staticmethod
+    def _split_page(rows: list, limit: int) -> tuple:
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1].created_at, rows[-1].id)
+
+    @classmethod
+    def get_page(cls, limit: int, after: tuple = None, statement=None) -> tuple:
+        """Get up to `limit` rows ordered by (created_at, id), starting after the `after` key.
+
+        `statement` selects the rows to page through, such as a select_fields() with WHERE conditions, all of them
+        by default. Returns the rows and the (created_at, id) key of the last row, or None if there are no more rows.
+        """
+        rows = db_session.execute(cls._page_statement(limit, after, statement)).scalars().all()
+        return cls._split_page(rows, limit)
+
+    @classmethod
+    def _version_statement(cls):
+        # Two subqueries, so the max is read from the end of the updated_at index and the count from an index-only
+        # scan of it, instead of a sequential scan of the table
+        # pylint: disable=E1102
+        return select(select(func.max(cls.updated_at)).scalar_subquery(),
+                      select(func.count()).select_from(cls).scalar_subquery())
+
+    @classmethod
+    def get_version(cls) -> tuple:
+        """Get (max(updated_at), count) of the table, which changes whenever a row is added, updated or deleted."""
+        return db_session.execute(cls._version_statement()).one()
+
+    # Asyncio variants, used by the async controllers with an AsyncSession
+
+    async def create_async(self, session) -> bool:
+        try:
+            session.add(self)
+            await session.commit()
+            return True
+        except IntegrityError as e:
+            logging.exception(f'create_async : unexpected exception : {e}')
+            await session.rollback()
+            return False
+        except Exception as e:  # pylint: disable=W0718
+            logging.exception(f'create_async : unexpected exception : {e}')
+            await session.rollback()
+            raise e
+
+    async def update_async(self, session, _: dict) -> bool:
+        try:
+            await session.commit()
+            return True
+        except IntegrityError:
+            await session.rollback()
+            return False
+        except Exception as e:  # pylint: disable=W0718
+            logging.exception(f'update_async : unexpected exception : {e}')
+            await session.rollback()
+            raise e
+
+    @classmethod
+    async def get_by_id_async(cls, session, id_: int):
+        return await session.get(cls, id_)
+
+    @classmethod
+    async def get_page_async(cls, session, limit: int, after: tuple = None, statement=None) -> tuple:
+        rows = (await session.execute(cls._page_statement(limit, after, statement))).scalars().all()
+        return cls._split_page(rows, limit)
+
+    @classmethod
+    async def get_version_async(cls, session) -> tuple:
+        return (await session.execute(cls._version_statement())).one()
+
     def __repr__(self):
         return f'<{self.__class__.__name__} {self.name} (ID: {self.id})>'
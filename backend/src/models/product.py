@@ -1,20 +1,45 @@
 """
 SQLAlchemy models for the Product Service API
 """
-from sqlalchemy import Column, String, Text, Integer, Double
-from db.database import Base
+import logging
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, String, Text, Integer, Double, Index, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from db.cache import product_cache
+from db.database import Base, db_session
+from db.stock_feed import PRODUCT_DELETED, STOCK_UPDATED, stock_feed
 
 from models.model_base import BaseModel
 
 
+# Fields of the product representation, in their order
+FIELDS = ('id', 'uuid', 'name', 'sku', 'description', 'quantity', 'price', 'created_at', 'updated_at')
+
+
+def _escape_like(value: str) -> str:
+    """Escape the LIKE wildcards of `value`, with a backslash."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
 class Product(BaseModel, Base):
     """Product model."""
 
     __tablename__ = 'products'
+    # The trigram index of the name filter (ix_products_name_trgm) needs the pg_trgm extension, so it is only
+    # created by migration 7, when the extension is available
+    __table_args__ = (
+        Index('uq_products_sku', 'sku', unique=True),
+        Index('ix_products_created_at_id', 'created_at', 'id'),
+        Index('ix_products_sku_pattern', 'sku', postgresql_ops={'sku': 'varchar_pattern_ops'}),
+        Index('ix_products_price', 'price'),
+        Index('ix_products_updated_at', 'updated_at'),
+    )
 
     sku = Column(String(100), nullable=False)
     description = Column(Text)
-    quantity = Column(Integer, default=0, nullable=False)
+    quantity = Column(Integer, default=0, nullable=False, index=True)
     price = Column(Double, default=0, nullable=False)
 
     def __init__(self, data: dict):
@@ -24,31 +49,159 @@ class Product(BaseModel, Base):
         self.quantity = data.get('quantity', 0)
         self.price = data.get('price', 0)
 
-    def update(self, data: dict, commit: bool = True) -> bool:
+    def _set_fields(self, session, data: dict):
         # Update fields if provided
+        if 'quantity' in data and data['quantity'] != self.quantity:
+            stock_feed.record(session, STOCK_UPDATED, self.id, data['quantity'], data['quantity'] - self.quantity)
         for key in ['name', 'sku', 'description', 'quantity', 'price']:
             if key in data:
                 setattr(self, key, data[key])
-        return super().update(data)
-
-    def to_dict(self):
-        """Convert to dictionary."""
-        return {
-            'id': self.id,
-            'uuid': self.uuid,
-            'name': self.name,
-            'sku': self.sku,
-            'description': self.description,
-            'quantity': self.quantity,
-            'price': self.price,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-        }
+
+    def update(self, data: dict, commit: bool = True) -> bool:
+        self._set_fields(db_session, data)
+        try:
+            return super().update(data)
+        finally:
+            product_cache.delete(self.id)
+
+    async def update_async(self, session, data: dict) -> bool:
+        self._set_fields(session, data)
+        try:
+            return await super().update_async(session, data)
+        finally:
+            product_cache.delete(self.id)
+
+    def to_dict(self, fields: list = None):
+        """Convert to dictionary, with only the `fields` when given."""
+        return {field: getattr(self, field) for field in FIELDS if not fields or field in fields}
+
+    @classmethod
+    def delete_by_id(cls, id_: int) -> bool:
+        """Delete a product with a single statement, its restock logs are removed by ON DELETE CASCADE.
+
+        Returns False if the product does not exist.
+        """
+        try:
+            deleted = db_session.execute(delete(cls).where(cls.id == id_)).rowcount
+            if deleted:
+                stock_feed.record(db_session, PRODUCT_DELETED, id_)
+            db_session.commit()
+            product_cache.delete(id_)
+            return deleted > 0
+        except Exception as e:  # pylint: disable=W0718
+            logging.exception(f'delete_by_id : unexpected exception : {e}')
+            db_session.rollback()
+            raise e
+
+    @classmethod
+    def _insert_statement(cls, records: list):
+        # The column defaults of the ORM do not apply to a multi-row INSERT, so they are set here
+        now = datetime.utcnow()
+        rows = [{'uuid': str(uuid.uuid4()), 'name': record.get('name'), 'sku': record.get('sku'),
+                 'description': record.get('description', ''), 'quantity': record.get('quantity', 0),
+                 'price': record.get('price', 0), 'created_at': now, 'updated_at': now} for record in records]
+        return insert(cls).values(rows).on_conflict_do_nothing(index_elements=['sku']).returning(cls)
+
+    @classmethod
+    def create_many(cls, records: list) -> dict:
+        """Create products with a single INSERT ... ON CONFLICT (sku) DO NOTHING RETURNING statement.
+
+        The unique index on sku makes concurrent creates safe: records whose SKU already exists, or appears earlier
+        in `records`, are skipped.
+
+        Returns the created products by SKU, as dictionaries.
+        """
+        try:
+            # Converted before the commit expires them, which would reload every product
+            products = [p.to_dict() for p in db_session.execute(cls._insert_statement(records)).scalars()]
+            db_session.commit()
+            return {product['sku']: product for product in products}
+        except Exception as e:  # pylint: disable=W0718
+            logging.exception(f'create_many : unexpected exception : {e}')
+            db_session.rollback()
+            raise e
+
+    @classmethod
+    def select_filtered(cls, filters: dict, fields: list = None):
+        """SELECT of the products matching `filters`, reading only the columns of `fields` when given."""
+        return cls.select_fields(fields).where(*cls.filter_conditions(filters))
+
+    @classmethod
+    def filter_conditions(cls, filters: dict) -> list:
+        """WHERE conditions of the product filters of GET /api/products, each one backed by an index.
+
+        `name` matches a case-insensitive substring of the name (trigram index), `sku_prefix` the start of the SKU
+        (varchar_pattern_ops index, which works whatever the collation) and min/max_price and min/max_quantity are
+        inclusive bounds (btree indexes).
+        """
+        conditions = []
+        if filters.get('name'):
+            conditions.append(cls.name.ilike(f'%{_escape_like(filters["name"])}%', escape='\\'))
+        if filters.get('sku_prefix'):
+            conditions.append(cls.sku.like(f'{_escape_like(filters["sku_prefix"])}%', escape='\\'))
+        if filters.get('min_price') is not None:
+            conditions.append(cls.price >= filters['min_price'])
+        if filters.get('max_price') is not None:
+            conditions.append(cls.price <= filters['max_price'])
+        if filters.get('min_quantity') is not None:
+            conditions.append(cls.quantity >= filters['min_quantity'])
+        if filters.get('max_quantity') is not None:
+            conditions.append(cls.quantity <= filters['max_quantity'])
+        return conditions
+
+    @classmethod
+    def get_cached(cls, id_: int):
+        """Get a product as a dictionary, through the product cache.
+
+        Returns None if the product does not exist.
+        """
+        def load():
+            product = cls.get_by_id(id_)
+            return product.to_dict() if product else None
+        return product_cache.get_or_load(id_, load)
 
     @classmethod
     def get_by_sku(cls, sku):
         return cls.query.filter_by(sku=sku).first()
 
+    # Asyncio variants, used by the async controllers with an AsyncSession
+
+    @classmethod
+    async def get_cached_async(cls, session, id_: int):
+        async def load():
+            product = await cls.get_by_id_async(session, id_)
+            return product.to_dict() if product else None
+        return await product_cache.get_or_load_async(id_, load)
+
+    @classmethod
+    async def create_many_async(cls, session, records: list) -> dict:
+        try:
+            products = [p.to_dict() for p in (await session.execute(cls._insert_statement(records))).scalars()]
+            await session.commit()
+            return {product['sku']: product for product in products}
+        except Exception as e:  # pylint: disable=W0718
+            logging.exception(f'create_many_async : unexpected exception : {e}')
+            await session.rollback()
+            raise e
+
+    @classmethod
+    async def get_by_sku_async(cls, session, sku):
+        return (await session.execute(select(cls).where(cls.sku == sku))).scalars().first()
+
+    @classmethod
+    async def delete_by_id_async(cls, session, id_: int) -> bool:
+        try:
+            deleted = (await session.execute(delete(cls).where(cls.id == id_))).rowcount
+            if deleted:
+                stock_feed.record(session, PRODUCT_DELETED, id_)
+            await session.commit()
+            product_cache.delete(id_)
+            return deleted > 0
+        except Exception as e:  # pylint: disable=W0718
+            logging.exception(f'delete_by_id_async : unexpected exception : {e}')
+            await session.rollback()
+            raise e
+
     @classmethod
     def get_low_quantity(cls, threshold: int):
         return cls.query.filter(cls.quantity < threshold).all()
@@ -2,24 +2,37 @@
 SQLAlchemy model for RestockLog entity
 """
 import logging
-from datetime import datetime
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
-from db.database import Base
+from datetime import datetime, timedelta
+from sqlalchemy import (Column, Integer, Text, DateTime, ForeignKey, Index, cast, column, func, insert,
+                        literal_column, select, true, update, values)
+from db.cache import product_cache
+from db.database import Base, db_session
+from db.stock_feed import STOCK_RESTOCKED, stock_feed
 from models.model_base import BaseModel
+from models.product import Product
 
 LOG = logging.getLogger(__name__)
 
+# Fields of the restock log representation, in their order
+FIELDS = ('id', 'product_id', 'quantity', 'reason', 'restocked_at')
+
 
 class RestockLog(BaseModel, Base):
-    """RestockLog model."""
+    """RestockLog model.
+
+    The table is partitioned by month of restocked_at once migrated, see db/partitions.py.
+    """
 
     __tablename__ = 'restock_logs'
+    __table_args__ = (
+        Index('ix_restock_logs_created_at_id', 'created_at', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
     quantity = Column(Integer, nullable=False)
     reason = Column(Text, nullable=True)
-    restocked_at = Column(DateTime, default=datetime.utcnow)
+    restocked_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # The partition key
 
     def __init__(self, data: dict):
         super().__init__('')
@@ -27,17 +40,228 @@ class RestockLog(BaseModel, Base):
         self.quantity = data.get('quantity')
         self.reason = data.get('reason')
 
-    def to_dict(self):
-        """Convert restock log to dictionary."""
-        return {
-            'id': self.id,
-            'product_id': self.product_id,
-            'quantity': self.quantity,
-            'reason': self.reason,
-            'restocked_at': self.restocked_at.isoformat() if self.restocked_at else None
-        }
+    def to_dict(self, fields: list = None):
+        """Convert restock log to dictionary, with only the `fields` when given."""
+        restock_log = {field: getattr(self, field) for field in FIELDS if not fields or field in fields}
+        if restock_log.get('restocked_at'):
+            restock_log['restocked_at'] = restock_log['restocked_at'].isoformat()
+        return restock_log
+
+    @staticmethod
+    def _restock_statement(product_id: int, quantity: int):
+        return (
+            update(Product)
+            .where(Product.id == product_id)
+            .values(quantity=Product.quantity + quantity)
+            .returning(Product)
+            .execution_options(populate_existing=True)
+        )
+
+    @classmethod
+    def restock_product(cls, product_id: int, quantity: int, reason: str = None):
+        """Add `quantity` to the product stock and log the restock, in a single transaction.
+
+        The increment is done by the database (UPDATE ... RETURNING), so concurrent restocks never lose updates.
+        Returns the updated product, or None if it does not exist.
+        """
+        try:
+            product = db_session.execute(cls._restock_statement(product_id, quantity)).scalars().first()
+            if product is None:
+                db_session.rollback()
+                return None
+            db_session.add(cls({'product_id': product_id, 'quantity': quantity, 'reason': reason}))
+            stock_feed.record(db_session, STOCK_RESTOCKED, product_id, product.quantity, quantity)
+            db_session.commit()
+            product_cache.delete(product_id)
+            return product
+        except Exception as e:  # pylint: disable=W0718
+            LOG.exception(f'restock_product : unexpected exception : {e}')
+            db_session.rollback()
+            raise e
+
+    @staticmethod
+    def _totals(items: list) -> dict:
+        totals = {}
+        for item in items:
+            totals[item['product_id']] = totals.get(item['product_id'], 0) + item['quantity']
+        return totals
+
+    @staticmethod
+    def _lock_statement(totals: dict):
+        # The UPDATE locks the rows in the order of its join, so concurrent batches could deadlock. Locking them by
+        # id first makes every batch take the locks in the same order.
+        return select(Product.id).where(Product.id.in_(totals)).order_by(Product.id).with_for_update()
+
+    @staticmethod
+    def _restock_many_statement(totals: dict):
+        increments = values(column('id', Integer), column('quantity', Integer), name='increments').data(
+            list(totals.items()))
+        return (
+            update(Product)
+            .where(Product.id == increments.c.id)
+            .values(quantity=Product.quantity + increments.c.quantity)
+            .returning(Product.id, Product.quantity)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def _record_restocks(session, totals: dict, quantities: dict):
+        for product_id, quantity in quantities.items():
+            stock_feed.record(session, STOCK_RESTOCKED, product_id, quantity, totals[product_id])
+
+    @staticmethod
+    def _restock_logs(items: list, quantities: dict) -> list:
+        return [
+            {'name': '', 'product_id': item['product_id'], 'quantity': item['quantity'], 'reason': item.get('reason')}
+            for item in items if item['product_id'] in quantities
+        ]
+
+    @classmethod
+    def restock_products(cls, items: list) -> dict:
+        """Apply many restocks in a single transaction with set-based statements.
+
+        `items` are dicts with product_id, quantity and an optional reason. All the increments are applied by one
+        UPDATE ... FROM (VALUES ...) and the logs are inserted with one executemany. Restocks of unknown products
+        are skipped. The rows are locked by id first, so concurrent batches do not deadlock.
+
+        Returns the new quantity of every restocked product, by product ID.
+        """
+        try:
+            totals = cls._totals(items)
+            db_session.execute(cls._lock_statement(totals))
+            quantities = dict(db_session.execute(cls._restock_many_statement(totals)).all())
+            logs = cls._restock_logs(items, quantities)
+            if logs:
+                db_session.execute(insert(cls), logs)
+            cls._record_restocks(db_session, totals, quantities)
+            db_session.commit()
+            product_cache.delete(*quantities)
+            return quantities
+        except Exception as e:  # pylint: disable=W0718
+            LOG.exception(f'restock_products : unexpected exception : {e}')
+            db_session.rollback()
+            raise e
 
     @classmethod
     def get_by_product_id(cls, id_: int):
         restock_log = cls.query.filter(cls.product_id == id_).all()  # pylint: disable=E1101
         return restock_log
+
+    @classmethod
+    def filter_conditions(cls, filters: dict) -> list:
+        """WHERE conditions of the history filters: product_id, and since and until bounds of restocked_at.
+
+        Bounds of restocked_at only read the partitions of their months.
+        """
+        conditions = []
+        if filters.get('product_id') is not None:
+            conditions.append(cls.product_id == filters['product_id'])
+        if filters.get('since') is not None:
+            conditions.append(cls.restocked_at >= filters['since'])
+        if filters.get('until') is not None:
+            conditions.append(cls.restocked_at < filters['until'])
+        return conditions
+
+    @classmethod
+    def select_history(cls, filters: dict = None, fields: list = None):
+        """SELECT of the restock logs matching `filters`, in creation order, with the columns of `fields`."""
+        return cls.select_fields(fields).where(*cls.filter_conditions(filters or {})).order_by(cls.created_at.asc())
+
+    @classmethod
+    def get_all(cls, fields: list = None, filters: dict = None) -> list:
+        """Get the restock logs matching `filters`, reading only the columns of `fields` when given."""
+        return db_session.execute(cls.select_history(filters, fields)).scalars().all()
+
+    @classmethod
+    def iter_all(cls, batch_size: int = 1000, fields: list = None, filters: dict = None):
+        """Iterate over the restock logs matching `filters` through a server-side cursor, `batch_size` rows at a time.
+
+        Only the columns of `fields` are read when given. The query runs on the first iteration, so a streamed
+        response reads the rows while it is sent.
+        """
+        statement = cls.select_history(filters, fields).execution_options(yield_per=batch_size)
+        yield from db_session.execute(statement).scalars()
+
+    # Asyncio variants, used by the async controllers with an AsyncSession
+
+    @classmethod
+    async def restock_product_async(cls, session, product_id: int, quantity: int, reason: str = None):
+        try:
+            product = (await session.execute(cls._restock_statement(product_id, quantity))).scalars().first()
+            if product is None:
+                await session.rollback()
+                return None
+            session.add(cls({'product_id': product_id, 'quantity': quantity, 'reason': reason}))
+            stock_feed.record(session, STOCK_RESTOCKED, product_id, product.quantity, quantity)
+            await session.commit()
+            product_cache.delete(product_id)
+            return product
+        except Exception as e:  # pylint: disable=W0718
+            LOG.exception(f'restock_product_async : unexpected exception : {e}')
+            await session.rollback()
+            raise e
+
+    @classmethod
+    async def restock_products_async(cls, session, items: list) -> dict:
+        try:
+            totals = cls._totals(items)
+            await session.execute(cls._lock_statement(totals))
+            quantities = dict((await session.execute(cls._restock_many_statement(totals))).all())
+            logs = cls._restock_logs(items, quantities)
+            if logs:
+                await session.execute(insert(cls), logs)
+            cls._record_restocks(session, totals, quantities)
+            await session.commit()
+            product_cache.delete(*quantities)
+            return quantities
+        except Exception as e:  # pylint: disable=W0718
+            LOG.exception(f'restock_products_async : unexpected exception : {e}')
+            await session.rollback()
+            raise e
+
+    @classmethod
+    async def stream_all_async(cls, session, batch_size: int = 1000, fields: list = None, filters: dict = None):
+        """Iterate asynchronously over the restock logs matching `filters` through a server-side cursor."""
+        statement = cls.select_history(filters, fields).execution_options(yield_per=batch_size)
+        return await session.stream_scalars(statement)
+
+    @classmethod
+    def get_daily_stock_levels(cls, days: int, product_id: int = None) -> list:
+        """Get the stock level of each product at the end of each of the last `days` days (UTC).
+
+        The level of a day is the current quantity minus everything restocked after that day. It is
+        computed in one query: restocks are bucketed per day and a window function sums them backwards.
+
+        Returns rows of (product_id, product_name, day, quantity) ordered by product and day.
+        """
+        end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = end - timedelta(days=days - 1)
+        restock_day = func.date_trunc(literal_column("'day'"), cls.restocked_at)
+
+        calendar = select(func.generate_series(start, end, timedelta(days=1)).label('day')).subquery('calendar')
+        daily = (
+            select(cls.product_id, restock_day.label('day'), func.sum(cls.quantity).label('restocked'))
+            .where(cls.restocked_at >= start)
+            .group_by(cls.product_id, restock_day)
+        )
+        if product_id is not None:
+            daily = daily.where(cls.product_id == product_id)
+        daily = daily.subquery('daily')
+
+        restocked_later = func.sum(func.coalesce(daily.c.restocked, 0)).over(
+            partition_by=Product.id,
+            order_by=calendar.c.day.desc(),
+            rows=(None, -1),
+        )
+        quantity = cast(func.greatest(Product.quantity - func.coalesce(restocked_later, 0), 0), Integer)
+
+        query = (
+            select(Product.id, Product.name, calendar.c.day, quantity.label('quantity'))
+            .select_from(Product)
+            .join(calendar, true())
+            .outerjoin(daily, (daily.c.product_id == Product.id) & (daily.c.day == calendar.c.day))
+            .order_by(Product.id, calendar.c.day)
+        )
+        if product_id is not None:
+            query = query.where(Product.id == product_id)
+        return db_session.execute(query).all()
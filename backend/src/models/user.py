@@ -1,7 +1,7 @@
 """
 SQLAlchemy models for the User Service API
 """
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, Index
 from db.database import Base
 
 from models.model_base import BaseModel
@@ -11,6 +11,10 @@ class User(BaseModel, Base):
     """User model."""
 
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_created_at_id', 'created_at', 'id'),
+        Index('ix_users_updated_at', 'updated_at'),
+    )
 
     email = Column(String(100), nullable=False, unique=True)
     phone = Column(String(20), nullable=True)
@@ -30,7 +34,7 @@ class User(BaseModel, Base):
     def to_dict(self):
         """Convert to dictionary."""
         return {
-            # 'id': self.id,
+            'id': self.id,
             'uuid': self.uuid,
             'name': self.name,
             'email': self.email,
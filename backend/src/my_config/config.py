@@ -1,6 +1,8 @@
 """
 Configuration settings for the User Service API
 """
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -11,6 +13,88 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_PORT: int
 
+    # Connection pool, 'null' opens a connection per request (for use behind PgBouncer)
+    DB_POOL_MODE: Literal['queue', 'null'] = 'queue'
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # Seconds after which a connection is replaced, -1 to keep it forever
+    DB_POOL_PRE_PING: bool = True  # Test connections on checkout, to survive database failovers
+    DB_CONNECT_TIMEOUT: int = 5  # Seconds to wait for a new connection, so an unreachable database fails fast
+
+    # /health/ready checks the database at most once per READINESS_CACHE_TTL seconds in each process, the
+    # async probe gives up after READINESS_TIMEOUT seconds (the sync one after DB_CONNECT_TIMEOUT)
+    READINESS_CACHE_TTL: float = 1
+    READINESS_TIMEOUT: float = 2
+
+    # Read-through cache of products, shared by the processes in Redis when CACHE_REDIS_URL is set (needs the redis
+    # package). Enabled by default only then: with CACHE_ENABLED=true and no Redis, each process keeps its own LRU
+    # and the other workers may serve a product that changed up to CACHE_TTL seconds ago.
+    CACHE_ENABLED: Optional[bool] = None
+    CACHE_MAX_SIZE: int = 10000  # Entries per process
+    CACHE_TTL: float = 30  # Seconds
+    CACHE_REDIS_URL: Optional[str] = None
+
+    # Response bodies are encoded with orjson ('orjson') or with the json module, indented ('json').
+    # Response validation checks every body against the spec ('full', what the tests expect), a random
+    # RESPONSE_VALIDATION_SAMPLE_RATE fraction of them ('sampled') or none ('off').
+    JSON_ENCODER: Literal['orjson', 'json'] = 'orjson'
+    RESPONSE_VALIDATION: Literal['full', 'sampled', 'off'] = 'full'
+    RESPONSE_VALIDATION_SAMPLE_RATE: float = 0.01
+
+    # 'async' serves the API with an asyncio application and an asyncpg session, so a process can hold many
+    # requests waiting on the database. Operations without an async controller run in a thread pool.
+    APP_MODE: Literal['sync', 'async'] = 'sync'
+
+    # Requests running more SQL statements than this are logged with their slowest statement, 0 to never log
+    QUERY_BUDGET: int = 20
+
+    # Profiling of the requests sent with the X-Profile header, or of a random sample of them. The last
+    # PROFILING_MAX_PROFILES profiles of each process are kept in PROFILING_DIR, see /api/profiles.
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0
+    PROFILING_INTERVAL: float = 0.005  # Seconds between two stack samples
+    PROFILING_DIR: str = '/tmp/profiles'
+    PROFILING_MAX_PROFILES: int = 50
+
+    # Logging, see my_config/logging_config.py. The records are written by a background thread, as JSON lines
+    # ('json') or text ('text'), to the console and to LOG_FILE (unless empty, gunicorn workers write
+    # LOG_FILE.<pid>). Below WARNING, each logger keeps the LOG_SAMPLE_RATES fraction of its records (a JSON object
+    # such as {"controllers.restock": 0.1}) and at most LOG_RATE_LIMIT records per second (0 for no limit), in
+    # bursts of up to LOG_RATE_BURST.
+    LOG_FORMAT: Literal['json', 'text'] = 'json'
+    LOG_FILE: Optional[str] = 'app.log'
+    LOG_QUEUE_SIZE: int = 10000  # Records waiting to be written, the next ones are dropped
+    LOG_SAMPLE_RATES: dict[str, float] = {}
+    LOG_RATE_LIMIT: float = 0
+    LOG_RATE_BURST: int = 500
+
+    # Response compression. Bodies of at least COMPRESSION_MIN_SIZE bytes are encoded with the first of
+    # COMPRESSION_ENCODINGS the client accepts best; 'br' needs the brotli package and 'zstd' the zstandard one.
+    # The levels range from 1 to 9 for gzip, 0 to 11 for brotli and 1 to 22 for zstd.
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_ENCODINGS: list[Literal['zstd', 'br', 'gzip']] = ['zstd', 'br', 'gzip']
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_LEVEL: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
+    # Stock change feed of /api/stream/stock, see db/stock_feed.py. 'postgres' fans the events out to every
+    # process with LISTEN/NOTIFY, 'local' only to the subscribers of the process that wrote them (single process).
+    # Each process keeps the last STOCK_FEED_BUFFER_SIZE events for the clients resuming from an event id, and
+    # disconnects the subscribers with more than STOCK_FEED_QUEUE_SIZE events waiting to be sent. In the sync
+    # mode every subscriber holds one of the WEB_THREADS, so at most WEB_THREADS - STOCK_FEED_RESERVED_THREADS
+    # subscribe, use the async mode for many subscribers.
+    STOCK_FEED_BACKEND: Literal['postgres', 'local'] = 'postgres'
+    STOCK_FEED_BUFFER_SIZE: int = 1000
+    STOCK_FEED_QUEUE_SIZE: int = 100
+    STOCK_FEED_MAX_SUBSCRIBERS: int = 100  # Per process, more are answered with 503
+    STOCK_FEED_HEARTBEAT: float = 15  # Seconds between two keep-alive comments of an idle stream
+    STOCK_FEED_RESERVED_THREADS: int = 2  # Sync mode: threads never held by subscribers
+
+    # Threads per worker process serving the Flask views, keep it close to DB_POOL_SIZE + DB_MAX_OVERFLOW
+    WEB_THREADS: int = 10
+
 
 class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
@@ -26,3 +110,11 @@ class Config:
         db_name = settings.POSTGRES_DB
         url = f'postgresql://{user}:{pw}@{host}:{port}/{db_name}'
         return url
+
+    @staticmethod
+    def get_async_url():
+        return Config.get_url().replace('postgresql://', 'postgresql+asyncpg://', 1)
+
+    @staticmethod
+    def get_settings() -> Settings:
+        return Settings()
@@ -1,42 +1,202 @@
+"""
+Logging configuration for the Inventory Service API
+
+The loggers only put their records on a bounded in-memory queue. A listener thread formats them, as JSON lines or
+as text (LOG_FORMAT), and writes them to the console and to LOG_FILE, so a request never waits on a write or on the
+rotation of the file. The cost of a record on the request thread is bounded by the filter and the enqueue: when the
+queue is full the record is dropped instead of blocking. Under gunicorn the logs only go to the console by default;
+with LOG_FILE set, each worker writes its own file, named with its pid before the extension.
+
+Records below WARNING can be sampled per logger (LOG_SAMPLE_RATES) and rate limited per logger (LOG_RATE_LIMIT
+records per second, in bursts of up to LOG_RATE_BURST, off by default). Dropped records are counted in
+log_records_dropped_total.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from time import monotonic
+
+from prometheus_client import Counter
+
+from my_config.config import Config
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE_MAX_BYTES = 10485760  # 10 MB
+LOG_FILE_BACKUP_COUNT = 5
+
+DROPPED_RECORDS = Counter('log_records_dropped_total', 'Number of log records dropped before being written',
+                          ['logger', 'reason'])
+
+# Attributes of every LogRecord, the other ones come from the `extra` argument of the logging call
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the `extra` fields of the logging call."""
+
+    def format(self, record):
+        document = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        document.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            document['exception'] = record.exc_text
+        return json.dumps(document, default=str)
+
+
+class LogLimiter(logging.Filter):
+    """Sampling and token bucket rate limit of the records below WARNING, per logger.
+
+    `sample_rates` maps logger names to the fraction of their records to keep, it applies to their child loggers
+    too. A `rate` of 0 disables the rate limit.
+    """
+
+    def __init__(self, rate: float, burst: int, sample_rates: dict):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_rates = sample_rates
+        self._logger_rates = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _sample_rate(self, name: str) -> float:
+        if name not in self._logger_rates:
+            parents = [logger for logger in self.sample_rates if name == logger or name.startswith(logger + '.')]
+            self._logger_rates[name] = self.sample_rates[max(parents, key=len)] if parents else 1
+        return self._logger_rates[name]
+
+    def _take_token(self, name: str) -> bool:
+        now = monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(name, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[name] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if random.random() >= self._sample_rate(record.name):
+            DROPPED_RECORDS.labels(record.name, 'sampled').inc()
+            return False
+        if self.rate and not self._take_token(record.name):
+            DROPPED_RECORDS.labels(record.name, 'rate_limited').inc()
+            return False
+        return True
+
+
+class QueueListenerHandler(logging.handlers.QueueHandler):
+    """Queue handler running its own listener thread, which writes the records to `handlers`."""
+
+    def __init__(self, handlers: list, queue_size: int):
+        self.handlers = handlers
+        self.queue_size = queue_size
+        super().__init__(queue.Queue(queue_size))
+        self.listener = None
+        self.start()
+
+    def start(self):
+        """Start the listener on a new queue, also in a forked worker, which does not inherit the thread."""
+        self.queue = queue.Queue(self.queue_size)
+        self.listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        # The message and the traceback are rendered here, as the arguments may change once the call returns.
+        # Unlike QueueHandler.prepare, the traceback is kept apart from the message, for the JSON output.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_RECORDS.labels(record.name, 'queue_full').inc()
+
+    def close(self):
+        """Write the queued records and close the handlers, when logging is shut down or reconfigured."""
+        if self.listener is None:
+            return
+        try:
+            self.listener.stop()
+        except queue.Full:
+            pass  # The listener could not be told to stop, the records still queued are lost
+        self.listener = None
+        for handler in self.handlers:
+            handler.close()
+        super().close()
+
+
+def queue_handler():
+    """The handler of the root logger, built from the LOG_* settings."""
+    settings = Config.get_settings()
+    formatter = JsonFormatter() if settings.LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if settings.LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            settings.LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    handler = QueueListenerHandler(handlers, settings.LOG_QUEUE_SIZE)
+    handler.addFilter(LogLimiter(settings.LOG_RATE_LIMIT, settings.LOG_RATE_BURST, settings.LOG_SAMPLE_RATES))
+    return handler
+
+
+def worker_handler(handler: logging.Handler) -> logging.Handler:
+    """The handler to use in a forked process: its own log file, processes rotating the same file lose records."""
+    if not isinstance(handler, logging.handlers.RotatingFileHandler):
+        return handler
+    root, extension = os.path.splitext(handler.baseFilename)
+    worker_file = logging.handlers.RotatingFileHandler(
+        f'{root}.{os.getpid()}{extension}', maxBytes=handler.maxBytes, backupCount=handler.backupCount)
+    worker_file.setFormatter(handler.formatter)
+    handler.close()
+    return worker_file
+
+
+def after_fork():
+    """Restart the listener threads in a forked process, writing to a log file of its own."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, QueueListenerHandler):
+            handler.handlers = [worker_handler(target) for target in handler.handlers]
+            handler.start()
+
+
 LOGGING_CONFIG = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'standard': {
-            'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        },
-    },
     'handlers': {
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
-            'formatter': 'standard',
-            'stream': 'ext://sys.stdout'
-        },
-        'file': {
+        'queue': {
+            '()': queue_handler,
             'level': 'INFO',
-            'class': 'logging.handlers.RotatingFileHandler',
-            'formatter': 'standard',
-            'filename': 'app.log',
-            'maxBytes': 10485760,  # 10 MB
-            'backupCount': 5,
         },
     },
     'loggers': {
         '': {  # root logger
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': True
         },
-        'app': {  # specific logger for your Flask app
-            'handlers': ['console'],
-            'level': 'INFO',
-            'propagate': False  # Prevent messages from propagating to root if handled here
-        },
-        'controllers.users': {  # specific logger for your users controller
-            'handlers': ['console'],
-            'level': 'INFO',
-            'propagate': False
-        },
     }
 }
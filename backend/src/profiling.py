@@ -0,0 +1,273 @@
+"""
+On-demand request profiling for the Inventory Management API
+
+With PROFILING_ENABLED, a request sent with the X-Profile header (or a random PROFILING_SAMPLE_RATE fraction of the
+requests) runs under two profilers, from the security and validation middlewares through the controller and the
+ORM to the serialization of the response:
+- cProfile, saved in pstats format (`python -m pstats`, snakeviz),
+- a stack sampler, saved as collapsed stacks (flamegraph.pl, speedscope).
+Each profile is named in the X-Profile-Id response header and stored in PROFILING_DIR, which keeps the last
+PROFILING_MAX_PROFILES profiles.
+
+One request per process is profiled at a time; other requests asking for a profile meanwhile are served without
+one. The profilers follow the request into its worker threads, but work of concurrent requests running in the
+same threads (such as the event loop) shows up in its profile too.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from connexion.middleware.abstract import ROUTING_CONTEXT
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+
+from my_config.config import Config
+
+LOG = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PSTATS = 'pstats'
+COLLAPSED = 'collapsed'
+FORMATS = {PSTATS: '.prof', COLLAPSED: '.collapsed'}
+METADATA = '.json'
+PROFILE_NAME = re.compile(r'^[\w-]+$')
+
+
+class Profiler:
+    """cProfile and stack sampler of the threads working for one request."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.threads = set()
+        self.profiles = []
+        self.samples = Counter()
+        self._first_profile = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='profiler-sampler', daemon=True)
+
+    def start(self):
+        """Start profiling the current thread and sampling the stacks of the request threads."""
+        self._first_profile = self.attach()
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.detach(self._first_profile)
+
+    def attach(self):
+        """Start profiling the current thread, returns the profile to pass to detach()."""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            profile = None  # Since Python 3.12 the profile of the first thread already covers every thread
+        self.threads.add(threading.get_ident())
+        return profile
+
+    def detach(self, profile):
+        self.threads.discard(threading.get_ident())
+        if profile:
+            profile.disable()
+            self.profiles.append(profile)
+
+    @contextmanager
+    def thread(self):
+        """Profile the current thread while it works for the request."""
+        profile = self.attach()
+        try:
+            yield
+        finally:
+            self.detach(profile)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()  # pylint: disable=W0212
+            for ident in list(self.threads):
+                if ident in frames:
+                    self.samples[self._stack(frames[ident])] += 1
+
+    @staticmethod
+    def _stack(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def dump_stats(self, path: str) -> bool:
+        """Save the merged cProfile stats, returns False when nothing was recorded."""
+        stats = None
+        for profile in self.profiles:
+            try:
+                stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+            except TypeError:
+                continue  # No call recorded in that thread
+        if stats is None:
+            return False
+        stats.dump_stats(path)
+        return True
+
+    def dump_collapsed(self, path: str):
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in self.samples.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+_current_profiler: ContextVar[Profiler] = ContextVar('profiler', default=None)
+_profiling = threading.Lock()
+
+
+@contextmanager
+def profile_thread():
+    """Profile the current worker thread if it works for the request being profiled."""
+    profiler = _current_profiler.get()
+    if profiler is None or threading.get_ident() in profiler.threads:
+        yield
+        return
+    with profiler.thread():
+        yield
+
+
+def profiled_wsgi(app):
+    """WSGI application running `app` under profile_thread(), including the iteration of its response."""
+    def wrapper(environ, start_response):
+        with profile_thread():
+            iterable = app(environ, start_response)
+            try:
+                yield from iterable
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+    return wrapper
+
+
+class ProfileStore:
+    """Directory of the last `max_profiles` profiles, each saved as pstats, collapsed stacks and metadata."""
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, name: str, suffix: str) -> str:
+        return os.path.join(self.directory, name + suffix)
+
+    def _names(self) -> list:
+        """Names of the stored profiles, oldest first (names start with their time)."""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(f[:-len(METADATA)] for f in files if f.endswith(METADATA))
+
+    def save(self, name: str, profiler: Profiler, metadata: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        formats = []
+        if profiler.dump_stats(self._path(name, FORMATS[PSTATS])):
+            formats.append(PSTATS)
+        profiler.dump_collapsed(self._path(name, FORMATS[COLLAPSED]))
+        formats.append(COLLAPSED)
+        # The metadata file is written last, a profile is only listed once complete
+        with open(self._path(name, METADATA), 'w', encoding='utf-8') as output:
+            json.dump({'name': name, **metadata, 'samples': sum(profiler.samples.values()), 'formats': formats},
+                      output)
+        self.prune()
+
+    def prune(self):
+        names = self._names()
+        for name in names[:max(len(names) - self.max_profiles, 0)]:
+            for suffix in (METADATA, *FORMATS.values()):
+                try:
+                    os.remove(self._path(name, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def get_all(self) -> list:
+        """Metadata of the stored profiles, newest first."""
+        profiles = []
+        for name in reversed(self._names()):
+            try:
+                with open(self._path(name, METADATA), encoding='utf-8') as metadata:
+                    profiles.append(json.load(metadata))
+            except (FileNotFoundError, ValueError):
+                continue  # Pruned meanwhile
+        return profiles
+
+    def path(self, name: str, fmt: str):
+        """Path of the profile `name` in format `fmt`, or None if there is no such profile."""
+        if not PROFILE_NAME.match(name) or fmt not in FORMATS:
+            return None
+        path = self._path(name, FORMATS[fmt])
+        return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests that ask for it with the X-Profile header, or a random sample."""
+
+    def __init__(self, app, store: ProfileStore, sample_rate: float = 0, interval: float = 0.005):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self.interval = interval
+
+    def _requested(self, scope) -> bool:
+        header = PROFILE_HEADER.lower().encode()
+        if any(name == header and value not in (b'', b'0', b'false') for name, value in scope['headers']):
+            return True
+        return random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._requested(scope):
+            return await self.app(scope, receive, send)
+        if not _profiling.acquire(blocking=False):  # pylint: disable=R1732  # Released after the request
+            return await self.app(scope, receive, send)
+
+        operation_id = scope.get('extensions', {}).get(ROUTING_CONTEXT, {}).get('operation_id') or 'request'
+        # Names start with their time, so they sort chronologically
+        name = '-'.join((time.strftime('%Y%m%dT%H%M%S', time.gmtime()), operation_id.rsplit('.', 1)[-1],
+                         uuid.uuid4().hex[:8]))
+        metadata = {'operation_id': operation_id, 'method': scope['method'], 'path': scope['path'],
+                    'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+        async def send_(message):
+            if message['type'] == 'http.response.start':
+                metadata['status'] = message['status']
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, name)
+            await send(message)
+
+        profiler = Profiler(self.interval)
+        token = _current_profiler.set(profiler)
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            return await self.app(scope, receive, send_)
+        finally:
+            profiler.stop()
+            metadata['duration_ms'] = (time.perf_counter() - start) * 1000
+            _current_profiler.reset(token)
+            _profiling.release()
+            try:
+                await run_in_threadpool(self.store.save, name, profiler, metadata)
+            except OSError as e:
+                LOG.error(f'Failed to save the profile {name}: {e}')
+
+
+def create_store(settings) -> ProfileStore:
+    return ProfileStore(settings.PROFILING_DIR, settings.PROFILING_MAX_PROFILES)
+
+
+profile_store = create_store(Config.get_settings())
@@ -0,0 +1,177 @@
+"""
+Response compression for the Inventory Service API
+
+The product, restock and analytics lists are large and repetitive JSON documents, which compress to a small
+fraction of their size. The response body is encoded with the best content-coding both the client (Accept-Encoding)
+and the service support: zstd and brotli when the zstandard and brotli packages are installed, gzip otherwise.
+Bodies smaller than COMPRESSION_MIN_SIZE are sent as they are, as compressing them saves less than it costs.
+
+Streamed bodies are compressed chunk by chunk, and every chunk is flushed so the client receives it as it is
+produced. Server-sent events and types that are already compressed are never encoded.
+"""
+import re
+import zlib
+
+from starlette.datastructures import MutableHeaders
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli  # pylint: disable=E0401  # Optional dependency, enables the br encoding
+except ImportError:
+    brotli = None
+try:
+    import zstandard  # pylint: disable=E0401  # Optional dependency, enables the zstd encoding
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/(?!event-stream)|application/(json|x-ndjson|problem\+json|javascript|xml)|image/svg\+xml)')
+UNCOMPRESSED_STATUSES = (204, 304)
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        """Encode a chunk of the body, flushed so the client can decode it before the next one."""
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        """Encode the last chunk of the body."""
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class ZstdEncoder:
+    name = 'zstd'
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+def available_encoders(settings) -> dict:
+    """Encoder factories of the COMPRESSION_ENCODINGS the installed packages support, by preference."""
+    encoders = {
+        'gzip': lambda: GzipEncoder(settings.COMPRESSION_GZIP_LEVEL),
+        'br': (lambda: BrotliEncoder(settings.COMPRESSION_BROTLI_LEVEL)) if brotli else None,
+        'zstd': (lambda: ZstdEncoder(settings.COMPRESSION_ZSTD_LEVEL)) if zstandard else None,
+    }
+    return {name: encoders[name] for name in settings.COMPRESSION_ENCODINGS if encoders.get(name)}
+
+
+def weak_etag(etag: str) -> str:
+    """The compressed body differs from the identity one byte for byte, only weak comparisons still hold."""
+    return etag if etag.startswith('W/') else 'W/' + etag
+
+
+class CompressedResponder:
+    """Sends the response of one request, encoding its body when it is large enough and compressible.
+
+    The first chunks of a streamed body are held until they reach `minimum_size`, so a small body sent in several
+    chunks (as the WSGI adapter of the Flask application does) is not compressed either.
+    """
+
+    def __init__(self, send, encoder_factory, minimum_size: int):
+        self.send = send
+        self.encoder_factory = encoder_factory
+        self.minimum_size = minimum_size
+        self.encoder = None
+        self.start_message = None
+        self.passthrough = False
+        self.buffer = bytearray()
+
+    async def __call__(self, message):
+        if message['type'] == 'http.response.start':
+            self.start_message = message  # Sent with the first chunk of the body, once the encoding is known
+            self._prepare(MutableHeaders(scope=message))
+            return await self.send(message) if self.passthrough else None
+        if message['type'] != 'http.response.body' or self.passthrough:
+            return await self.send(message)
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.encoder is None:
+            self.buffer += body
+            if more_body and len(self.buffer) < self.minimum_size:
+                return None
+            body, self.buffer = bytes(self.buffer), None
+            if len(body) < self.minimum_size:
+                return await self._send_identity(body)
+            return await self._send_encoded(body, more_body)
+
+        body = self.encoder.compress(body) if more_body else self.encoder.finish(body)
+        return await self.send({**message, 'body': body})
+
+    def _prepare(self, headers):
+        """Decide from the headers whether the body may be compressed."""
+        compressible = bool(COMPRESSIBLE_TYPES.match(headers.get('Content-Type', ''))) and \
+            'Content-Encoding' not in headers
+        if compressible:
+            headers.add_vary_header('Accept-Encoding')
+        # Every response to a client accepting an encoding gets the same weak tag, so a 304 carries the tag of
+        # the 200 response whatever its size
+        if self.encoder_factory and (compressible or self.start_message['status'] == 304) and 'ETag' in headers:
+            headers['ETag'] = weak_etag(headers['ETag'])
+        if not compressible or self.encoder_factory is None or self.start_message['status'] in UNCOMPRESSED_STATUSES:
+            self.passthrough = True
+
+    async def _send_identity(self, body: bytes):
+        self.passthrough = True
+        await self.send(self.start_message)
+        return await self.send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    async def _send_encoded(self, body: bytes, more_body: bool):
+        headers = MutableHeaders(scope=self.start_message)
+        self.encoder = self.encoder_factory()
+        headers['Content-Encoding'] = self.encoder.name
+        if more_body:
+            del headers['Content-Length']
+            body = self.encoder.compress(body)
+        else:
+            body = self.encoder.finish(body)
+            headers['Content-Length'] = str(len(body))
+        await self.send(self.start_message)
+        return await self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+
+class CompressionMiddleware:
+    """ASGI middleware negotiating the content-coding of the responses from Accept-Encoding.
+
+    `encoders` maps the content-codings to the factories of their encoders, in order of preference, which breaks
+    the ties between codings the client accepts equally.
+    """
+
+    def __init__(self, app, encoders: dict, minimum_size: int = 1024):
+        self.app = app
+        self.encoders = encoders
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        accept_encoding = next((value.decode('latin-1') for name, value in scope['headers']
+                                if name == b'accept-encoding'), None)
+        encoding = parse_accept_header(accept_encoding).best_match(list(self.encoders))
+        responder = CompressedResponder(send, self.encoders.get(encoding), self.minimum_size)
+        return await self.app(scope, receive, responder)
@@ -0,0 +1,43 @@
+"""
+Fast JSON serialization for the Inventory Management API
+
+orjson encodes the response bodies several times faster than the json module. Datetimes are written like
+connexion writes them (naive datetimes are UTC and get a 'Z' suffix), so both encoders give the same documents,
+only without indentation.
+"""
+from decimal import Decimal
+
+import orjson
+from connexion.jsonifier import Jsonifier
+from flask.json.provider import DefaultJSONProvider
+
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def _default(o):
+    """Encode the types orjson does not support natively."""
+    if isinstance(o, Decimal):
+        return float(o)
+    raise TypeError(f'Object of type {o.__class__.__name__} is not JSON serializable')
+
+
+def dumps(obj) -> bytes:
+    """Serialize `obj` to JSON with orjson."""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+class OrjsonJsonifier(Jsonifier):
+    """Connexion jsonifier serializing the response bodies with orjson."""
+
+    def dumps(self, data, **kwargs):
+        return dumps(data)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider serializing with orjson, used by flask.json.dumps (streamed bodies, ETags).
+
+    orjson has no formatting options, so the keyword arguments of dumps are ignored.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
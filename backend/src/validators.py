@@ -0,0 +1,76 @@
+"""
+Request and response validators for the Inventory Management API
+"""
+import random
+
+from connexion.datastructures import MediaTypeDict
+from connexion.validators import (AbstractRequestBodyValidator, JSONRequestBodyValidator, JSONResponseBodyValidator,
+                                  TextResponseBodyValidator)
+
+from controllers.tools import NDJSON_MIMETYPE
+
+
+class StreamingRequestBodyValidator(AbstractRequestBodyValidator):
+    """Request body validator that passes the body through unread, for bodies the controller streams and validates.
+
+    Connexion treats application/x-ndjson as JSON, which would buffer the whole body and reject more than one line.
+    """
+
+    async def wrap_receive(self, receive, *, scope):
+        return receive
+
+
+class StreamingJSONResponseBodyValidator(JSONResponseBodyValidator):
+    """JSON response validator that lets streamed responses through unvalidated.
+
+    Validating a body requires buffering all of it, which would defeat the streaming endpoints.
+    Streamed responses are recognized by the missing Content-Length header.
+    """
+
+    def wrap_send(self, send):
+        buffered_send = super().wrap_send(send)
+        streaming = False
+
+        async def send_(message):
+            nonlocal streaming
+            if message['type'] == 'http.response.start':
+                streaming = not any(name.lower() == b'content-length' for name, _ in message['headers'])
+            if streaming:
+                return await send(message)
+            return await buffered_send(message)
+
+        return send_
+
+
+class SampledResponseBodyValidatorMixin:
+    """Validates the body of a random `sample_rate` fraction of the responses, letting the others through."""
+
+    sample_rate = 1.0
+
+    def wrap_send(self, send):
+        if random.random() >= self.sample_rate:
+            return send
+        return super().wrap_send(send)
+
+
+def sampled(validator_cls, sample_rate: float):
+    """Subclass of the response body validator `validator_cls` validating `sample_rate` of the responses."""
+    return type(f'Sampled{validator_cls.__name__}', (SampledResponseBodyValidatorMixin, validator_cls),
+                {'sample_rate': sample_rate})
+
+
+def build_validator_map(sample_rate: float = 1.0) -> dict:
+    """Validator map of the API, validating the bodies of `sample_rate` of the responses."""
+    json_validator, text_validator = StreamingJSONResponseBodyValidator, TextResponseBodyValidator
+    if sample_rate < 1:
+        json_validator, text_validator = sampled(json_validator, sample_rate), sampled(text_validator, sample_rate)
+    return {
+        'body': MediaTypeDict({
+            '*/*json': JSONRequestBodyValidator,
+            NDJSON_MIMETYPE: StreamingRequestBodyValidator,
+        }),
+        'response': MediaTypeDict({
+            '*/*json': json_validator,
+            'text/plain': text_validator,
+        }),
+    }
@@ -3,7 +3,7 @@ import pytest  # pylint: disable=E0401
 
 def pytest_addoption(parser):
     """
-    Adds --base-url and --empty-db options to pytest command line.
+    Adds --base-url, --db-url and --empty-db options to pytest command line.
     """
     parser.addoption(
         "--base-url",
@@ -11,6 +11,12 @@ def pytest_addoption(parser):
         default="http://localhost:8000",
         help="Base URL for API tests (e.g., http://localhost:8000)"
     )
+    parser.addoption(
+        "--db-url",
+        action="store",
+        default=None,
+        help="PostgreSQL URL of the service database for schema tests (e.g., postgresql://user:pw@localhost/db)"
+    )
     parser.addoption(
         "--db-empty",
         action="store_true",
@@ -33,3 +39,29 @@ def db_empty(request):
     Fixture that provides the --db-empty flag value.
     """
     return request.config.getoption("--db-empty")
+
+
+@pytest.fixture(scope="session", name="db_url")
+def db_url_fixture(request):
+    """
+    Fixture that provides the --db-url option value, skipping the test when it is not set.
+    """
+    url = request.config.getoption("--db-url")
+    if not url:
+        pytest.skip("Skipping database test as --db-url is not set.")
+    return url
+
+
+@pytest.fixture
+def db_cursor(db_url):
+    """
+    Fixture that provides a cursor on the service database. Changes are rolled back afterwards.
+    """
+    import psycopg2  # pylint: disable=C0415,E0401
+    connection = psycopg2.connect(db_url)
+    try:
+        with connection.cursor() as cursor:
+            yield cursor
+    finally:
+        connection.rollback()
+        connection.close()
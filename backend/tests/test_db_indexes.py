@@ -0,0 +1,89 @@
+import json
+from datetime import datetime
+import pytest  # pylint: disable=E0401
+
+
+# The planner prefers sequential scans on small tables, so the tests disable them for the EXPLAIN. A
+# query without a usable index is then still planned as a (very expensive) sequential scan.
+HOT_QUERIES = [
+    # Product.get_by_sku, either SKU index serves equality
+    ("SELECT * FROM products WHERE sku = 'TL-TEST-2024-001' LIMIT 1", ('uq_products_sku', 'ix_products_sku_pattern')),
+    # Product.get_low_quantity
+    ("SELECT * FROM products WHERE quantity < 20", 'ix_products_quantity'),
+    # RestockLog.filter_conditions (product_id)
+    ("SELECT * FROM restock_logs WHERE product_id = 1", 'ix_restock_logs_product_id'),
+    # BaseModel.get_all and BaseModel.get_page
+    ("SELECT * FROM products ORDER BY created_at, id LIMIT 101", 'ix_products_created_at_id'),
+    ("SELECT * FROM users ORDER BY created_at, id LIMIT 101", 'ix_users_created_at_id'),
+    ("SELECT * FROM restock_logs ORDER BY created_at", 'ix_restock_logs_created_at_id'),
+    ("SELECT * FROM products WHERE (created_at, id) > (now(), 1) ORDER BY created_at, id LIMIT 101",
+     'ix_products_created_at_id'),
+    # Product.filter_conditions, the unique SKU index only serves LIKE with the C collation
+    ("SELECT * FROM products WHERE sku LIKE 'TL-TEST%'", ('uq_products_sku', 'ix_products_sku_pattern')),
+    ("SELECT * FROM products WHERE price >= 10 AND price <= 20", 'ix_products_price'),
+    ("SELECT * FROM products WHERE quantity >= 10 AND quantity <= 20", 'ix_products_quantity'),
+    # BaseModel.get_version, read by every list request (304 included)
+    ("SELECT (SELECT max(updated_at) FROM products), (SELECT count(*) FROM products)", 'ix_products_updated_at'),
+    ("SELECT (SELECT max(updated_at) FROM users), (SELECT count(*) FROM users)", 'ix_users_updated_at'),
+]
+
+
+def plan_nodes(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def with_partition_indexes(db_cursor, indexes):
+    """The indexes and, for the indexes of a partitioned table, their copies on the partitions."""
+    db_cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                      "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = ANY(%s)", (list(indexes),))
+    return set(indexes) | {row[0] for row in db_cursor.fetchall()}
+
+
+@pytest.mark.parametrize("query, index", HOT_QUERIES)
+def test_hot_query_uses_index(db_cursor, query, index):
+    """The hot lookup queries are planned as index scans, not sequential scans"""
+    db_cursor.execute("SET enable_seqscan = off")
+    db_cursor.execute(f"EXPLAIN (FORMAT JSON) {query}")
+    plan = db_cursor.fetchone()[0][0]['Plan']
+    print(json.dumps(plan, indent=4))
+    nodes = list(plan_nodes(plan))
+    assert not [node for node in nodes if node['Node Type'] == 'Seq Scan']
+    indexes = with_partition_indexes(db_cursor, index if isinstance(index, tuple) else (index,))
+    assert indexes & {node.get('Index Name') for node in nodes}
+
+
+def test_time_range_reads_only_its_partitions(db_cursor):
+    """A restocked_at range only scans the partitions of its months"""
+    db_cursor.execute("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                      "WHERE c.relname = 'restock_logs'")
+    assert db_cursor.fetchone(), "restock_logs is not partitioned"
+    month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    db_cursor.execute("EXPLAIN (FORMAT JSON) SELECT * FROM restock_logs "
+                      "WHERE restocked_at >= %s AND restocked_at < %s + interval '1 month'", (month, month))
+    plan = db_cursor.fetchone()[0][0]['Plan']
+    print(json.dumps(plan, indent=4))
+    scanned = {node['Relation Name'] for node in plan_nodes(plan) if 'Relation Name' in node}
+    assert scanned == {f"restock_logs_{month:%Y_%m}"}
+
+
+def test_name_filter_uses_trigram_index(db_cursor):
+    """The name substring filter is planned on the trigram index, when the server has pg_trgm"""
+    db_cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_products_name_trgm'")
+    if not db_cursor.fetchone():
+        pytest.skip("Skipping as the pg_trgm extension is not available on the server.")
+    db_cursor.execute("SET enable_seqscan = off")
+    db_cursor.execute("EXPLAIN (FORMAT JSON) SELECT * FROM products WHERE name ILIKE '%laptop%'")
+    plan = db_cursor.fetchone()[0][0]['Plan']
+    print(json.dumps(plan, indent=4))
+    assert 'ix_products_name_trgm' in [node.get('Index Name') for node in plan_nodes(plan)]
+
+
+def test_migrations_applied(db_cursor):
+    """Every migration was recorded in schema_migrations"""
+    db_cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    versions = [row[0] for row in db_cursor.fetchall()]
+    assert versions == list(range(1, len(versions) + 1))
+    assert len(versions) >= 4
@@ -1,4 +1,5 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import pytest  # pylint: disable=E0401
 
@@ -11,6 +12,24 @@ def print_json(data):
         print(data)  # Not JSON, print as is
 
 
+def read_events(lines, count):
+    """Read `count` server-sent events from the lines of a streamed response, skipping the comments and retry."""
+    events, event = [], {}
+    for line in lines:
+        if line:
+            field, _, value = line.partition(': ')
+            if field in ('id', 'event', 'data'):
+                event[field] = value
+            continue
+        if event:
+            print(f"{event}")
+            events.append(event)
+            event = {}
+        if len(events) == count:
+            break
+    return events
+
+
 # --- Global variables for test data (shared within the test module) ---
 REQUEST_TIMEOUT = 5
 PRODUCT_UUID = None
@@ -247,16 +266,30 @@ def test_get_low_stock_products(base_url, expected_status):
     assert isinstance(response.json(), list)
 
 
-# Test 15 was commented out in the shell script, so we'll skip it here too for consistency
-# @pytest.mark.parametrize('expected_status', [200])
-# def test_get_stock_analytics(base_url, expected_status):
-#     """Test 15: Get Stock Analytics"""
-#     print("\n--- Running: Get Stock Analytics ---")
-#     response = requests.get(f"{base_url}/api/products/analytics", timeout=REQUEST_TIMEOUT)
-#     print(f"Status: {response.status_code}")
-#     print("Response Body:")
-#     print_json(response.json())
-#     assert response.status_code == expected_status
+@pytest.mark.parametrize('expected_status', [200])
+def test_get_stock_analytics(base_url, expected_status):
+    """Test 15: Get Stock Analytics"""
+    if PRODUCT_ID is None:
+        pytest.fail("Skipping Get Stock Analytics - no product ID available.")
+
+    print("\n--- Running: Get Stock Analytics ---")
+    params = {"days": 7, "product_id": PRODUCT_ID}
+    response = requests.get(f"{base_url}/api/products/analytics", params=params, timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    print("Response Body:")
+    print_json(response.json())
+    assert response.status_code == expected_status
+    assert len(response.json()) == 1
+    trend = response.json()[0]['data']
+    assert len(trend) == 7
+
+    # The level of a day is the current quantity minus the restocks of the later days, whatever the date of the run
+    quantity = requests.get(f"{base_url}/api/products/{PRODUCT_ID}", timeout=REQUEST_TIMEOUT).json()['quantity']
+    restocks = requests.get(f"{base_url}/api/products/{PRODUCT_ID}/restocks", timeout=REQUEST_TIMEOUT).json()
+    assert quantity == 70 and sum(log['quantity'] for log in restocks) == 25
+    expected = [max(quantity - sum(log['quantity'] for log in restocks if log['restocked_at'][:10] > day['date']), 0)
+                for day in trend]
+    assert [day['quantity'] for day in trend] == expected
 
 def test_delete_product(base_url):
     """Test 16: Delete Product"""
@@ -299,3 +332,509 @@ def test_verify_product_deletion(base_url):
     print("Response Body:")
     print_json(response.json() if response.content else response.text)
     assert response.status_code == 404
+
+
+def test_paginate_products(base_url):
+    """Test 19: Paginate Products with limit and cursor"""
+    print("\n--- Running: Paginate Products ---")
+    created_ids = []
+    for i in range(3):
+        product_data = {"name": f"Page Product {i}", "sku": f"PG-TEST-2024-{i:03d}", "quantity": 5, "price": 10.0}
+        response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 201
+        created_ids.append(response.json()['id'])
+
+    seen_ids = []
+    params = {"limit": 2}
+    while True:
+        response = requests.get(f"{base_url}/api/products", params=params, timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        seen_ids.extend(p['id'] for p in response.json())
+        next_cursor = response.headers.get('X-Next-Cursor')
+        if not next_cursor:
+            break
+        params = {"limit": 2, "cursor": next_cursor}
+    print(f"Seen IDs: {seen_ids}")
+    assert len(seen_ids) == len(set(seen_ids))  # No product is returned twice
+    assert set(created_ids) <= set(seen_ids)
+
+    for product_id in created_ids:
+        requests.delete(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+
+
+@pytest.mark.parametrize("invalid_cursor, expected_status", [("not-a-cursor", 400)])
+def test_get_products_with_invalid_cursor(base_url, invalid_cursor, expected_status):
+    """Test 20: Get Products with Invalid Cursor (400 test)"""
+    print("\n--- Running: Get Products with Invalid Cursor ---")
+    response = requests.get(f"{base_url}/api/products", params={"cursor": invalid_cursor}, timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    print("Response Body:")
+    print_json(response.json() if response.content else response.text)
+    assert response.status_code == expected_status
+
+
+def test_stream_restock_history(base_url):
+    """Test 21: Stream Restock History as a chunked JSON array and as NDJSON"""
+    print("\n--- Running: Stream Restock History ---")
+    product_data = {"name": "Stream Product", "sku": "ST-TEST-2024-001", "quantity": 5, "price": 10.0}
+    response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    product_id = response.json()['id']
+    for quantity in (1, 2):
+        url = f"{base_url}/api/products/{product_id}/restock"
+        requests.post(url, json={"quantity": quantity}, timeout=REQUEST_TIMEOUT)
+
+    response = requests.get(f"{base_url}/api/restocks", params={"stream": "true"}, timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    assert response.status_code == 200
+    logs = [log for log in response.json() if log['product_id'] == product_id]
+    assert [log['quantity'] for log in logs] == [1, 2]
+
+    headers = {"Accept": "application/x-ndjson"}
+    response = requests.get(f"{base_url}/api/restocks", headers=headers, timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('application/x-ndjson')
+    logs = [json.loads(line) for line in response.text.splitlines()]
+    assert [log['quantity'] for log in logs if log['product_id'] == product_id] == [1, 2]
+
+    requests.delete(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+
+
+def test_concurrent_restocks(base_url):
+    """Test 22: Concurrent Restocks lose no increments"""
+    print("\n--- Running: Concurrent Restocks ---")
+    product_data = {"name": "Concurrent Product", "sku": "CR-TEST-2024-001", "quantity": 0, "price": 10.0}
+    response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    product_id = response.json()['id']
+
+    url = f"{base_url}/api/products/{product_id}/restock"
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        statuses = list(executor.map(
+            lambda _: requests.post(url, json={"quantity": 1}, timeout=REQUEST_TIMEOUT).status_code, range(50)))
+    assert statuses == [200] * 50
+
+    response = requests.get(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+    print(f"Quantity: {response.json().get('quantity')}")
+    assert response.json().get('quantity') == 50
+
+    requests.delete(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+
+
+def test_batch_restock(base_url):
+    """Test 23: Batch Restock with an unknown product"""
+    print("\n--- Running: Batch Restock ---")
+    product_data = {"name": "Batch Product", "sku": "BR-TEST-2024-001", "quantity": 10, "price": 10.0}
+    response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    product_id = response.json()['id']
+
+    batch = [
+        {"product_id": product_id, "quantity": 5, "reason": "Pallet 1"},
+        {"product_id": 99999, "quantity": 5},
+        {"product_id": product_id, "quantity": 7},
+    ]
+    response = requests.post(f"{base_url}/api/restocks/batch", json=batch, timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    print("Response Body:")
+    print_json(response.json())
+    assert response.status_code == 200
+    assert response.json()['restocked'] == 2
+    assert response.json()['failed'] == 1
+    assert [r['status'] for r in response.json()['results']] == ['restocked', 'failed', 'restocked']
+
+    response = requests.get(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+    assert response.json().get('quantity') == 22
+
+    requests.delete(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+
+
+def test_import_products(base_url):
+    """Test 24: Bulk Import Products from CSV and NDJSON"""
+    print("\n--- Running: Bulk Import Products ---")
+    csv_body = (
+        "name,sku,description,quantity,price\n"
+        "Import A,IM-TEST-2024-001,First,10,1.5\n"
+        "Import B,IM-TEST-2024-002,,20,2.5\n"
+        ",IM-TEST-2024-003,Missing name,1,1\n"
+    )
+    headers = {"Content-Type": "text/csv"}
+    response = requests.post(f"{base_url}/api/products/import", data=csv_body, headers=headers,
+                             timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    print("Response Body:")
+    print_json(response.json())
+    assert response.status_code == 200
+    assert (response.json()['inserted'], response.json()['updated'], response.json()['rejected']) == (2, 0, 1)
+
+    ndjson_body = (
+        '{"name": "Import A", "sku": "IM-TEST-2024-001", "quantity": 11, "price": 1.5}\n'
+        '{"name": "Import B", "sku": "IM-TEST-2024-002", "quantity": 21, "price": 2.5}\n'
+        '{"name": "Import C", "sku": "IM-TEST-2024-003", "quantity": 2.5, "price": 1}\n'
+        '{"name": "Import C", "sku": "IM-TEST-2024-003", "quantity": 3000000000, "price": 1}\n'
+        '{"name": "Import C", "sku": "IM-TEST-2024-003", "quantity": 1, "price": NaN}\n'
+        '{"name": "Import C", "sku": "IM-TEST-2024-003", "quantity": 1, "price": 1e999}\n'
+    )
+    headers = {"Content-Type": "application/x-ndjson"}
+    response = requests.post(f"{base_url}/api/products/import", data=ndjson_body, headers=headers,
+                             timeout=REQUEST_TIMEOUT)
+    print_json(response.json())
+    assert response.status_code == 200
+    assert (response.json()['inserted'], response.json()['updated'], response.json()['rejected']) == (0, 2, 4)
+
+    response = requests.get(f"{base_url}/api/products", params={"limit": 1000}, timeout=REQUEST_TIMEOUT)
+    imported = {p['sku']: p for p in response.json() if p['sku'].startswith('IM-TEST-')}
+    assert sorted(imported) == ['IM-TEST-2024-001', 'IM-TEST-2024-002']
+    assert imported['IM-TEST-2024-001']['quantity'] == 11
+    assert imported['IM-TEST-2024-002']['quantity'] == 21
+
+    for product in imported.values():
+        requests.delete(f"{base_url}/api/products/{product['id']}", timeout=REQUEST_TIMEOUT)
+
+
+def test_product_reads_after_writes(base_url):
+    """Test 25: Product reads reflect every write (the product cache is invalidated)"""
+    print("\n--- Running: Product Reads After Writes ---")
+    product_data = {"name": "Cached Product", "sku": "CA-TEST-2024-001", "quantity": 5, "price": 10.0}
+    response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    product_id = response.json()['id']
+    product_url = f"{base_url}/api/products/{product_id}"
+
+    for _ in range(2):  # The second read is served by the cache
+        response = requests.get(product_url, timeout=REQUEST_TIMEOUT)
+        assert response.json().get('quantity') == 5
+
+    requests.post(f"{product_url}/restock", json={"quantity": 3}, timeout=REQUEST_TIMEOUT)
+    assert requests.get(product_url, timeout=REQUEST_TIMEOUT).json().get('quantity') == 8
+
+    requests.post(f"{base_url}/api/restocks/batch", json=[{"product_id": product_id, "quantity": 2}],
+                  timeout=REQUEST_TIMEOUT)
+    assert requests.get(product_url, timeout=REQUEST_TIMEOUT).json().get('quantity') == 10
+
+    requests.put(product_url, json={"quantity": 1, "name": "Cached Product 2"}, timeout=REQUEST_TIMEOUT)
+    response = requests.get(product_url, timeout=REQUEST_TIMEOUT)
+    print_json(response.json())
+    assert (response.json().get('quantity'), response.json().get('name')) == (1, "Cached Product 2")
+
+    ndjson_body = '{"name": "Cached Product 3", "sku": "CA-TEST-2024-001", "quantity": 4, "price": 10.0}\n'
+    requests.post(f"{base_url}/api/products/import", data=ndjson_body,
+                  headers={"Content-Type": "application/x-ndjson"}, timeout=REQUEST_TIMEOUT)
+    assert requests.get(product_url, timeout=REQUEST_TIMEOUT).json().get('quantity') == 4
+
+    requests.delete(product_url, timeout=REQUEST_TIMEOUT)
+    response = requests.get(product_url, timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    assert response.status_code == 404
+
+
+def test_conditional_get(base_url):
+    """Test 26: Conditional GET of a product and of the product list with If-None-Match"""
+    print("\n--- Running: Conditional GET ---")
+    product_data = {"name": "ETag Product", "sku": "ET-TEST-2024-001", "quantity": 5, "price": 10.0}
+    response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    product_id = response.json()['id']
+
+    for url in [f"{base_url}/api/products/{product_id}", f"{base_url}/api/products"]:
+        response = requests.get(url, timeout=REQUEST_TIMEOUT)
+        etag = response.headers.get('ETag')
+        print(f"Status: {response.status_code}, ETag: {etag}")
+        assert response.status_code == 200
+        assert etag
+
+        response = requests.get(url, headers={"If-None-Match": etag}, timeout=REQUEST_TIMEOUT)
+        print(f"Status: {response.status_code}")
+        assert response.status_code == 304
+        assert response.headers.get('ETag') == etag
+        assert not response.content
+
+        # Query parameters that are not declared do not change the tag
+        response = requests.get(url, params={"unknown": "1"}, headers={"If-None-Match": etag}, timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 304
+
+        requests.post(f"{base_url}/api/products/{product_id}/restock", json={"quantity": 1}, timeout=REQUEST_TIMEOUT)
+        response = requests.get(url, headers={"If-None-Match": etag}, timeout=REQUEST_TIMEOUT)
+        print(f"Status after restock: {response.status_code}")
+        assert response.status_code == 200
+        assert response.headers.get('ETag') != etag
+
+    requests.delete(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+
+
+def test_sql_metrics(base_url):
+    """Test 27: SQL statements of every request are exported by operationId on /metrics"""
+    print("\n--- Running: SQL Metrics ---")
+    response = requests.get(f"{base_url}/api/products", params={"limit": 1}, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 200
+
+    response = requests.get(f"{base_url}/metrics", timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    assert response.status_code == 200
+    operation = 'operation="controllers.products.product_get_all"'
+    samples = [line for line in response.text.splitlines() if line.startswith('db_request_queries_count{')]
+    print(samples)
+    counts = [float(line.rsplit(' ', 1)[1]) for line in samples if operation in line]
+    assert counts and counts[0] >= 1
+    assert any(line.startswith('db_request_query_seconds_sum{') and operation in line
+               for line in response.text.splitlines())
+
+
+def test_profiles(base_url):
+    """Test 28: Profile a request with X-Profile and download the profile (when PROFILING_ENABLED is set)"""
+    print("\n--- Running: Request Profiles ---")
+    response = requests.get(f"{base_url}/api/products", params={"limit": 1}, headers={"X-Profile": "1"},
+                            timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 200
+    name = response.headers.get('X-Profile-Id')
+    print(f"Profile: {name}")
+
+    response = requests.get(f"{base_url}/api/profiles", timeout=REQUEST_TIMEOUT)
+    print_json(response.json())
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+
+    response = requests.get(f"{base_url}/api/profiles/unknown", timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 404
+    if not name:
+        pytest.skip("Skipping the profile download as profiling is not enabled.")
+
+    assert name in [profile['name'] for profile in requests.get(f"{base_url}/api/profiles",
+                                                                timeout=REQUEST_TIMEOUT).json()]
+    response = requests.get(f"{base_url}/api/profiles/{name}", params={"format": "collapsed"},
+                            timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain')
+    response = requests.get(f"{base_url}/api/profiles/{name}", params={"format": "pstats"}, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 200
+    assert response.content
+
+
+def test_batch_create_products(base_url):
+    """Test 29: Batch Create Products with duplicate SKUs"""
+    print("\n--- Running: Batch Create Products ---")
+    batch = [
+        {"name": "Batch Created 1", "sku": "BC-TEST-2024-001", "quantity": 1, "price": 1.0},
+        {"name": "Batch Created 2", "sku": "BC-TEST-2024-002", "quantity": 2, "price": 2.0, "description": "Two"},
+        {"name": "Batch Created 1 again", "sku": "BC-TEST-2024-001", "quantity": 3, "price": 3.0},
+    ]
+    response = requests.post(f"{base_url}/api/products/batch", json=batch, timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    print("Response Body:")
+    print_json(response.json())
+    assert response.status_code == 201
+    assert response.json()['created'] == 2
+    assert response.json()['failed'] == 1
+    results = response.json()['results']
+    assert [r['status'] for r in results] == ['created', 'created', 'failed']
+    assert results[0]['product']['name'] == "Batch Created 1"
+    assert results[1]['product']['description'] == "Two"
+
+    # A single creation of an existing SKU conflicts
+    response = requests.post(f"{base_url}/api/products", json=batch[2], timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 409
+
+    for result in results[:2]:
+        requests.delete(f"{base_url}/api/products/{result['product']['id']}", timeout=REQUEST_TIMEOUT)
+
+
+@pytest.mark.parametrize('path', ['/health/live', '/health/ready'])
+def test_liveness_and_readiness(base_url, path):
+    """Test 30: Liveness and Readiness (the database is reachable)"""
+    print(f"\n--- Running: {path} ---")
+    response = requests.get(f"{base_url}{path}", timeout=REQUEST_TIMEOUT)
+    print(f"Status: {response.status_code}")
+    print_json(response.json())
+    assert response.status_code == 200
+    assert response.json()['status'] == 'ok'
+
+
+def test_filter_products(base_url):
+    """Test 31: Filter Products by name, SKU prefix, price and quantity"""
+    print("\n--- Running: Filter Products ---")
+    batch = [
+        {"name": "Sample Red Chair", "sku": "FL-TEST-A-001", "quantity": 5, "price": 10.0},
+        {"name": "Sample Blue Chair", "sku": "FL-TEST-A-002", "quantity": 50, "price": 20.0},
+        {"name": "Sample Red Table", "sku": "FL-TEST-B-001", "quantity": 500, "price": 30.0},
+        {"name": "Sample 100% Cotton", "sku": "FL-TEST-B_002", "quantity": 0, "price": 40.0},
+    ]
+    response = requests.post(f"{base_url}/api/products/batch", json=batch, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    ids = [result['product']['id'] for result in response.json()['results']]
+
+    cases = [
+        ({"name": "red"}, ["FL-TEST-A-001", "FL-TEST-B-001"]),
+        ({"sku_prefix": "FL-TEST-A"}, ["FL-TEST-A-001", "FL-TEST-A-002"]),
+        ({"sku_prefix": "FL-TEST-B_"}, ["FL-TEST-B_002"]),  # Wildcards are matched literally
+        ({"name": "100%"}, ["FL-TEST-B_002"]),
+        ({"sku_prefix": "FL-TEST", "min_price": 20, "max_price": 30}, ["FL-TEST-A-002", "FL-TEST-B-001"]),
+        ({"sku_prefix": "FL-TEST", "min_quantity": 5, "max_quantity": 50}, ["FL-TEST-A-001", "FL-TEST-A-002"]),
+        ({"name": "chair", "max_price": 15}, ["FL-TEST-A-001"]),
+    ]
+    for params, skus in cases:
+        response = requests.get(f"{base_url}/api/products", params=params, timeout=REQUEST_TIMEOUT)
+        print(f"{params}: {response.status_code} {[p['sku'] for p in response.json()]}")
+        assert response.status_code == 200
+        assert [p['sku'] for p in response.json()] == skus
+
+    # Another filter is another representation
+    etags = {requests.get(f"{base_url}/api/products", params=params, timeout=REQUEST_TIMEOUT).headers['ETag']
+             for params, _ in cases[:2]}
+    assert len(etags) == 2
+
+    for id_ in ids:
+        requests.delete(f"{base_url}/api/products/{id_}", timeout=REQUEST_TIMEOUT)
+
+
+def test_sparse_fieldsets(base_url):
+    """Test 32: Sparse fieldsets of products and restock logs"""
+    print("\n--- Running: Sparse Fieldsets ---")
+    product_data = {"name": "Sparse Product", "sku": "SF-TEST-2024-001", "quantity": 3, "price": 10.0,
+                    "description": "Not asked for"}
+    response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    product_id = response.json()['id']
+    requests.post(f"{base_url}/api/products/{product_id}/restock", json={"quantity": 2, "reason": "Sparse"},
+                  timeout=REQUEST_TIMEOUT)
+
+    response = requests.get(f"{base_url}/api/products", params={"sku_prefix": "SF-TEST", "fields": "id,sku,quantity"},
+                            timeout=REQUEST_TIMEOUT)
+    print_json(response.json())
+    assert response.status_code == 200
+    assert response.json() == [{"id": product_id, "sku": "SF-TEST-2024-001", "quantity": 5}]
+    full = requests.get(f"{base_url}/api/products", params={"sku_prefix": "SF-TEST"}, timeout=REQUEST_TIMEOUT)
+    assert full.json()[0]['description'] == "Not asked for"
+    assert full.headers['ETag'] != response.headers['ETag']
+
+    response = requests.get(f"{base_url}/api/products", params={"fields": "id,unknown"}, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 400
+
+    for params in ({"fields": "product_id,quantity"}, {"fields": "product_id,quantity", "stream": "true"}):
+        response = requests.get(f"{base_url}/api/restocks", params=params, timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 200
+        assert {"product_id": product_id, "quantity": 2} in response.json()
+        assert all(set(log) == {"product_id", "quantity"} for log in response.json())
+
+    requests.delete(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+
+
+def test_response_compression(base_url):
+    """Test 33: Compression of the responses negotiated with Accept-Encoding"""
+    print("\n--- Running: Response Compression ---")
+    products = [{"name": f"Compressed Product {i}", "sku": f"CP-TEST-2024-{i:03d}", "quantity": i, "price": 10.0,
+                 "description": "A description repeated in every product of the list"} for i in range(20)]
+    response = requests.post(f"{base_url}/api/products/batch", json=products, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    ids = [result['product']['id'] for result in response.json()['results']]
+    requests.post(f"{base_url}/api/restocks/batch", json=[{"product_id": id_, "quantity": 1} for id_ in ids],
+                  timeout=REQUEST_TIMEOUT)
+
+    for params in ({"sku_prefix": "CP-TEST"}, {"stream": "true"}):
+        path = "/api/products" if "sku_prefix" in params else "/api/restocks"
+        response = requests.get(f"{base_url}{path}", params=params, headers={"Accept-Encoding": "gzip"},
+                                timeout=REQUEST_TIMEOUT)
+        print(f"{path} {params}: {response.status_code} {response.headers.get('Content-Encoding')}")
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert isinstance(response.json(), list)  # Decoded by requests
+    assert len(requests.get(f"{base_url}/api/products", params={"sku_prefix": "CP-TEST"},
+                            headers={"Accept-Encoding": "gzip"}, timeout=REQUEST_TIMEOUT).json()) == 20
+
+    # The compressed representation has a weak tag, which still revalidates
+    response = requests.get(f"{base_url}/api/products", params={"sku_prefix": "CP-TEST"},
+                            headers={"Accept-Encoding": "gzip"}, timeout=REQUEST_TIMEOUT)
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = requests.get(f"{base_url}/api/products", params={"sku_prefix": "CP-TEST"},
+                            headers={"Accept-Encoding": "gzip", "If-None-Match": etag}, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 304
+
+    # Not compressed: small bodies and clients not accepting any encoding
+    response = requests.get(f"{base_url}/health", headers={"Accept-Encoding": "gzip"}, timeout=REQUEST_TIMEOUT)
+    assert 'Content-Encoding' not in response.headers
+    response = requests.get(f"{base_url}/api/products", params={"sku_prefix": "CP-TEST"},
+                            headers={"Accept-Encoding": "identity"}, timeout=REQUEST_TIMEOUT)
+    assert 'Content-Encoding' not in response.headers
+    assert not response.headers['ETag'].startswith('W/')
+    assert len(response.json()) == 20
+
+    for id_ in ids:
+        requests.delete(f"{base_url}/api/products/{id_}", timeout=REQUEST_TIMEOUT)
+
+
+def test_restock_history_filters(base_url):
+    """Test 34: Restock history of a product and between two times"""
+    print("\n--- Running: Restock History Filters ---")
+    product_ids = []
+    for i in range(2):
+        product_data = {"name": f"History Product {i}", "sku": f"RH-TEST-2024-00{i}", "quantity": 1, "price": 10.0}
+        response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+        assert response.status_code == 201
+        product_ids.append(response.json()['id'])
+    for product_id, quantity in [(product_ids[0], 3), (product_ids[0], 4), (product_ids[1], 5)]:
+        requests.post(f"{base_url}/api/products/{product_id}/restock", json={"quantity": quantity},
+                      timeout=REQUEST_TIMEOUT)
+
+    for params in ({}, {"stream": "true"}):
+        response = requests.get(f"{base_url}/api/products/{product_ids[0]}/restocks", params=params,
+                                timeout=REQUEST_TIMEOUT)
+        print(f"{params}: {response.status_code}")
+        print_json(response.json())
+        assert response.status_code == 200
+        assert [log['quantity'] for log in response.json()] == [3, 4]
+    response = requests.get(f"{base_url}/api/restocks", params={"product_id": product_ids[1]},
+                            timeout=REQUEST_TIMEOUT)
+    assert [log['quantity'] for log in response.json()] == [5]
+
+    # Time bounds: since is inclusive, until exclusive
+    restocked_at = response.json()[0]['restocked_at']
+    for params, count in [({"since": restocked_at}, 1), ({"until": restocked_at}, 0),
+                          ({"since": "2000-01-01", "until": "2000-02-01T00:00:00+02:00"}, 0)]:
+        response = requests.get(f"{base_url}/api/restocks", params={"product_id": product_ids[1], **params},
+                                timeout=REQUEST_TIMEOUT)
+        print(f"{params}: {response.status_code} {len(response.json())}")
+        assert response.status_code == 200
+        assert len(response.json()) == count
+
+    response = requests.get(f"{base_url}/api/restocks", params={"since": "yesterday"}, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 400
+    response = requests.get(f"{base_url}/api/products/99999/restocks", timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 404
+
+    for product_id in product_ids:
+        requests.delete(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+
+
+def test_stock_stream(base_url):
+    """Test 35: Stock changes pushed as server-sent events, resumed from the last event id"""
+    print("\n--- Running: Stock Stream ---")
+    product_data = {"name": "Stream Product", "sku": "SS-TEST-2024-001", "quantity": 1, "price": 10.0}
+    response = requests.post(f"{base_url}/api/products", json=product_data, timeout=REQUEST_TIMEOUT)
+    assert response.status_code == 201
+    product_id = response.json()['id']
+    url = f"{base_url}/api/stream/stock"
+
+    with requests.get(url, params={"product_id": product_id}, stream=True, timeout=REQUEST_TIMEOUT) as stream:
+        assert stream.status_code == 200
+        assert stream.headers['Content-Type'].startswith('text/event-stream')
+        requests.post(f"{base_url}/api/products/{product_id}/restock", json={"quantity": 5}, timeout=REQUEST_TIMEOUT)
+        requests.put(f"{base_url}/api/products/{product_id}", json={"quantity": 10}, timeout=REQUEST_TIMEOUT)
+        requests.post(f"{base_url}/api/restocks/batch", json=[{"product_id": product_id, "quantity": 2}],
+                      timeout=REQUEST_TIMEOUT)
+        events = read_events(stream.iter_lines(decode_unicode=True), 3)
+    assert [event['event'] for event in events] == ['stock.restocked', 'stock.updated', 'stock.restocked']
+    assert [(json.loads(event['data'])['quantity'], json.loads(event['data'])['change']) for event in events] == \
+        [(6, 5), (10, 4), (12, 2)]
+
+    # Resuming after the first event replays the two next ones, an unknown id resets
+    with requests.get(url, params={"product_id": product_id}, headers={"Last-Event-ID": events[0]['id']},
+                      stream=True, timeout=REQUEST_TIMEOUT) as stream:
+        lines = stream.iter_lines(decode_unicode=True)
+        assert read_events(lines, 2) == events[1:]
+        requests.delete(f"{base_url}/api/products/{product_id}", timeout=REQUEST_TIMEOUT)
+        assert read_events(lines, 1)[0]['event'] == 'product.deleted'
+    with requests.get(url, params={"last_event_id": "unknown"}, stream=True, timeout=REQUEST_TIMEOUT) as stream:
+        assert read_events(stream.iter_lines(decode_unicode=True), 1)[0]['event'] == 'reset'